@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for digflow's hot paths on synthetic data (see synthetic.py).
+
+Runs offline: no Slurm, Fiji or SLEAP needed. Each stage runs in a forked child process so its peak memory
+(max RSS) isn't hidden by an earlier stage; wall and CPU time are the median over --repeat runs.
+Results are written as JSON tagged with the git commit, and two result files can be compared:
+
+    python benchmarks/run.py --scale small
+    python benchmarks/run.py --compare benchmarks/results/<old>.json benchmarks/results/<new>.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+import importlib.util
+import multiprocessing as mp
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)  # benchmark the checkout, not an installed digflow
+
+import synthetic
+from digflow.profiler import cpu_seconds
+
+# sizes per scale; small finishes in well under a minute, large is roughly one experiment's worth of data
+SCALES = {
+    'small':  {'jpegs': 10,  'video_frames': 60,  'track_frames': 500,   'track_instances': 10, 'track_nodes': 5,
+               'prediction_files': 100,  'max_pupae': 80, 'weeks': 10,  'conditions': 200,  'shelves_calls': 50,
+               'shelves_incubators': 2,  'shelves_slots': 24},
+    'medium': {'jpegs': 60,  'video_frames': 260, 'track_frames': 5000,  'track_instances': 10, 'track_nodes': 5,
+               'prediction_files': 1000, 'max_pupae': 80, 'weeks': 52,  'conditions': 1000, 'shelves_calls': 200,
+               'shelves_incubators': 4,  'shelves_slots': 48},
+    'large':  {'jpegs': 300, 'video_frames': 520, 'track_frames': 20000, 'track_instances': 20, 'track_nodes': 8,
+               'prediction_files': 5000, 'max_pupae': 80, 'weeks': 156, 'conditions': 5000, 'shelves_calls': 500,
+               'shelves_incubators': 10, 'shelves_slots': 240},
+}
+
+MB = 1024 if sys.platform == 'darwin' else 1  # ru_maxrss is bytes on macOS, kB on Linux
+
+def load_script(name, path):
+    # the screen scripts are hyphen-named, so they can't be imported by name
+    sys.path.insert(0, os.path.dirname(path))
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+    except OSError:
+        return None, None
+    return commit or None, dirty
+
+# ---------- benchmarks ----------
+# Each benchmark is (setup, reset, run, items): setup writes the synthetic inputs once and returns a context,
+# reset puts the outputs back to a cold state before every repeat, run is the timed call, items(ctx) is the
+# number of units (frames, rows, files) the stage processed. setup returns None to skip the stage.
+
+def make_experiment(ctx):
+    from digflow.experiment import Experiment
+    exp = Experiment(exp_type='sleap', remove_files=False)
+    exp.predictions_path = ctx['dir']
+    return exp
+
+def setup_extract_frames(work, p):
+    video = synthetic.rotating_vial_video(os.path.join(work, 'vial.mp4'), n_frames=p['video_frames'])
+    return {'video': video, 'dir': work, 'frames': p['video_frames']}
+
+def reset_extract_frames(ctx):
+    shutil.rmtree(os.path.join(ctx['dir'], 'vial.mp4_sequence'), ignore_errors=True)
+
+def run_extract_frames(ctx):
+    exp = make_experiment(ctx)
+    exp.extract_frames(ctx['video'], interval=5, save_path=ctx['dir'])
+
+def run_extract_revolution(ctx):
+    # what unwrap_video runs: estimate the rotation, decode one revolution (the synthetic vial turns every 51 frames)
+    exp = make_experiment(ctx)
+    exp.extract_revolution(ctx['video'], save_path=ctx['dir'])
+
+def setup_run_commands(work, p):
+    if shutil.which('ffmpeg') is None:
+        return None
+    folder = synthetic.plugcamera_sequence(os.path.join(work, 'rig1'), n_images=p['jpegs'])
+    return {'folder': folder, 'save': os.path.join(work, 'rig1_cropped'), 'dir': work, 'frames': p['jpegs']}
+
+def reset_run_commands(ctx):
+    for path in (f'{ctx["save"]}.mp4', f'{ctx["folder"]}_raw.mp4'):
+        if os.path.exists(path):
+            os.remove(path)
+
+def run_run_commands(ctx):
+    exp = make_experiment(ctx)
+    exp.run_commands_in_directory(ctx['folder'], ctx['save'])
+
+def setup_tracks_json_to_csv(work, p):
+    synthetic.sleap_tracks_json(os.path.join(work, 'video1.tracks.json'), n_frames=p['track_frames'],
+                                n_instances=p['track_instances'], n_nodes=p['track_nodes'])
+    return {'dir': work, 'skel_parts': [f'node{i}' for i in range(p['track_nodes'])],
+            'rows': p['track_frames'] * p['track_instances']}
+
+def reset_tracks_json_to_csv(ctx):
+    for name in os.listdir(ctx['dir']):
+        if not name.endswith('.tracks.json'):
+            path = os.path.join(ctx['dir'], name)
+            shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+
+def run_tracks_json_to_csv(ctx):
+    exp = make_experiment(ctx)
+    exp.skel_parts = ctx['skel_parts']
+    exp.names = ['video1']
+    exp.tracks_json_to_csv()
+
+def setup_write_predictions(work, p):
+    synthetic.sleap_predictions(work, n_files=p['prediction_files'], max_pupae=p['max_pupae'])
+    return {'dir': work, 'files': p['prediction_files']}
+
+def reset_write_predictions(ctx):
+    for name in ('pupae_counts.csv', '.pupae_counts_index.json'):
+        if os.path.exists(os.path.join(ctx['dir'], name)):
+            os.remove(os.path.join(ctx['dir'], name))
+
+def run_write_predictions(ctx):
+    make_experiment(ctx).write_predictions()
+
+def setup_rebuild_master_df(work, p):
+    weeks = synthetic.screen_folders(work, n_weeks=p['weeks'], n_conditions=p['conditions'])
+    swu = load_script('screen_week_update', os.path.join(REPO_ROOT, 'digflow', 'screen-week-update.py'))
+    return {'dir': work, 'weeks': weeks, 'rebuild': swu.rebuild_master_df}
+
+def reset_rebuild_master_df_cold(ctx):
+    shutil.rmtree(os.path.join(ctx['dir'], '.master-cache'), ignore_errors=True)
+
+def run_rebuild_master_df(ctx):
+    ctx['rebuild'](ctx['dir'], ctx['weeks'])
+
+def setup_rebuild_master_df_warm(work, p):
+    ctx = setup_rebuild_master_df(work, p)
+    run_rebuild_master_df(ctx)  # fill the parquet cache; the timed runs only re-read it
+    return ctx
+
+def setup_build_shelves_df(work, p):
+    return {'args': synthetic.shelves_inputs(n_incubators=p['shelves_incubators'], slots=p['shelves_slots']),
+            'calls': p['shelves_calls'], 'rows': p['shelves_calls'] * p['shelves_incubators'] * p['shelves_slots'] * 6}
+
+def run_build_shelves_df(ctx):
+    from digflow.screen import build_shelves_df
+    dates, layout, locations, incubators = ctx['args']
+    for _ in range(ctx['calls']):
+        build_shelves_df(dates, layout, locations, incubators=incubators)
+
+def no_reset(ctx):
+    pass
+
+BENCHMARKS = {
+    'extract_frames':           (setup_extract_frames, reset_extract_frames, run_extract_frames, lambda ctx: ctx['frames']),
+    'extract_revolution':       (setup_extract_frames, reset_extract_frames, run_extract_revolution, lambda ctx: ctx['frames']),
+    'run_commands_in_directory': (setup_run_commands, reset_run_commands, run_run_commands, lambda ctx: ctx['frames']),
+    'tracks_json_to_csv':       (setup_tracks_json_to_csv, reset_tracks_json_to_csv, run_tracks_json_to_csv, lambda ctx: ctx['rows']),
+    'write_predictions':        (setup_write_predictions, reset_write_predictions, run_write_predictions, lambda ctx: ctx['files']),
+    'rebuild_master_df':        (setup_rebuild_master_df, reset_rebuild_master_df_cold, run_rebuild_master_df, lambda ctx: len(ctx['weeks'])),
+    'rebuild_master_df_warm':   (setup_rebuild_master_df_warm, no_reset, run_rebuild_master_df, lambda ctx: len(ctx['weeks'])),
+    'build_shelves_df':         (setup_build_shelves_df, no_reset, run_build_shelves_df, lambda ctx: ctx['rows']),
+}
+
+# ---------- measuring ----------
+def measure_child(run, ctx, conn):
+    # runs in a forked child; quiet the pipelines' progress prints
+    sys.stdout = open(os.devnull, 'w')
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    wall0, cpu0 = time.perf_counter(), cpu_seconds()
+    try:
+        run(ctx)
+        error = None
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+    wall, cpu = time.perf_counter() - wall0, cpu_seconds() - cpu0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    conn.send({'wall_s': wall, 'cpu_s': cpu, 'peak_rss_mb': peak / 1024 / MB, 'rss_growth_mb': (peak - rss_before) / 1024 / MB, 'error': error})
+    conn.close()
+
+def measure(run, ctx):
+    parent, child = mp.Pipe(duplex=False)
+    proc = mp.get_context('fork').Process(target=measure_child, args=(run, ctx, child))
+    proc.start()
+    result = parent.recv()
+    proc.join()
+    return result
+
+def run_benchmark(name, work, params, repeat):
+    setup, reset, run, items = BENCHMARKS[name]
+    os.makedirs(work, exist_ok=True)
+    ctx = setup(work, params)
+    if ctx is None:
+        return {'status': 'skipped', 'reason': 'ffmpeg not found' if name == 'run_commands_in_directory' else 'setup returned nothing'}
+
+    runs = []
+    for _ in range(repeat):
+        reset(ctx)
+        result = measure(run, ctx)
+        if result['error']:
+            return {'status': 'failed', 'error': result['error']}
+        runs.append(result)
+
+    wall = statistics.median(r['wall_s'] for r in runs)
+    return {'status': 'ok',
+            'items': items(ctx),
+            'wall_s': round(wall, 4),
+            'wall_min_s': round(min(r['wall_s'] for r in runs), 4),
+            'cpu_s': round(statistics.median(r['cpu_s'] for r in runs), 4),
+            'peak_rss_mb': round(max(r['peak_rss_mb'] for r in runs), 1),
+            'rss_growth_mb': round(max(r['rss_growth_mb'] for r in runs), 1),
+            'items_per_s': round(items(ctx) / wall, 1) if wall > 0 else None,
+            'runs': len(runs)}
+
+def run_suite(args):
+    params = dict(SCALES[args.scale])
+    names = args.only or list(BENCHMARKS)
+    commit, dirty = git_commit()
+    if args.work_dir:
+        os.makedirs(args.work_dir, exist_ok=True)
+    work_root = tempfile.mkdtemp(prefix='digflow-bench-', dir=args.work_dir)
+
+    results = {}
+    try:
+        for name in names:
+            print(f'{name} ...', end=' ', flush=True)
+            results[name] = run_benchmark(name, os.path.join(work_root, name), params, args.repeat)
+            r = results[name]
+            if r['status'] == 'ok':
+                print(f"{r['wall_s']:.3f} s wall, {r['cpu_s']:.3f} s CPU, {r['peak_rss_mb']:.0f} MB peak RSS (+{r['rss_growth_mb']:.0f} MB), {r['items_per_s']}/s")
+            else:
+                print(f"{r['status']}: {r.get('reason') or r.get('error')}")
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_root, ignore_errors=True)
+        else:
+            print(f'Synthetic data kept in {work_root}')
+
+    report = {'commit': commit, 'dirty': dirty, 'scale': args.scale, 'params': params, 'repeat': args.repeat,
+              'created': datetime.now().isoformat(timespec='seconds'), 'host': socket.gethostname(),
+              'python': platform.python_version(), 'platform': platform.platform(), 'results': results}
+    output = args.output or os.path.join(BENCH_DIR, 'results', f"{datetime.now():%Y%m%d-%H%M%S}_{(commit or 'nogit')[:8]}_{args.scale}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f'\nResults written to {output}')
+
+# ---------- comparing ----------
+def compare(base_path, new_path, threshold):
+    """Print per-stage time and memory ratios (new / base); returns the stages slower than 1 + threshold."""
+    with open(base_path, 'r') as f:
+        base = json.load(f)
+    with open(new_path, 'r') as f:
+        new = json.load(f)
+    if base['scale'] != new['scale'] or base['params'] != new['params']:
+        print(f"Warning: comparing different sizes ({base['scale']} vs {new['scale']})")
+
+    print(f"base {(base['commit'] or '?')[:8]}{' (dirty)' if base['dirty'] else ''}  ->  new {(new['commit'] or '?')[:8]}{' (dirty)' if new['dirty'] else ''}\n")
+    print(f"{'stage':28s} {'base s':>9s} {'new s':>9s} {'time':>7s} {'base MB':>9s} {'new MB':>9s} {'memory':>7s}")
+    regressions = []
+    for name in sorted(set(base['results']) | set(new['results'])):
+        b, n = base['results'].get(name, {}), new['results'].get(name, {})
+        if b.get('status') != 'ok' or n.get('status') != 'ok':
+            print(f"{name:28s} {b.get('status', '-'):>9s} {n.get('status', '-'):>9s}")
+            continue
+        time_ratio = n['wall_s'] / b['wall_s'] if b['wall_s'] else float('nan')
+        mem_ratio = n['rss_growth_mb'] / b['rss_growth_mb'] if b['rss_growth_mb'] else float('nan')
+        flag = '  <-- slower' if time_ratio > 1 + threshold else ''
+        if flag:
+            regressions.append(name)
+        print(f"{name:28s} {b['wall_s']:9.3f} {n['wall_s']:9.3f} {time_ratio:6.2f}x {b['rss_growth_mb']:9.1f} {n['rss_growth_mb']:9.1f} {mem_ratio:6.2f}x{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark digflow stages on synthetic data')
+    parser.add_argument('-s', '--scale', choices=list(SCALES), default='small', help='size of the synthetic inputs')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='timed runs per stage (median is reported)')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), default=None, help='run only these stages')
+    parser.add_argument('-o', '--output', default=None, help='results JSON (default benchmarks/results/<time>_<commit>_<scale>.json)')
+    parser.add_argument('--work-dir', default=None, help='where to write the synthetic data (default: system temp)')
+    parser.add_argument('--keep', action='store_true', help='keep the synthetic data after the run')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), default=None, help='compare two results files instead of running')
+    parser.add_argument('--threshold', type=float, default=0.10, help='with --compare, flag stages this much slower (0.10 = 10%%)')
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(*args.compare, args.threshold)
+        sys.exit(1 if regressions else 0)
+    run_suite(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import os
+import json
+import random
+from datetime import datetime, timedelta
+import numpy as np
+
+# Synthetic stand-ins for the data digflow processes, written to disk in the layouts the pipelines read.
+# Everything is seeded, so the same sizes give the same files on every machine and commit.
+
+# ---------- plugcamera ----------
+def plugcamera_sequence(path, n_images=10, width=3280, height=2464, seed=0, quality=90):
+    """
+    A folder of plugcamera JPEGs (000000.jpg, 000001.jpg, ...) as the Pis write them: a grey background with
+    a textured vial inside the 1750:1750:1430:360 crop that crop_mp4_convert keeps. Returns the folder.
+    """
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    os.makedirs(path, exist_ok=True)
+    background = np.full((height, width, 3), 90, dtype=np.uint8)
+    x0, y0, size = 1430, 360, 1750
+    vial = rng.integers(40, 200, size=(size, size // 4, 3), dtype=np.uint8)
+    left = x0 + (size - vial.shape[1]) // 2
+    for i in range(n_images):
+        frame = background.copy()
+        shift = (i * 37) % vial.shape[1]
+        frame[y0:y0 + size, left:left + vial.shape[1]] = np.roll(vial, shift, axis=1)
+        frame += rng.integers(0, 8, size=(1, width, 1), dtype=np.uint8)  # column noise so frames don't compress to nothing
+        cv2.imwrite(os.path.join(path, f'{i:06d}.jpg'), frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return path
+
+# ---------- rotating vials ----------
+def vial_texture(period_px, height, pupae=30, seed=0):
+    """Unrolled vial surface: noise plus dark elliptical pupae, period_px wide so it wraps around once per rotation."""
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    texture = rng.integers(120, 200, size=(height, period_px), dtype=np.uint8)
+    texture = cv2.GaussianBlur(texture, (9, 9), 0)
+    for _ in range(pupae):
+        centre = (int(rng.integers(0, period_px)), int(rng.integers(height // 10, height - height // 10)))
+        axes = (int(rng.integers(8, 14)), int(rng.integers(22, 34)))
+        cv2.ellipse(texture, centre, axes, float(rng.uniform(-30, 30)), 0, 360, int(rng.integers(20, 60)), -1)
+    return cv2.cvtColor(texture, cv2.COLOR_GRAY2BGR)
+
+def rotating_vial_video(path, n_frames=260, size=1750, fps=7, px_per_frame=21, frames_per_rotation=51, pupae=30, seed=0):
+    """
+    An mp4 of a vial turning on the rotator, as crop_mp4_convert leaves it: size x size, the vial a vertical band
+    around the centre columns that extract_frames crops. The surface advances px_per_frame per frame and wraps
+    after frames_per_rotation frames. Returns the video path.
+    """
+    import cv2
+
+    period = int(round(px_per_frame * frames_per_rotation))
+    texture = vial_texture(period, size, pupae=pupae, seed=seed)
+    band = min(600, size)
+    left = (size - band) // 2
+    texture = np.tile(texture, (1, -(-band // texture.shape[1]) + 1, 1))  # wide enough to show a full band at any phase
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (size, size))
+    frame = np.full((size, size, 3), 70, dtype=np.uint8)
+    for i in range(n_frames):
+        offset = int(round(i * px_per_frame)) % period
+        frame[:, left:left + band] = texture[:, offset:offset + band]
+        writer.write(frame)
+    writer.release()
+    return path
+
+# ---------- SLEAP JSON ----------
+# Files as sleap-convert --format json writes them: frames name their video, instances their track and points their
+# node by string index ('0', '1', ...), and the skeleton is a jsonpickled graph whose repeated objects are py/id references.
+def sleap_skeleton(n_nodes):
+    """nodes/skeletons entries for a chain skeleton node0 - node1 - ..., jsonpickled as SLEAP writes it."""
+    nodes = [{'name': f'node{i}', 'weight': 1.0} for i in range(n_nodes)]
+    links, ids, body = [], {}, None  # ids: py/id of each node spelled out so far, numbered with the edge type
+    def ref(i):
+        if i in ids:
+            return {'py/id': ids[i]}
+        ids[i] = len(ids) + (body is not None) + 1
+        return {'py/object': 'sleap.skeleton.Node', 'py/state': {'py/tuple': [f'node{i}', 1.0]}}
+    for i in range(n_nodes - 1):
+        source, target = ref(i), ref(i + 1)
+        if body is None:
+            body = len(ids) + 1
+            edge_type = {'py/reduce': [{'py/type': 'sleap.skeleton.EdgeType'}, {'py/tuple': [1]}]}
+        else:
+            edge_type = {'py/id': body}
+        links.append({'edge_insert_idx': i, 'key': 0, 'source': source, 'target': target, 'type': edge_type})
+    skeleton = {'directed': True, 'graph': {'name': 'Skeleton-0', 'num_edges_inserted': len(links)}, 'links': links,
+                'multigraph': True, 'nodes': [{'id': ref(i)} for i in range(n_nodes)]}
+    return {'nodes': nodes, 'skeletons': [skeleton]}
+
+def sleap_instance(rng, n_nodes, centre, track=None, spread=15.0):
+    points = {}
+    for node in range(n_nodes):
+        points[str(node)] = {'x': float(centre[0] + rng.normal(0, spread)), 'y': float(centre[1] + rng.normal(0, spread)),
+                             'visible': True, 'complete': False, 'score': float(rng.uniform(0.3, 1.0))}
+    return {'_points': points, 'skeleton': '0', 'track': None if track is None else str(track),
+            'score': float(rng.uniform(0.5, 1.0)), 'tracking_score': 0.0}
+
+def sleap_tracks_json(path, n_frames=1000, n_instances=10, n_nodes=5, seed=0):
+    """A <name>.tracks.json: n_instances tracked animals random-walking over n_frames frames."""
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform(100, 900, size=(n_instances, 2))
+    labels = []
+    for frame in range(n_frames):
+        positions += rng.normal(0, 3, size=positions.shape)
+        labels.append({'video': '0', 'frame_idx': frame,
+                       '_instances': [sleap_instance(rng, n_nodes, positions[k], track=k) for k in range(n_instances)]})
+    data = {**sleap_skeleton(n_nodes), 'tracks': [{'spawned_on': 0, 'name': f'track_{k}'} for k in range(n_instances)], 'labels': labels}
+    with open(path, 'w') as f:
+        json.dump(data, f)
+    return path
+
+def sleap_predictions(folder, n_files=100, max_pupae=80, n_nodes=2, seed=0):
+    """n_files single-frame pupae prediction JSONs (<vial>.predictions.json) with 0..max_pupae instances each."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+    skeleton = sleap_skeleton(n_nodes)
+    paths = []
+    for i in range(n_files):
+        n = int(rng.integers(0, max_pupae + 1))
+        instances = [sleap_instance(rng, n_nodes, rng.uniform(0, 2000, size=2)) for _ in range(n)]
+        path = os.path.join(folder, f'vial{i:05d}.predictions.json')
+        with open(path, 'w') as f:
+            json.dump({**skeleton, 'labels': [{'video': '0', 'frame_idx': 0, '_instances': instances}]}, f)
+        paths.append(path)
+    return paths
+
+# ---------- screens ----------
+def screen_folders(root, n_weeks=20, n_conditions=200, slots=24, controls_per_collection=4, incubators=(1, 2),
+                   failure_rate=0.1, first_monday='2024-01-01', seed=0):
+    """
+    A screen root with one YYYY-MM-DD folder per week, each holding a shelves.csv as screen-week-update.py
+    reads it back: conditions rotate through the incubators, and a failure_rate fraction are amended to -1.
+    Returns the sorted week folder names.
+    """
+    try:
+        from digflow.screen import build_shelves_df
+    except ImportError:  # digflow not importable as a package: fall back to the source checkout
+        from screen import build_shelves_df
+
+    rng = np.random.default_rng(seed)
+    random.seed(seed)
+    conditions = [f'cond{i:05d}' for i in range(n_conditions)]
+    locations = {c: f'T{i // 100}-{i % 100}' for i, c in enumerate(conditions)}
+    per_inc = slots - controls_per_collection
+    monday = datetime.strptime(first_monday, '%Y-%m-%d')
+    weeks, cursor = [], 0
+    for w in range(n_weeks):
+        week = (monday + timedelta(weeks=w)).strftime('%Y-%m-%d')
+        dates = [(monday + timedelta(weeks=w, days=d)).strftime('%d/%m/%Y') for d in range(6)]
+        layout = {}
+        for inc in incubators:
+            picks = [conditions[(cursor + k) % n_conditions] for k in range(per_inc)]
+            cursor += per_inc
+            layout[inc] = picks + ['control'] * controls_per_collection
+        df = build_shelves_df(dates, layout, locations, incubators=incubators)
+        df['amendments'] = np.where(rng.random(len(df)) < failure_rate, '-1', '')
+        os.makedirs(os.path.join(root, week), exist_ok=True)
+        df.to_csv(os.path.join(root, week, 'shelves.csv'), index=False)
+        weeks.append(week)
+    return weeks
+
+def shelves_inputs(n_incubators=2, slots=24, controls_per_collection=4, n_dates=6, seed=0):
+    """Arguments for screen.build_shelves_df: (dates, inc_layout, condition_locations, incubators)."""
+    rng = random.Random(seed)
+    incubators = list(range(1, n_incubators + 1))
+    conditions = [f'cond{i:05d}' for i in range(n_incubators * (slots - controls_per_collection))]
+    rng.shuffle(conditions)
+    per_inc = slots - controls_per_collection
+    layout = {inc: conditions[i * per_inc:(i + 1) * per_inc] + ['control'] * controls_per_collection for i, inc in enumerate(incubators)}
+    dates = [f'{d + 1:02d}/01/2024' for d in range(n_dates)]
+    locations = {c: f'T{i // 100}-{i % 100}' for i, c in enumerate(conditions)}
+    return dates, layout, locations, incubators
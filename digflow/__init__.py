@@ -1,2 +1,41 @@
-from .experiment import *
-from .design import *
\ No newline at end of file
+# Names are loaded from their submodule on first use (PEP 562), so `import digflow` stays cheap and
+# e.g. Design never pulls in cv2, imagej or scyjava. `from digflow import *` still imports everything.
+import importlib
+
+_EXPORTS = {
+    'experiment': ['Experiment'],
+    'design': ['Design'],
+    'kinematics': ['FEATURE_COLUMNS', 'axis_parts', 'part_coords', 'chunk_kinematics', 'require_parquet', 'write_features', 'load_features'],
+    'trackstore': ['record_dtype', 'TrackStoreWriter', 'write_track_store', 'TrackStore'],
+    'results_index': ['DATE_RE', 'PC_RE', 'SKIP_DIRS', 'SCHEMA', 'VIEWS', 'SHELVES_COLUMNS', 'results_kind', 'plugcamera_from_name',
+                      'week_from_path', 'ResultsIndex'],
+    'render': ['NODE_COLOURS', 'EDGE_COLOUR', 'node_names', 'skeleton_edges', 'prediction_points', 'render_overlay',
+               'render_prediction_preview', 'contact_sheet'],
+    'ledger': ['COUNT_FIELDS', 'ConditionLedger', 'load_ledger', 'rotation_keys', 'select_round_robin', 'requeue_round_robin'],
+    'facility': ['DEFAULT_FACILITY', 'INCUBATOR_FIELDS', 'SHELF_FIELDS', 'validate_facility', 'load_facility', 'incubator_names',
+                 'incubator_capacities', 'shelves_per_rack', 'check_dates_fit', 'plugcamera_shelf_template'],
+    'profiler': ['SACCT_FIELDS', 'cpu_seconds', 'folder_bytes', 'sacct_usage', 'format_duration', 'StageProfiler'],
+    'journal': ['StageJournal'],
+    'capture': ['PLUGCAMERA_CROP', 'FRAMERATE', 'MARKER', 'crop_filter', 'pending_sequences', 'crop_jpegs', 'encode_mp4', 'process_sequence'],
+    'rotation': ['NOMINAL_PERIOD', 'NOMINAL_INTERVAL', 'NOMINAL_STEP', 'strip_signal', 'strip_shift', 'match_score', 'Rotation', 'read_revolution'],
+    'calibration': ['video_fingerprint', 'read_tile_positions', 'fit_offsets', 'StitchCalibration'],
+    'precount': ['PRECOUNT_COLUMNS', 'dark_mask', 'count_pupae', 'count_image', 'in_sample', 'needs_sleap', 'read_precounts', 'write_precounts', 'held_back'],
+    'arrays': ['DEFAULT_MAX_ARRAY_SIZE', 'TERMINAL_STATES', 'RETRY_STATES', 'array_task_states', 'max_array_size', 'write_manifest', 'ArrayChunk', 'plan_array', 'manifest_loop'],
+    'streaming': ['DONE', 'ArrivalWatcher', 'StreamPipeline'],
+    'sizing': ['DEFAULT_RESOURCES', 'slurm_seconds', 'slurm_mb', 'task_usage', 'ResourceModel', 'format_time', 'sbatch_options'],
+}
+_MODULE_OF = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = list(_MODULE_OF)
+
+def __getattr__(name):
+    if name in _MODULE_OF:
+        value = getattr(importlib.import_module(f'.{_MODULE_OF[name]}', __name__), name)
+        globals()[name] = value  # later lookups skip __getattr__
+        return value
+    if name in _EXPORTS:
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(set(globals()) | set(_MODULE_OF) | set(_EXPORTS))
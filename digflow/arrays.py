@@ -0,0 +1,97 @@
+import os
+import math
+import subprocess
+
+# Array jobs read their items from a manifest (one tab-separated line per item) by task ID instead of from
+# space-joined strings baked into the script, so paths may contain spaces and the script stays the same size.
+# Item counts beyond the cluster's MaxArraySize are split over several array submissions (each told its
+# starting line through MANIFEST_OFFSET), and once that gets too many, several items go to each task.
+
+DEFAULT_MAX_ARRAY_SIZE = 1001  # Slurm's default: task IDs 0-1000
+
+# job states that won't change any more, and those of them worth another try
+TERMINAL_STATES = {'COMPLETED', 'FAILED', 'CANCELLED', 'TIMEOUT', 'OUT_OF_MEMORY', 'NODE_FAIL', 'PREEMPTED', 'BOOT_FAIL', 'DEADLINE'}
+RETRY_STATES = {'FAILED', 'TIMEOUT', 'OUT_OF_MEMORY', 'NODE_FAIL', 'PREEMPTED', 'BOOT_FAIL'}
+
+def max_array_size(default=DEFAULT_MAX_ARRAY_SIZE):
+    """MaxArraySize from `scontrol show config` (task IDs must stay below it), or default if Slurm can't be asked."""
+    try:
+        result = subprocess.run(['scontrol', 'show', 'config'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return default
+    for line in result.stdout.splitlines():
+        key, _, value = line.partition('=')
+        if key.strip() == 'MaxArraySize' and value.strip().isdigit():
+            return int(value.strip())
+    return default
+
+def array_task_states(job_id):
+    """{task ID: state} of an array job's tasks from sacct (allocations only); {} if sacct is unavailable."""
+    cmd = ['sacct', '-j', str(job_id), '-X', '--format=JobID,State', '--parsable2', '--noheader']
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=60)
+    except (OSError, subprocess.TimeoutExpired):
+        return {}
+    states = {}
+    for line in result.stdout.strip().split('\n'):
+        job, _, state = line.partition('|')
+        task = job.partition('_')[2]
+        if task.isdigit():  # pending ranges ('123_[4-10]') have no state per task yet
+            states[int(task)] = state.split()[0] if state else 'UNKNOWN'  # 'CANCELLED by 123' -> 'CANCELLED'
+    return states
+
+def write_manifest(path, rows):
+    """Write one tab-separated line per item; fields may contain spaces but not tabs or newlines."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        for row in rows:
+            fields = [str(field) for field in row]
+            if any('\t' in field or '\n' in field for field in fields):
+                raise ValueError(f'Manifest fields cannot contain tabs or newlines: {fields}')
+            f.write('\t'.join(fields) + '\n')
+    return path
+
+class ArrayChunk:
+    """One array submission: tasks 1..n_tasks covering manifest lines offset+1 .. offset+n_items."""
+    def __init__(self, offset, n_items, items_per_task):
+        self.offset = offset
+        self.n_items = n_items
+        self.items_per_task = items_per_task
+        self.n_tasks = math.ceil(n_items / items_per_task)
+
+    def items(self, task):
+        """0-based manifest rows handled by a 1-based task ID."""
+        first = self.offset + (task - 1) * self.items_per_task
+        return list(range(first, min(first + self.items_per_task, self.offset + self.n_items)))
+
+    def sbatch_options(self, tasks=None):
+        """--array for all tasks (or just the given task IDs) and the manifest offset."""
+        indices = f'1-{self.n_tasks}' if tasks is None else ','.join(str(t) for t in sorted(tasks))
+        return [f'--array={indices}', f'--export=ALL,MANIFEST_OFFSET={self.offset}']
+
+def plan_array(n_items, max_size=DEFAULT_MAX_ARRAY_SIZE, items_per_task=1, max_arrays=4):
+    """
+    Split n_items into array submissions of at most max_size - 1 tasks. If that takes more than max_arrays
+    submissions, items_per_task is raised until it doesn't.
+    """
+    max_tasks = max(1, max_size - 1)
+    items_per_task = max(items_per_task, math.ceil(n_items / (max_tasks * max_arrays)))
+    per_array = max_tasks * items_per_task
+    return [ArrayChunk(offset, min(per_array, n_items - offset), items_per_task) for offset in range(0, n_items, per_array)]
+
+def manifest_loop(manifest, fields, items_per_task, body, indent=''):
+    """
+    Bash that runs body once for each manifest line of this task, with the line's fields in the named variables.
+    body sets item_status; the task exits non-zero if any item failed. Lines are read on fd 3 so rsync/ssh can't swallow them.
+    """
+    lines = [
+        f'first=$(( ${{MANIFEST_OFFSET:-0}} + (SLURM_ARRAY_TASK_ID - 1) * {items_per_task} + 1 ))',
+        f'last=$(( first + {items_per_task} - 1 ))',
+        'task_status=0',
+        f'while IFS=$\'\\t\' read -r -u 3 {" ".join(fields)}; do',
+        *[f'    {line}' for line in body.strip('\n').split('\n')],
+        '    if [ "$item_status" -ne 0 ]; then task_status=$item_status; fi',
+        f'done 3< <(sed -n "${{first}},${{last}}p" "{manifest}")',
+        'exit $task_status',
+    ]
+    return '\n'.join(indent + line for line in lines)
@@ -0,0 +1,122 @@
+import os
+import re
+import json
+import threading
+import numpy as np
+from datetime import datetime
+
+from .rotation import Rotation
+
+# Every vial on a rotator is filmed with the same camera, lens and turntable, so Fiji's registration of the strips
+# (compute_overlap) lands on the same tile offsets vial after vial. A calibration keeps the registered offsets of one
+# stitch per rotator, with the fingerprint of the videos they were measured on, and later stitches place their strips
+# from it without registering. Each vial's own rotation estimate is the drift check: if its speed moves away from the
+# one measured when calibrating, the stitch registers again and the calibration is replaced.
+
+# ---------- measuring ----------
+def video_fingerprint(video_path, crop):
+    """What the tile offsets depend on: frame size, frame rate and the strip crop; None if the video can't be opened."""
+    import cv2
+
+    vidcap = cv2.VideoCapture(video_path)
+    if not vidcap.isOpened():
+        vidcap.release()
+        return None
+    fingerprint = {'width': int(vidcap.get(cv2.CAP_PROP_FRAME_WIDTH)), 'height': int(vidcap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                   'fps': round(float(vidcap.get(cv2.CAP_PROP_FPS)), 2), 'crop': [int(c) for c in crop]}
+    vidcap.release()
+    return fingerprint
+
+def read_tile_positions(path):
+    """(x, y) per tile from a TileConfiguration file, in order of tile file name; [] if the file is missing."""
+    if not os.path.exists(path):
+        return []
+    tiles = []
+    with open(path, 'r') as f:
+        for line in f:
+            match = re.match(r'\s*([^#;][^;]*);[^;]*;\s*\(\s*([-\d.eE+]+)\s*,\s*([-\d.eE+]+)\s*\)', line)
+            if match:
+                tiles.append((match.group(1).strip(), float(match.group(2)), float(match.group(3))))
+    return [(x, y) for _, x, y in sorted(tiles)]
+
+def fit_offsets(positions, frame_indices):
+    """
+    Straight-line fit of registered tile positions against frame number: px moved per frame along x and y, and the
+    largest distance of a tile from the line (how well a fixed step describes the registration).
+    """
+    frames = np.asarray(frame_indices[:len(positions)], dtype=float)
+    xy = np.asarray(positions[:len(frames)], dtype=float)
+    design = np.column_stack([frames, np.ones_like(frames)])
+    (x_slope, x_icpt), _, _, _ = np.linalg.lstsq(design, xy[:, 0], rcond=None)
+    (y_slope, y_icpt), _, _, _ = np.linalg.lstsq(design, xy[:, 1], rcond=None)
+    residual = np.hypot(xy[:, 0] - (x_slope * frames + x_icpt), xy[:, 1] - (y_slope * frames + y_icpt))
+    return float(x_slope), float(y_slope), float(residual.max())
+
+class StitchCalibration:
+    """
+    Registered tile offsets per rotator, in one JSON file ({rig: calibration}). A calibration is used for a video with
+    the same fingerprint whose estimated speed is within `tolerance` (relative) of the speed estimated for the calibration video; a registration
+    is only kept if no tile is further than max_residual strip steps from the fitted line, so a vial with too
+    little texture to register doesn't become the calibration.
+    """
+    def __init__(self, path, tolerance=0.03, max_residual=0.5, min_tiles=10):
+        self.path = path
+        self.tolerance = tolerance
+        self.max_residual = max_residual
+        self.min_tiles = min_tiles
+        self.lock = threading.RLock()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def save(self, data):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def lookup(self, rig, fingerprint, rotation):
+        """The rig's calibration if it applies to this video, else None (with the reason printed)."""
+        calibration = self.load().get(str(rig))
+        if calibration is None or fingerprint is None:
+            return None
+        if calibration['fingerprint'] != fingerprint:
+            print(f"\tStitch calibration of {rig} was made for {calibration['fingerprint']}, not {fingerprint}: recalibrating")
+            return None
+        if rotation is not None and rotation.estimated and calibration.get('estimated_px_per_frame'):
+            # compared with the estimate of the calibration video, so any bias of the estimate against Fiji cancels out
+            reference = calibration['estimated_px_per_frame']
+            drift = abs(rotation.px_per_frame - reference) / reference
+            if drift > self.tolerance:
+                print(f"\tRotation speed {rotation.px_per_frame:.2f} px/frame is {drift:.0%} off the {reference:.2f} of the calibration: recalibrating")
+                return None
+        return calibration
+
+    def apply(self, calibration, rotation):
+        """The rotation with the calibrated speed, and (x, y) for each of its tiles."""
+        calibrated = Rotation(rotation.period, calibration['px_per_frame'], rotation.interval, rotation.score, rotation.estimated)
+        return calibrated, [(round(i * calibration['px_per_frame'], 1), round(i * calibration['y_per_frame'], 1))
+                            for i in calibrated.frame_indices()]
+
+    def update(self, rig, fingerprint, positions, rotation, video=''):
+        """Store a registration as the rig's calibration; returns it, or None if it wasn't good enough to keep."""
+        if fingerprint is None or len(positions) < self.min_tiles:
+            return None
+        px_per_frame, y_per_frame, residual = fit_offsets(positions, rotation.frame_indices())
+        step = abs(px_per_frame) * rotation.interval
+        if px_per_frame <= 0 or residual > self.max_residual * step:
+            print(f'\tRegistration of {video} is too irregular to calibrate from (off by up to {residual:.0f} px)')
+            return None
+        calibration = {'fingerprint': fingerprint, 'px_per_frame': round(px_per_frame, 4), 'y_per_frame': round(y_per_frame, 4),
+                       'residual_px': round(residual, 1), 'tiles': len(positions), 'video': video,
+                       'estimated_px_per_frame': round(rotation.px_per_frame, 4) if rotation.estimated else None,
+                       'calibrated': datetime.now().isoformat(timespec='seconds')}
+        with self.lock:
+            data = self.load()
+            data[str(rig)] = calibration
+            self.save(data)
+        return calibration
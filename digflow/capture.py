@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Capture-side preprocessing for the plugcamera Pis: crops each finished JPEG sequence (and optionally encodes it
+to mp4) in the Pi's data folder, so transfer_data pulls a fraction of the bytes. Standard library only, plus PIL,
+OpenCV or ffmpeg for the images, so the file can be copied onto a Pi and run on its own:
+
+    python3 capture.py /home/plugcamera/data                 # keep watching, crop sequences as they finish
+    python3 capture.py /home/plugcamera/data --mode mp4      # encode each sequence to a cropped mp4 instead
+    python3 capture.py /tmp/fake_pi/data --once --settle 0   # process a local stand-in folder and exit
+
+A sequence is a folder of JPEGs directly in the data folder; it counts as finished once nothing in it has
+changed for --settle seconds. Output is built in a work folder next to the data folder (so a running rsync
+never sees half-written files) and moved into place in one rename. In crop mode the folder keeps its name and
+gets a marker file (MARKER) recording the crop; in mp4 mode it is replaced by <folder>.mp4. Experiment's
+crop_mp4_convert recognises both and skips its own crop.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+from datetime import datetime
+
+PLUGCAMERA_CROP = (1750, 1750, 1430, 360)  # width, height, x, y of the vial in a full plugcamera frame (ffmpeg crop=w:h:x:y)
+FRAMERATE = 7
+MARKER = '.digflow-preprocessed.json'
+
+def crop_filter(crop=PLUGCAMERA_CROP):
+    return 'crop={}:{}:{}:{}'.format(*crop)
+
+def folder_bytes(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path) if os.path.isfile(os.path.join(path, f)))
+
+# ---------- finding finished sequences ----------
+def jpegs(path):
+    return sorted(f for f in os.listdir(path) if f.endswith('.jpg') and not f.startswith('.'))
+
+def pending_sequences(data_dir):
+    """Folders of JPEGs in data_dir that haven't been preprocessed yet."""
+    found = []
+    for entry in sorted(os.listdir(data_dir)):
+        path = os.path.join(data_dir, entry)
+        if entry.startswith('.') or not os.path.isdir(path) or os.path.exists(os.path.join(path, MARKER)):
+            continue
+        if jpegs(path):
+            found.append(path)
+    return found
+
+def is_settled(path, settle):
+    """True if neither the folder nor any file in it changed in the last settle seconds."""
+    newest = max([os.path.getmtime(path)] + [os.path.getmtime(os.path.join(path, f)) for f in os.listdir(path)])
+    return time.time() - newest >= settle
+
+# ---------- processing ----------
+def crop_jpegs(src, dst, crop=PLUGCAMERA_CROP, quality=90):
+    """Crop every JPEG of src into dst under the same name, with PIL or OpenCV if either is installed and ffmpeg otherwise."""
+    width, height, x, y = crop
+    os.makedirs(dst, exist_ok=True)
+    Image, cv2 = None, None
+    try:
+        from PIL import Image
+    except ImportError:
+        try:
+            import cv2
+        except ImportError:
+            pass
+    for f in jpegs(src):
+        if Image is not None:
+            with Image.open(os.path.join(src, f)) as image:
+                image.crop((x, y, x + width, y + height)).save(os.path.join(dst, f), quality=quality)
+        elif cv2 is not None:
+            image = cv2.imread(os.path.join(src, f))
+            cv2.imwrite(os.path.join(dst, f), image[y:y + height, x:x + width], [cv2.IMWRITE_JPEG_QUALITY, quality])
+        else:
+            subprocess.run(['ffmpeg', '-loglevel', 'error', '-y', '-i', os.path.join(src, f), '-vf', crop_filter(crop),
+                            '-q:v', '2', os.path.join(dst, f)], check=True)
+
+def encode_mp4(src, out_path, crop=PLUGCAMERA_CROP, framerate=FRAMERATE):
+    """The same mp4 run_commands_in_directory makes on NEMO (jpgs -> h264, cropped), in one ffmpeg pass."""
+    subprocess.run(['ffmpeg', '-loglevel', 'error', '-y', '-framerate', str(framerate), '-pattern_type', 'glob',
+                    '-i', os.path.join(src, '*.jpg'), '-vf', crop_filter(crop), '-c:v', 'libx264', '-pix_fmt', 'yuv420p',
+                    out_path], check=True)
+
+def process_sequence(path, work_dir, mode='crop', crop=PLUGCAMERA_CROP, quality=90, framerate=FRAMERATE, keep_originals=False):
+    """Preprocess one finished sequence folder; returns a summary dict."""
+    name = os.path.basename(path.rstrip('/'))
+    data_dir = os.path.dirname(path.rstrip('/'))
+    os.makedirs(work_dir, exist_ok=True)
+    frames, source_bytes = len(jpegs(path)), folder_bytes(path)
+    summary = {'sequence': name, 'mode': mode, 'crop': list(crop), 'frames': frames, 'source_bytes': source_bytes,
+               'processed': datetime.now().isoformat(timespec='seconds')}
+
+    if mode == 'crop':
+        staged = os.path.join(work_dir, name)
+        shutil.rmtree(staged, ignore_errors=True)
+        crop_jpegs(path, staged, crop, quality)
+        summary['bytes'] = folder_bytes(staged)
+        with open(os.path.join(staged, MARKER), 'w') as f:
+            json.dump(summary, f, indent=4)
+        original = os.path.join(work_dir, f'{name}.original')
+        shutil.rmtree(original, ignore_errors=True)
+        os.rename(path, original)   # same filesystem: both renames are atomic
+        os.rename(staged, path)
+    elif mode == 'mp4':
+        staged = os.path.join(work_dir, f'{name}.mp4')
+        encode_mp4(path, staged, crop, framerate)
+        summary['bytes'] = os.path.getsize(staged)
+        original = os.path.join(work_dir, f'{name}.original')
+        shutil.rmtree(original, ignore_errors=True)
+        os.rename(path, original)
+        os.rename(staged, os.path.join(data_dir, f'{name}.mp4'))
+    else:
+        raise ValueError(f"Unknown mode '{mode}', expected 'crop' or 'mp4'")
+
+    if keep_originals:
+        kept = os.path.join(work_dir, 'originals', name)
+        shutil.rmtree(kept, ignore_errors=True)
+        os.makedirs(os.path.dirname(kept), exist_ok=True)
+        os.rename(original, kept)
+    else:
+        shutil.rmtree(original)
+    return summary
+
+def run(data_dir, mode='crop', crop=PLUGCAMERA_CROP, settle=60, poll=30, once=False, work_dir=None, quality=90,
+        framerate=FRAMERATE, keep_originals=False, log_path=None):
+    """Preprocess finished sequences in data_dir, forever or (once=True) until none are left."""
+    data_dir = os.path.abspath(data_dir)
+    work_dir = work_dir or os.path.join(os.path.dirname(data_dir), '.digflow-work')  # outside data_dir, so never transferred
+    log_path = log_path or os.path.join(os.path.dirname(data_dir), 'digflow-capture.log')
+    while True:
+        for path in pending_sequences(data_dir):
+            if not is_settled(path, settle):
+                continue
+            summary = process_sequence(path, work_dir, mode, crop, quality, framerate, keep_originals)
+            ratio = summary['source_bytes'] / summary['bytes'] if summary['bytes'] else float('nan')
+            print(f"{summary['sequence']}: {summary['frames']} frames, {summary['source_bytes'] / 1e6:.1f} MB -> {summary['bytes'] / 1e6:.1f} MB ({ratio:.1f}x smaller)", flush=True)
+            with open(log_path, 'a') as f:
+                f.write(json.dumps(summary) + '\n')
+        if once and not [p for p in pending_sequences(data_dir) if is_settled(p, settle)]:
+            return
+        time.sleep(poll)
+
+def build_parser(parser=None):
+    parser = parser or argparse.ArgumentParser(description='crop (and optionally encode) plugcamera JPEG sequences on the Pi before transfer')
+    parser.add_argument('data_dir', help="the Pi's data folder (or a local stand-in) holding one folder of JPEGs per sequence")
+    parser.add_argument('--mode', choices=['crop', 'mp4'], default='crop', help='crop the JPEGs in place, or replace each sequence by a cropped mp4')
+    parser.add_argument('--crop', type=int, nargs=4, default=list(PLUGCAMERA_CROP), metavar=('W', 'H', 'X', 'Y'), help='crop box, as ffmpeg crop=W:H:X:Y')
+    parser.add_argument('--settle', type=float, default=60, help='seconds a sequence must be unchanged to count as finished')
+    parser.add_argument('--poll', type=float, default=30, help='seconds between scans of the data folder')
+    parser.add_argument('--once', action='store_true', help='process what is finished now and exit')
+    parser.add_argument('--work-dir', default=None, help='where output is staged (default: .digflow-work next to data_dir)')
+    parser.add_argument('--quality', type=int, default=90, help='JPEG quality of cropped images')
+    parser.add_argument('--framerate', type=int, default=FRAMERATE, help='mp4 frame rate')
+    parser.add_argument('--keep-originals', action='store_true', help='keep the full frames under <work-dir>/originals')
+    return parser
+
+def main(args=None):
+    if args is None or isinstance(args, list):
+        args = build_parser().parse_args(args)
+    run(args.data_dir, args.mode, tuple(args.crop), args.settle, args.poll, args.once, args.work_dir, args.quality,
+        args.framerate, args.keep_originals)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
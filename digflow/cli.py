@@ -0,0 +1,144 @@
+import os
+import sys
+import runpy
+import argparse
+
+# `digflow <command> ...`: one entry point for the pipelines and planning scripts.
+# Only the modules a command needs are imported, after its arguments have been parsed.
+
+SCREEN_SCRIPTS = {
+    'screen-initiate': 'screen-initiate.py',
+    'screen-week-update': 'screen-week-update.py',
+    'screen-simulate': 'screen-simulate.py',
+}
+
+# ---------- commands ----------
+def run_plugcamera(args):
+    from .experiment import Experiment
+    exp = Experiment(experiment_name=args.experiment_name, exp_type='plugcamera', rig_list=args.rig_list, ip_path=args.ip_path, remove_files=False)
+    exp.set_resume(not args.restart)
+    if args.triage is not None:
+        exp.set_triage(args.triage, args.triage_sample)
+    pipelines = {1: exp.pc_pipeline1, 2: exp.pc_pipeline2, 3: exp.pc_pipeline2_no_transfer, 4: exp.pc_pipeline_test, 5: exp.pc_pipeline2_streaming}
+    pipelines[args.pipeline]()
+
+def run_sleap(args):
+    from .experiment import Experiment
+    sleap_paths = [args.predictions_path, args.video_path, args.centroid_path, args.centered_instance_path]
+    exp = Experiment(exp_type='sleap', sleap_paths=sleap_paths, skel_parts=args.skel_parts)
+    exp.sleap_pipeline1()
+
+def run_design(args):
+    from .design import Design
+    if args.first_run == 'True':
+        design = Design(wc_date=args.wc_date, save_path=args.save_path, sample_size=args.sample_size, conditions=args.conditions,
+                        experimenters=args.experimenters, controls_per_collection=args.control_sample_size, facility=args.facility)
+    else:
+        design = Design(wc_date=args.wc_date, save_path=args.save_path, file=args.file_path, facility=args.facility)
+    if args.vials is not None:
+        design.plan_from_vials(args.vials)
+    else:
+        design.vials_gui()
+        design.output()
+
+def run_index(args):
+    from .results_index import ResultsIndex
+    index = ResultsIndex(args.db)
+    n = index.crawl(args.root)
+    index.close()
+    print(f'Re-read {n} results file(s) into {args.db}')
+
+def run_capture(args):
+    from .capture import main
+    main(args)
+
+def run_resources(args):
+    # recommendations go to stdout as sbatch options, e.g. `sbatch $(digflow resources -t plugcamera -s pipeline) pipeline.sh`
+    from .sizing import ResourceModel, sbatch_options
+    model = ResourceModel(args.history, args.exp_type)
+    if args.record:
+        from .profiler import sacct_usage
+        records = model.record(args.stage, sacct_usage(args.record), size=args.size, experiment=args.experiment)
+        print(f'Recorded {len(records)} finished task(s) of job {args.record} as {args.exp_type}/{args.stage}', file=sys.stderr)
+        return
+    res = model.recommend(args.stage, args.size)
+    print(f'{args.exp_type}/{args.stage}: {res["source"]}', file=sys.stderr)
+    print(' '.join(sbatch_options(res)))
+
+def run_screen_script(command, argv):
+    # the screen scripts keep their own argument parsing; run them as if called directly
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), SCREEN_SCRIPTS[command])
+    sys.argv = [script] + list(argv)
+    runpy.run_path(script, run_name='__main__')
+
+# ---------- argument parsing ----------
+def build_parser():
+    parser = argparse.ArgumentParser(prog='digflow', description='pipelines to analyse cooperative digging videos of fruit fly larvae on a HPC')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    pc = commands.add_parser('plugcamera', help='plugcamera pipeline: transferring data from RPis to NEMO, initial processing')
+    pc.add_argument('-e', '--experiment-name', dest='experiment_name', action='store', type=str, required=True, help='name of experiment')
+    pc.add_argument('-l', '--rig-list', nargs='+', type=int, default=None, help='list of rig names if only a specific subset will be used')
+    pc.add_argument('-ip', '--ip-path', dest='ip_path', action='store', type=str, default=None, help='path to ip_address list')
+    pc.add_argument('-p', '--pipeline', dest='pipeline', action='store', type=int, required=True, choices=[1, 2, 3, 4, 5],
+                    help='1: plugcamera transfer and mp4s, 2: pupae, 3: pupae without transfer, 4: test, 5: pupae, streaming (unwraps and predicts while transferring)')
+    pc.add_argument('--restart', dest='restart', action='store_true', help='ignore the pipeline journal and redo every stage (pipelines 2, 3 and 5)')
+    pc.add_argument('--triage', dest='triage', nargs='?', type=float, const=0.9, default=None, metavar='MIN_CONFIDENCE',
+                    help='send only vials whose blob precount is less confident than this (default 0.9) to SLEAP; the rest keep the precount (pipelines 2, 3 and 5)')
+    pc.add_argument('--triage-sample', dest='triage_sample', type=float, default=0.1, help='fraction of confident vials still sent to SLEAP as a check (with --triage)')
+    pc.set_defaults(func=run_plugcamera)
+
+    sleap = commands.add_parser('sleap', help='SLEAP tracking of behaviour videos')
+    sleap.add_argument('-p', '--predictions-path', dest='predictions_path', action='store', type=str, required=True, help='path to save folder for predictions')
+    sleap.add_argument('-v', '--video-path', dest='video_path', action='store', type=str, default=None, help='path to folder with video(s)')
+    sleap.add_argument('-m1', '--centroid-path', dest='centroid_path', action='store', type=str, default=None, help='path to centroid model')
+    sleap.add_argument('-m2', '--centered-instance-path', dest='centered_instance_path', action='store', type=str, default=None, help='path to centered instance model')
+    sleap.add_argument('-s', '--skel_parts', dest='skel_parts', action='store', type=str, nargs='+', default=None, help='skeleton parts separated by spaces')
+    sleap.set_defaults(func=run_sleap)
+
+    design = commands.add_parser('design', help='plan plugcamera shelves for a week of collections')
+    design.add_argument('-f', '--first-run', dest='first_run', action='store', type=str, default='False', help='True/False whether it is the first time running the script')
+    design.add_argument('-p', '--file_path', dest='file_path', action='store', type=str, help='path to the save file from last session')
+    design.add_argument('-d', '--wc-date', dest='wc_date', action='store', type=str, required=True, help='Mondays date for week of collections')
+    design.add_argument('-s', '--save-path', dest='save_path', action='store', type=str, default=None, help='path to output folder')
+    design.add_argument('-n', '--sample-size', dest='sample_size', action='store', type=int, help='number of samples required per condition, must be divisible by 6')
+    design.add_argument('-c', '--conditions', dest='conditions', action='store', type=str, default=None, help='conditions to be tested, recommend to be in the tray-position format from the fly stock database')
+    design.add_argument('-e', '--experimenters', dest='experimenters', action='store', type=str, nargs='+', default=['Lucy', 'Lena', 'Alice', 'Anna', 'Michael'], help='names of experimenters')
+    design.add_argument('-cn', '--control_sample_size', dest='control_sample_size', action='store', type=int, help='number of controls per collection')
+    design.add_argument('-v', '--vials', dest='vials', action='store', type=str, default=None, help='CSV (person,day,vials) or JSON file of vial counts; skips the vials GUI')
+    design.add_argument('--facility', dest='facility', action='store', type=str, default=None, help='path to a facility JSON describing the plugcamera shelf')
+    design.set_defaults(func=run_design)
+
+    index = commands.add_parser('index', help='update the cross-experiment results index')
+    index.add_argument('root', nargs='?', default='/camp/lab/windingm/data/instruments/behavioural_rigs', help='folder laid out as <exp_type>/<experiment>/...')
+    index.add_argument('--db', default='/camp/lab/windingm/data/instruments/behavioural_rigs/results_index.sqlite', help='SQLite index to update')
+    index.set_defaults(func=run_index)
+
+    capture = commands.add_parser('capture', help='crop (and optionally encode) plugcamera sequences on the Pi before transfer')
+    from .capture import build_parser as capture_parser
+    capture_parser(capture)
+    capture.set_defaults(func=run_capture)
+
+    resources = commands.add_parser('resources', help='Slurm requests sized from the sacct history of a stage, or record a finished job into it')
+    resources.add_argument('-t', '--exp-type', dest='exp_type', action='store', type=str, required=True, help='experiment type, e.g. plugcamera or sleap')
+    resources.add_argument('-s', '--stage', dest='stage', action='store', type=str, required=True, help='sbatch script or stage, e.g. sleap_video or pipeline')
+    resources.add_argument('-z', '--size', dest='size', action='store', type=float, default=None, help='input size of the new job (bytes, frames, ...) if the stage is sized by it')
+    resources.add_argument('--record', dest='record', action='store', type=str, default=None, help='job ID of a finished job to add to the history instead')
+    resources.add_argument('-e', '--experiment', dest='experiment', action='store', type=str, default='', help='experiment name stored with --record')
+    resources.add_argument('--history', default='/camp/lab/windingm/data/instruments/behavioural_rigs/slurm_history', help='folder of per-experiment-type job histories')
+    resources.set_defaults(func=run_resources)
+
+    for command in SCREEN_SCRIPTS:
+        commands.add_parser(command, help=f'run {SCREEN_SCRIPTS[command]} (see `digflow {command} -h`)', add_help=False)
+    return parser
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] in SCREEN_SCRIPTS:
+        return run_screen_script(argv[0], argv[1:])
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+if __name__ == '__main__':
+    main()
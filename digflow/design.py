@@ -4,12 +4,12 @@ import os
 import argparse
 import random
 import json
-import tkinter as tk
-from tkinter import messagebox, ttk
 from datetime import datetime, timedelta
+from .ledger import ConditionLedger
+from .facility import load_facility, validate_facility, plugcamera_shelf_template
 
 class Design:
-    def __init__(self, wc_date, save_path=None, conditions=None, sample_size=None, experimenters=None, controls_per_collection=None, file=None):
+    def __init__(self, wc_date, save_path=None, conditions=None, sample_size=None, experimenters=None, controls_per_collection=None, file=None, facility=None):
 
         self.save_path = save_path
         if file==None: self.conditions = list(pd.read_csv(conditions, header=0).conditions)
@@ -22,24 +22,11 @@ class Design:
         self.file = file
         self.amendment = None
         self.vials = pd.DataFrame(columns=['person', 'day', 'vials'])
-        self.all_exps = None
-        self.completed_exps = []
-        self.remaining_exps = None
+        self.ledger = None # per-condition counts of target/done/failed/queued experiments
         self.shelves = []
         self.shelves_df = pd.DataFrame()
-        self.shelf_template = pd.DataFrame([[ 1,24,  25,48,  49,72],
-                                            [ 2,23,  26,47,  50,71],
-                                            [ 3,22,  27,46,  51,70],
-                                            [ 4,21,  28,45,  52,69],
-                                            [ 5,20,  29,44,  53,68],
-                                            [ 6,19,  30,43,  54,67],
-                                            [ 7,18,  31,42,  55,66],
-                                            [ 8,17,  32,41,  56,65],
-                                            [ 9,16,  33,40,  57,64],
-                                            [10,15,  34,39,  58,63],
-                                            [11,14,  35,38,  59,62],
-                                            [12,13,  36,37,  60,61]])
-        self.shelf_total = 72 # for plugcamera set up
+        self.facility = load_facility(facility) if isinstance(facility, str) else validate_facility(facility or {})
+        self.set_shelf_geometry()
         self.controls_per_collection = controls_per_collection
         self.experimenters = experimenters
         self.date = wc_date
@@ -53,11 +40,16 @@ class Design:
                 json_data = json.load(f)
             self.conditions = json_data['conditions']
             self.experimenters = json_data['experimenters']
-            self.remaining_exps = json_data['remaining']
-            self.completed_exps = json_data['completed']
             self.controls_per_collection = json_data['controls_per_collection']
-
-            # find amendments, e.g. failed experiments and add back to remaining_exps
+            if facility is None and 'facility' in json_data:
+                self.facility = validate_facility(json_data['facility'])
+                self.set_shelf_geometry()
+            if 'ledger' in json_data:
+                self.ledger = ConditionLedger.from_dict(json_data['ledger'])
+            else: # older experiment.json with full remaining/completed lists
+                self.ledger = ConditionLedger.from_queue(json_data['remaining'], completed=json_data['completed'])
+
+            # find amendments, e.g. failed experiments and add back to the queue
             self.amendment = pd.read_csv(f'{file}/shelves.csv', index_col=0)
 
             # Check if there are any amendments with value -1
@@ -66,24 +58,10 @@ class Design:
             if amend_bool.any():  # Proceed only if there are -1 entries
                 failed_exp = self.amendment[amend_bool].condition.values
 
-                # Create a copy of original lists to avoid modifying it while iterating
-                exp_list = self.completed_exps.copy()
-                remaining_exp_list = self.remaining_exps.copy()
-
-                # Iterate over the failed_exp list and remove elements from exp_list
-                # and add back elements to remaining_exp_list
+                # each failure of a completed experiment puts one experiment of that condition back in the queue
                 for item in failed_exp:
-                    # Check if the item exists in exp_list before removing it
-                    if item in exp_list:
-                        index = len(exp_list) - 1 - exp_list[::-1].index(item)
-                        exp_list.pop(index)
-
-                        # Insert item at random index in remaining_exp_list
-                        index = random.randint(0, len(remaining_exp_list))
-                        remaining_exp_list.insert(index, item)
-
-                self.completed_exps = exp_list
-                self.remaining_exps = remaining_exp_list
+                    if self.ledger.successful(item) > 0:
+                        self.ledger.record_failure(item)
             else:
                 print("No amendments with value -1 found. Skipping amendment processing.")
 
@@ -94,9 +72,18 @@ class Design:
     def conditions_init(self, seed):
         random.seed(seed)
         random.shuffle(self.conditions)
-        self.all_exps = self.conditions * self.sample_size # add repeats after the conditions are shuffled, so they only repeat after each condition occurs once, twice, etc.
-        self.remaining_exps = self.all_exps
-        # note that self.all_exps and self.remaining_exps refer to sets of experiments. Here experiment has by default 6 replicates
+        # conditions are handed out round-robin in shuffled order, so they only repeat after each condition occurs once, twice, etc.
+        self.ledger = ConditionLedger.from_conditions(self.conditions, self.sample_size)
+        # note that the ledger counts sets of experiments. Here experiment has by default 6 replicates
+
+    # flat lists of remaining/completed experiments, as kept before the ledger
+    @property
+    def remaining_exps(self):
+        return self.ledger.queue() if self.ledger is not None else None
+
+    @property
+    def completed_exps(self):
+        return self.ledger.completed() if self.ledger is not None else []
 
     def check_if_monday(self, wc_date):
         monday_date = datetime.strptime(wc_date, "%d-%m-%Y")
@@ -130,12 +117,82 @@ class Design:
             return tues.strftime("%d-%m-%Y"), wed.strftime("%d-%m-%Y"), thurs.strftime("%d-%m-%Y"), fri.strftime("%d-%m-%Y")
 
     def add_vials(self, count, day, person):
-        new_row = {'person': person,
-                    'day': day,
-                    'vials': count}
-
-        new_row_df = pd.DataFrame([new_row])
-        self.vials = pd.concat([self.vials, new_row_df], ignore_index=True)
+        self.vials.loc[len(self.vials)] = [person, day, count]
+
+    # vial counts for all experimenters at once, instead of entering them in vials_gui
+    def add_vials_table(self, vials):
+        vials = pd.DataFrame(vials).rename(columns=str.lower)
+        missing = {'person', 'day', 'vials'} - set(vials.columns)
+        if missing:
+            raise ValueError(f"Vials table needs columns person, day and vials; missing {sorted(missing)}")
+        vials = vials[['person', 'day', 'vials']].astype({'person': str, 'day': str})
+        vials['person'] = vials['person'].str.strip()
+        vials['day'] = vials['day'].str.strip().str.capitalize()
+        self.vials = pd.concat([self.vials, vials], ignore_index=True) if not self.vials.empty else vials.reset_index(drop=True)
+
+    # read vial counts from a CSV (person,day,vials) or JSON file, either a list of such records or {person: {day: vials}}
+    def load_vials(self, path):
+        if path.endswith('.json'):
+            with open(path, 'r') as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                data = [{'person': person, 'day': day, 'vials': count} for person, days in data.items() for day, count in days.items()]
+            self.add_vials_table(pd.DataFrame(data))
+        else:
+            self.add_vials_table(pd.read_csv(path))
+
+    # checks on the vial table, one vectorised pass per rule; invalid entries are removed and the errors returned (None if all valid)
+    def validate_vials(self):
+        errors = []
+        days = ['Tuesday', 'Wednesday']
+        vials = self.vials
+        counts = pd.to_numeric(vials['vials'], errors='coerce')
+        rack_size = self.shelf_template.shape[0] * self.rack_columns
+
+        # entries that can't be used at all: unknown day or person, or a count that doesn't fit a rack
+        bad_day = ~vials['day'].isin(days)
+        bad_person = ~vials['person'].isin(self.experimenters) if self.experimenters else pd.Series(False, index=vials.index)
+        bad_count = counts.isna() | (counts != counts.round()) | (counts < 0) | (counts > rack_size)
+        for mask, message in [(bad_day, "has an entry for {day}, only Tuesday and Wednesday are collection days"),
+                              (bad_person, "is not one of the experimenters"),
+                              (bad_count & ~bad_day, "has {vials} vials for {day}, must be a whole number from 0 to " + str(rack_size))]:
+            errors += [f"{row.person} {message.format(day=row.day, vials=row.vials)}. The entry will be removed." for row in vials[mask].itertuples()]
+        valid = vials[~(bad_day | bad_person | bad_count)]
+
+        # exactly one entry per person and collection day
+        per_day = valid.groupby(['person', 'day']).size().unstack(fill_value=0).reindex(columns=days, fill_value=0)
+        stacked = per_day.stack()
+        duplicated = pd.MultiIndex.from_frame(valid[['person', 'day']]).isin(stacked[stacked > 1].index)
+        for person, row in per_day.iterrows():
+            errors += [f"{person} has multiple entries for {day}. The invalid entries will be removed." for day in days if row[day] > 1]
+            errors += [f"{person} has no entry for {day}. Please add an entry for {day}." for day in days if row[day] == 0]
+
+        keep = valid.index[~duplicated]
+
+        # both collection days share one rack: conditions (vials less controls) of each day plus the controls of both days
+        kept = vials.loc[keep].assign(vials=counts.loc[keep].astype(int))
+        per_person = kept.pivot_table(index='person', columns='day', values='vials', aggfunc='sum', fill_value=0).reindex(columns=days, fill_value=0)
+        controls = self.controls_per_collection
+        needed = (per_person - controls).clip(lower=0).sum(axis=1) + 2 * controls
+        for person in needed.index[needed > rack_size]:
+            errors.append(f"{person} has {per_person.loc[person, 'Tuesday']} Tuesday and {per_person.loc[person, 'Wednesday']} Wednesday vials, "
+                          f"which with {2 * controls} controls need {needed[person]} slots but a rack has {rack_size}. The entries will be removed.")
+        kept = kept[~kept['person'].isin(needed.index[needed > rack_size])]
+
+        self.vials = kept.reset_index(drop=True)
+        return "\n".join(errors) if errors else None
+
+    # non-interactive alternative to vials_gui: read, validate, build and save in one go
+    def plan_from_vials(self, vials):
+        if isinstance(vials, str):
+            self.load_vials(vials)
+        else:
+            self.add_vials_table(vials)
+        validation_error = self.validate_vials()
+        if validation_error:
+            raise ValueError(f"Invalid vial counts:\n{validation_error}")
+        self.build_shelves()
+        self.output()
 
     def build_shelves(self):
         experimenters = np.unique(self.vials.person)
@@ -145,30 +202,59 @@ class Design:
         self.shelves = []
         self.shelves_df = pd.DataFrame()
 
+        shelf_dfs = []
         for i, experimenter in enumerate(experimenters):
             shelf, shelf_df = self.build_shelf(experimenter=experimenter, shelf_num=i)
             #print(experimenter)
             if shelf is not None and not shelf_df.empty:
                 # Only append non-empty shelves and data
                 self.shelves.append(shelf)
-                self.shelves_df = pd.concat([self.shelves_df, shelf_df], ignore_index=True)
+                shelf_dfs.append(shelf_df)
+        if shelf_dfs:
+            self.shelves_df = pd.concat(shelf_dfs, ignore_index=True)
     
-    # note that this function uses hardcoded numbers for the shelf size
+    # plugcamera shelf from the facility description (12 x 6, racks of 2 columns by default)
+    def set_shelf_geometry(self):
+        shelf = self.facility['plugcamera_shelf']
+        self.shelf_template = pd.DataFrame(plugcamera_shelf_template(shelf['rows'], shelf['columns']))
+        self.shelf_total = shelf['rows'] * shelf['columns'] # for plugcamera set up
+        self.rack_columns = shelf['rack_columns'] # each rack is a group of columns
+        self.build_position_tables()
+
+    # lookup tables derived from shelf_template, so no shelf geometry is hardcoded below
+    def build_position_tables(self):
+        template = self.shelf_template.to_numpy()
+        num_rows, num_columns = template.shape
+        self.slot_rack = np.repeat(np.arange(num_columns) // self.rack_columns + 1, num_rows).reshape(num_columns, num_rows).T
+
+        # rack of each plugcamera position on a shelf, indexed by position (1-based)
+        self.rack_by_pos = np.zeros(self.shelf_total + 1, dtype=int)
+        self.rack_by_pos[template.ravel()] = self.slot_rack.ravel()
+
+        # fill order of the slots in each rack: down the first column, then down the next
+        self.rack_slots = []
+        for rack in range(num_columns // self.rack_columns):
+            cols = np.arange(rack * self.rack_columns, (rack + 1) * self.rack_columns)
+            self.rack_slots.append((np.tile(np.arange(num_rows), len(cols)), np.repeat(cols, num_rows)))
+
+    def position_index(self, num_shelves):
+        """Precomputed slot -> plugcamera lookup for num_shelves shelves: one row per slot with shelf, row, column, rack and plugcamera number."""
+        template = self.shelf_template.to_numpy()
+        num_rows, num_columns = template.shape
+        rows, cols = np.indices((num_rows, num_columns)).reshape(2, -1)
+        shelf = np.repeat(np.arange(num_shelves), len(rows))
+        pos = np.tile(template[rows, cols], num_shelves)
+        return pd.DataFrame({'shelf': shelf + 1,
+                             'row': np.tile(rows, num_shelves),
+                             'column': np.tile(cols, num_shelves),
+                             'rack': self.rack_by_pos[pos],
+                             'plugcamera_pos': pos + self.shelf_total * shelf,
+                             'plugcamera': [f'pc{p}' for p in pos + self.shelf_total * shelf]})
+
     def pc_to_rack(self, pc_num):
-        # Check if the pc_num belongs to the bottom shelf (starts from 73)
-        if pc_num >= 73:
-            pc_num -= 72  # Normalize the pc_num to match the upper shelf pattern
-
-        # Determine the rack based on pc_num
-        if 1 <= pc_num <= 24:
-            rack_num = 1
-        elif 25 <= pc_num <= 48:
-            rack_num = 2
-        elif 49 <= pc_num <= 72:
-            rack_num = 3
-        else:
+        if pc_num < 1:
             raise ValueError("Invalid pc_num: out of range")
-        return rack_num
+        return int(self.rack_by_pos[(pc_num - 1) % self.shelf_total + 1])
 
     def build_shelf(self, experimenter, shelf_num):
         pattern = self.vials['person'] == experimenter
@@ -197,83 +283,64 @@ class Design:
 
         # Initialize shelf shape, based on physical dimensions of the incubator
         default_value = '-'
-        num_rows = 12
-        num_columns = 6
+        num_rows, num_columns = self.shelf_template.shape
+        slots_per_rack = num_rows * self.rack_columns
 
-        # Create the shelf structure
-        shelf_structure = pd.DataFrame(np.full((num_rows, num_columns), default_value), columns=range(0, num_columns), index=range(0, num_rows))
+        # Select conditions for day 1 and day 2 from the queue
+        conditions_day1 = self.ledger.select(collection_day1)
+        conditions_day2 = self.ledger.select(collection_day2)
 
-        all_exps = self.remaining_exps
-
-        # Select conditions for day 1 and day 2 without duplicates
-        conditions_day1 = all_exps[:collection_day1]
-        conditions_day2 = all_exps[collection_day1:collection_day1 + collection_day2]
-        #print(conditions_day1)
-        #print(conditions_day2)
-
-        self.completed_exps = self.completed_exps + conditions_day1 + conditions_day2
-        #print(self.completed_exps)
-        self.remaining_exps = all_exps[len(conditions_day1 + conditions_day2):]
-
-        empty = 24 - len(conditions_day1) - len(conditions_day2) - self.controls_per_collection * 2
+        empty = slots_per_rack - len(conditions_day1) - len(conditions_day2) - self.controls_per_collection * 2
 
         if self.controls_per_collection > 1:
             conditions = conditions_day1 + [f'control-1-{x}' for x in range(1, self.controls_per_collection+1)] + conditions_day2 + [f'control-2-{x}' for x in range(1, self.controls_per_collection+1)] + ['-'] * empty
         else: # if self.controls_per_collection == 1
             conditions = conditions_day1 + ['control-1'] + conditions_day2 + [f'control-2'] + ['-'] * empty
 
-        date_day1 = self.calculate_dates(date_type='collection')[0]
-        date_day2 = self.calculate_dates(date_type='collection')[1]
+        # collections happen on Tuesday and Wednesday, staging on the following three days (one rack per day)
+        date_day1, date_day2, staging_day2, staging_day3 = self.calculate_dates(date_type='staging')
+        staging_days = [date_day2, staging_day2, staging_day3]
+        if len(self.rack_slots) < len(staging_days):
+            raise ValueError(f"Plugcamera shelf has {len(self.rack_slots)} rack(s), need one per staging day ({len(staging_days)})")
         collection_meta = [f'{date_day1}'] * (len(conditions_day1) + self.controls_per_collection) + [f'{date_day2}'] * (len(conditions_day2) + self.controls_per_collection) + [''] * empty
 
         conditions_meta = list(zip(conditions, collection_meta))
 
-        random.shuffle(conditions_meta)
-
-            # Distribute the conditions across the shelf
-        def fill_columns_with_conditions(shelf, conditions, col_indices, shelf_num, date):
-            # Assign the shuffled conditions to the specified columns
-            positions = []
-            for idx, (row, col) in enumerate([(row, col) for col in col_indices for row in range(len(shelf.index))]):
-                shelf.iloc[row, col] = conditions[idx][0]
-
-                # populate dataframe with non-empty conditions
-                if conditions[idx][0] != '-':
-                    pc_num = self.shelf_template.iloc[row,col]+(self.shelf_total*shelf_num)
-                    index = {'experimenter': experimenter,
-                            'collector': experimenter,
-                            'shelf': shelf_num + 1,
-                            'rack': self.pc_to_rack(pc_num),
-                            'plugcamera': f'pc{pc_num}',
-                            'condition': conditions[idx][0],
-                            'collection_date': conditions[idx][1],
-                            'staging_date': date,
-                            'amendments': '',
-                            'plugcamera_pos': self.shelf_template.iloc[row,col]+(self.shelf_total*shelf_num)}
-
-                    positions.append(index)
-
-            df = pd.DataFrame(positions)
-            return shelf, df
-
-        # Staging dates (you already calculate them earlier in the function)
-        staging_day1, staging_day2, staging_day3 = self.calculate_dates(date_type='staging')
-
-        # Now, fill the columns with conditions
-        shelf_structure, df_1 = fill_columns_with_conditions(shelf_structure, conditions_meta, [0, 1], shelf_num, staging_day1)
-        random.shuffle(conditions_meta)
-        shelf_structure, df_2 = fill_columns_with_conditions(shelf_structure, conditions_meta, [2, 3], shelf_num, staging_day2)
-        random.shuffle(conditions_meta)
-        shelf_structure, df_3 = fill_columns_with_conditions(shelf_structure, conditions_meta, [4, 5], shelf_num, staging_day3)
-
-        # Combine all shelf data
-        shelf_df = pd.concat([df_1, df_2, df_3])
-        shelf_df = shelf_df.sort_values('plugcamera_pos', ascending=True)
-        shelf_df = shelf_df.drop(columns=['plugcamera_pos'])
-
-        # Sort each group of shelf/rack alphabetically by condition
-        shelf_df['condition'] = shelf_df['condition'].apply(str)
-        shelf_df = shelf_df.sort_values(by=['shelf', 'rack', 'condition'], key=lambda col: col.str.lower() if col.name == 'condition' else col)
+        # each staging day gets its own shuffle of the same conditions into its rack
+        day_conditions, day_collections = [], []
+        for day in range(len(staging_days)):
+            random.shuffle(conditions_meta)
+            day_conditions.append([c[0] for c in conditions_meta])
+            day_collections.append([c[1] for c in conditions_meta])
+
+        # fill all racks at once from the precomputed slot order
+        slot_rows = np.concatenate([self.rack_slots[day][0] for day in range(len(staging_days))])
+        slot_cols = np.concatenate([self.rack_slots[day][1] for day in range(len(staging_days))])
+        slot_conditions = np.array(sum(day_conditions, []), dtype=object)
+        slot_collections = np.array(sum(day_collections, []), dtype=object)
+        slot_staging = np.repeat(np.array(staging_days, dtype=object), slots_per_rack)
+
+        layout = np.full((num_rows, num_columns), default_value, dtype=object)
+        layout[slot_rows, slot_cols] = slot_conditions
+        shelf_structure = pd.DataFrame(layout, columns=range(0, num_columns), index=range(0, num_rows))
+
+        # populate dataframe with non-empty conditions
+        filled = slot_conditions != '-'
+        pos = self.shelf_template.to_numpy()[slot_rows[filled], slot_cols[filled]]
+        pc_num = pos + self.shelf_total * shelf_num
+        shelf_df = pd.DataFrame({'experimenter': experimenter,
+                                 'collector': experimenter,
+                                 'shelf': shelf_num + 1,
+                                 'rack': self.rack_by_pos[pos],
+                                 'plugcamera': [f'pc{p}' for p in pc_num],
+                                 'condition': slot_conditions[filled].astype(str),
+                                 'collection_date': slot_collections[filled],
+                                 'staging_date': slot_staging[filled],
+                                 'amendments': ''})
+
+        # Sort each group of shelf/rack alphabetically by condition (ties in plugcamera order)
+        order = np.lexsort((pc_num, shelf_df['condition'].str.lower().to_numpy(), shelf_df['rack'].to_numpy()))
+        shelf_df = shelf_df.iloc[order].reset_index(drop=True)
 
         return shelf_structure, shelf_df
 
@@ -293,55 +360,19 @@ class Design:
         # Save the experiment JSON
         experiment_dict = {'conditions': self.conditions,
                             'experimenters': self.experimenters,
-                            'remaining': self.remaining_exps,
-                            'completed': self.completed_exps,
-                            'controls_per_collection': self.controls_per_collection}
+                            'ledger': self.ledger.to_dict(),
+                            'controls_per_collection': self.controls_per_collection,
+                            'facility': self.facility}
 
         with open(f'{save_path}/experiment.json', 'w') as f:
             json.dump(experiment_dict, f, indent=4)
 
     def vials_gui(self):
-        # Function to validate data before final submission
-        def validate_vials():
-            errors = []  # Collect all validation errors here
-
-            # Group the vials data by person and day to count the number of entries for each person
-            vials_per_person_day = self.vials.groupby(['person', 'day']).size().unstack(fill_value=0)
-
-            invalid_entries = []  # To store offending entries to be removed later
-
-            for person in vials_per_person_day.index:
-                # Skip validation if the person has no entries (i.e., both Tuesday and Wednesday are 0)
-                if vials_per_person_day.loc[person, 'Tuesday'] == 0 and vials_per_person_day.loc[person, 'Wednesday'] == 0:
-                    continue  # No need to validate if no entries exist
-
-                # Check if there's more than one entry for Tuesday
-                if vials_per_person_day.loc[person, 'Tuesday'] > 1:
-                    # Collect all invalid Tuesday entries
-                    invalid_entries.append(self.vials[(self.vials['person'] == person) & (self.vials['day'] == 'Tuesday')].index.tolist())
-                    errors.append(f"{person} has multiple entries for Tuesday. The invalid entries will be removed.")
-
-                # Check if there's more than one entry for Wednesday
-                if vials_per_person_day.loc[person, 'Wednesday'] > 1:
-                    # Collect all invalid Wednesday entries
-                    invalid_entries.append(self.vials[(self.vials['person'] == person) & (self.vials['day'] == 'Wednesday')].index.tolist())
-                    errors.append(f"{person} has multiple entries for Wednesday. The invalid entries will be removed.")
-
-                # Check if there's no entry for Tuesday
-                if vials_per_person_day.loc[person, 'Tuesday'] == 0:
-                    errors.append(f"{person} has no entry for Tuesday. Please add an entry for Tuesday.")
-
-                # Check if there's no entry for Wednesday
-                if vials_per_person_day.loc[person, 'Wednesday'] == 0:
-                    errors.append(f"{person} has no entry for Wednesday. Please add an entry for Wednesday.")
-
-            # Remove all invalid entries (flatten the list of indexes)
-            invalid_indexes = [item for sublist in invalid_entries for item in sublist]
-            if invalid_indexes:
-                self.vials.drop(invalid_indexes, inplace=True)
+        # imported here so Design also works on nodes without a display (see plan_from_vials)
+        import tkinter as tk
+        from tkinter import messagebox, ttk
 
-            # Return all collected errors, or None if no errors were found
-            return "\n".join(errors) if errors else None
+        validate_vials = self.validate_vials
 
         # Function to handle final submission
         def final_submit():
@@ -404,7 +435,7 @@ class Design:
         # Use self.experimenters for person options
         person_options = self.experimenters
         day_options = ["Tuesday", "Wednesday"]
-        vials_options = [str(i) for i in range(25)]
+        vials_options = [str(i) for i in range(self.shelf_template.shape[0] * self.rack_columns + 1)] # up to one rack of vials
 
         person_menu = ttk.Combobox(root, textvariable=person_var, values=person_options, state="readonly")
         day_menu = ttk.Combobox(root, textvariable=day_var, values=day_options, state="readonly")
@@ -8,13 +8,21 @@ import time
 import tempfile
 import shutil
 import random
+import threading
 import json
 import csv
 import sys
-import scyjava
-import cv2
-import imagej
-from PIL import Image
+from .kinematics import write_features
+from .trackstore import TrackStore, TrackStoreWriter
+from .results_index import ResultsIndex
+from .profiler import StageProfiler, folder_bytes
+from .sizing import ResourceModel, format_time, sbatch_options
+from .journal import StageJournal
+from .capture import PLUGCAMERA_CROP, MARKER, crop_filter
+from .rotation import Rotation, read_revolution
+from .calibration import StitchCalibration, video_fingerprint, read_tile_positions
+from .precount import count_image, needs_sleap, read_precounts, write_precounts, held_back
+from .arrays import max_array_size, write_manifest, plan_array, manifest_loop, array_task_states, TERMINAL_STATES, RETRY_STATES
 
 class Experiment:
     def __init__(self, exp_type, experiment_name='', rotator_IP='10.7.192.163', conditions=None, rig_list=None, ip_path='ip_addresses.csv', remove_files=True, sleap_paths=None, skel_parts=None):
@@ -29,6 +37,9 @@ class Experiment:
         self.centroid_path = '/camp/lab/windingm/home/shared/models/pupae/active/240306_235934.centroid'
         self.centered_instance_path = '/camp/lab/windingm/home/shared/models/pupae/active/240306_235934.centered_instance'
         self.fiji_path = '/camp/lab/windingm/home/shared/Fiji-installation/Fiji.app'
+        self.results_index_path = '/camp/lab/windingm/data/instruments/behavioural_rigs/results_index.sqlite'
+        self.job_history_path = '/camp/lab/windingm/data/instruments/behavioural_rigs/slurm_history'
+        self.stitch_calibration_path = '/camp/lab/windingm/data/instruments/behavioural_rigs/stitch_calibration.json'
         self.ip_path = ip_path
         self.exp_type = exp_type
         self.sleap_paths = sleap_paths
@@ -37,6 +48,9 @@ class Experiment:
         self.ip_data = None
         self.IPs = None
         self.rotator_IP = rotator_IP
+        self.crop = PLUGCAMERA_CROP # vial crop of plugcamera frames (w, h, x, y), shared with the capture agent on the Pis
+        self.strip_crop = [525, 675] # centre columns of each rotator frame that are stitched into the panorama
+        self.stitch_calibration = StitchCalibration(self.stitch_calibration_path) # registered tile offsets per rotator
         self.rig_num = None
         self.save_path = None
         self.save_path_pupae = None
@@ -45,10 +59,20 @@ class Experiment:
         self.mp4_path = None
         self.rpi_username = None
         self.predictions_path = None
-        self.transfer_start_time = None
-        self.transfer_end_time = None
-        self.process_start_time = None
-        self.process_end_time = None
+        self.profiler = StageProfiler(experiment_name, exp_type) # per-stage wall/CPU time, bytes, frames and Slurm usage
+        self.resources = ResourceModel(self.job_history_path, exp_type) # Slurm requests sized from past sacct usage
+        self.journal = None # finished stages/items of a resumable pipeline
+        self.resume = True  # pick up from the journal; False starts the pipeline over
+        self.max_array_size = None # cluster MaxArraySize, asked from scontrol on first use
+        self.max_arrays = 4        # array submissions per stage before several items go to each task
+        self.array_items_per_task = 1
+        self.array_retries = 2     # resubmissions of failed array tasks per stage
+        self.retry_bump = 1.5      # memory/time factor for tasks that ran out of it (1 keeps the same requests)
+        self.requested = {}        # last Slurm requests per sbatch script
+        self.transfer_failures = [] # rigs (or the rsync job) whose transfer failed in the last transfer_data
+        self.triage_confidence = None # with a precount at least this confident, a vial skips SLEAP (None: every vial goes)
+        self.triage_sample = 0.1      # fraction of confident vials that still go to SLEAP, to keep an eye on the precounts
+        self.precount_lock = threading.Lock()
         self.video_file_paths = None
         self.names = None
 
@@ -169,29 +193,103 @@ class Experiment:
         self.setup_experiment_paths('plugcamera')
         self.transfer_data('array_transfer') # transfers data from individual RPis to NEMO
         self.crop_mp4_convert() # converts .jpgs to .mp4 and crops to smaller size
-        self.timing()
+        self.timing()           # prints stage timings and writes the metrics JSON
 
+    # re-running either pupae pipeline resumes from its journal: the transfer and the per-vial stages look for new vials
+    # every time, skipping the videos already unwrapped and the panoramas already counted and predicted
     def pc_pipeline2(self):
         # exp_csv = pd.read_csv(experiment_csv_path)
         self.setup_experiment_paths('pupae')
-        self.transfer_data('pupae_transfer')    # transfers data from rotator RPis to NEMO
-
-        scyjava.config.add_option('-Xmx6g')
-        self.ij = imagej.init(self.fiji_path)   # point to local installation
-        self.unwrap_videos()                    # unwraps rotating vial videos
-
-        self.sleap_prediction('still')          # infers pupae locations using pretrained SLEAP model
-        self.write_predictions()                # writes pupae number predictions to csv
-        self.timing()
+        self.open_journal('pc_pipeline2')
+        self.journaled('transfer', self.transfer_data, 'pupae_transfer', profile=False, rescan=True, check=lambda: self.transfer_failures)   # transfers data from rotator RPis to NEMO
+        self.pupae_processing()
 
     def pc_pipeline2_no_transfer(self):
         self.setup_experiment_paths('pupae')
-        scyjava.config.add_option('-Xmx6g')
-        self.ij = imagej.init(self.fiji_path)   # point to local installation
-        self.unwrap_videos()                    # unwraps rotating vial videos
+        self.open_journal('pc_pipeline2')
+        self.pupae_processing()
 
-        self.sleap_prediction('still')          # infers pupae locations using pretrained SLEAP model
-        self.write_predictions()                # writes pupae number predictions to csv
+    # streaming variant of pc_pipeline2: each video is unwrapped as soon as rsync has finished writing it and each panorama
+    # goes on to SLEAP in small batches, while the transfer and the other unwraps carry on. queue_size bounds the videos
+    # and panoramas waiting between stages; a SLEAP batch is sent once it has batch_size panoramas or batch_wait seconds pass
+    def pc_pipeline2_streaming(self, queue_size=4, batch_size=8, batch_wait=120, poll=10, settle=30):
+        from .streaming import ArrivalWatcher, StreamPipeline
+        import queue
+
+        self.setup_experiment_paths('pupae')
+        self.open_journal('pc_pipeline2')
+
+        # like pc_pipeline2, every run transfers and looks for new vials; Fiji starts with the first video to stitch
+        print('\nData Transfer from RPis to NEMO (streaming)...\n')
+        self.journal.start('transfer')
+        transfer_record = self.profiler.start('transfer')
+        transfer_record['bytes'] = -folder_bytes(self.raw_data_path)
+        transfer_job = self.shell_script_run(self.sbatch_scripts('pupae_transfer'))
+        self.profiler.add_job('transfer', transfer_job, script='pupae_transfer')
+        for stage in ('unwrap', 'precount', 'sleap_still'):
+            self.journal.start(stage)
+
+        videos, panoramas, to_sleap = (queue.Queue(maxsize=queue_size) for _ in range(3))
+        pipeline = StreamPipeline()
+        watcher = ArrivalWatcher(self.raw_data_path, accept=self.is_pupae_video, settle=settle)
+        transfer_done = lambda: self.job_state(transfer_job) in TERMINAL_STATES  # None until sacct lists the new job
+        pipeline.watch(watcher, videos, transfer_done, poll=poll)
+        pipeline.stage('unwrap', videos, self.unwrap_video, outbox=panoramas)
+        pipeline.stage('precount', panoramas, self.precount_panorama, outbox=to_sleap)   # passes on only the vials SLEAP should see
+        pipeline.batch_stage('sleap_still', to_sleap, self.predict_stills, batch_size=batch_size, wait=batch_wait)
+        try:
+            pipeline.run()
+        except BaseException as e:
+            for stage in ('transfer', 'unwrap', 'precount', 'sleap_still'):
+                if self.journal.stage(stage)['status'] == 'running':
+                    self.journal.fail(stage, str(e))
+            raise
+
+        transfer_record['bytes'] += folder_bytes(self.raw_data_path)
+        self.profiler.stop(transfer_record)
+        transfer_state = self.job_state(transfer_job)
+        if transfer_state == 'COMPLETED':
+            self.journal.complete('transfer')
+        else:
+            self.journal.fail('transfer', f'rsync job {transfer_job} ({transfer_state})')
+            print(f'\tTransfer failed: rsync job {transfer_job} ended {transfer_state}')
+        self.journal.complete('unwrap')
+        self.journal.complete('precount')
+        missing = self.missing_predictions()
+        if missing:
+            self.journal.fail('sleap_still', f'{len(missing)} item(s) missing: {", ".join(missing[:10])}')
+            print(f'\tsleap_still incomplete: {len(missing)} item(s) missing, they will be retried on the next run')
+        else:
+            self.journal.complete('sleap_still')
+
+        self.journaled('write_predictions', self.write_predictions)   # writes pupae number predictions to csv
+        self.journaled('render_previews', self.render_previews)       # draws predictions onto panoramas for QC
+        self.journaled('results_index', self.update_results_index)    # adds new results to the cross-experiment index
+        self.timing()                           # prints stage timings and writes the metrics JSON
+
+    # one SLEAP job for a batch of panoramas (those without a prediction yet, or all of them with --restart)
+    def predict_stills(self, image_paths):
+        if self.resume:
+            image_paths = [path for path in image_paths if not os.path.exists(f"{self.predictions_path}/{os.path.basename(path)[:-len('.jpg')]}.json")]
+        if not image_paths:
+            return
+        print(f'\nSLEAP predictions of pupae locations for {len(image_paths)} panoramas...')
+        with self.profiler.stage('sleap_still') as record:
+            record['frames'] = len(image_paths)
+            job_id = self.shell_script_run(self.sbatch_scripts('sleap_still', images=image_paths))
+            self.profiler.add_job('sleap_still', job_id, script='sleap_still', size=len(image_paths))
+            self.check_job_completed(job_id, initial_wait=30)
+        self.missing_predictions()  # journals the panoramas that got a prediction
+
+    def pupae_processing(self):
+        self.journaled('unwrap', self.unwrap_videos, rescan=True)                # unwraps rotating vial videos (starts Fiji if there are any)
+        self.journaled('precount', self.precount_panoramas, rescan=True)         # provisional pupae counts from dark blobs
+
+        self.journaled('sleap_still', self.sleap_prediction, 'still', profile=False, rescan=True, check=self.missing_predictions)   # infers pupae locations using pretrained SLEAP model
+        self.journaled('write_predictions', self.write_predictions)   # writes pupae number predictions to csv
+        self.journaled('render_previews', self.render_previews)       # draws predictions onto panoramas for QC
+        self.journaled('results_index', self.update_results_index)    # adds new results to the cross-experiment index
+        self.timing()                           # prints stage timings and writes the metrics JSON
 
     def pc_pipeline_test(self): # testing pipeline, changes depending on what needs testing
         print("Running self.setup_experiment_paths('pupae')...")
@@ -202,17 +300,81 @@ class Experiment:
         self.sleap_prediction('still')          # infers pupae locations using pretrained SLEAP model
         print("Completed self.sleap_prediction('still')...")
 
+        self.render_previews()                  # draws predictions onto panoramas for QC
+
         self.write_predictions()                # writes pupae number predictions to csv
 
     # for side-view and top-down rigs
     def sleap_pipeline1(self):
         self.setup_experiment_paths('sleap')    
         self.sleap_prediction('video')          # runs predictions and generates animal tracks
-        self.tracks_json_to_csv()               # converts output to CSV
+        self.run_stage('tracks_to_csv', self.tracks_json_to_csv)      # converts output to CSV
+        self.run_stage('features', self.tracks_to_features)           # per-track kinematics into the feature store
+        self.run_stage('results_index', self.update_results_index)    # adds new results to the cross-experiment index
+        self.timing()                           # prints stage timings and writes the metrics JSON
 
     ##########
     # METHODS
     ##########
+    # Java and Fiji are only started once there is something to stitch
+    def start_fiji(self):
+        if getattr(self, 'ij', None) is not None:
+            return
+        import scyjava
+        import imagej
+        with self.profiler.stage('start_fiji'):
+            scyjava.config.add_option('-Xmx6g')
+            self.ij = imagej.init(self.fiji_path)   # point to local installation
+
+    # run one pipeline step as a profiled stage
+    def run_stage(self, name, step, *args, **kwargs):
+        with self.profiler.stage(name):
+            return step(*args, **kwargs)
+
+    def open_journal(self, pipeline):
+        self.journal = StageJournal(f'{self.save_path}/pipeline_journal.json', pipeline, resume=self.resume)
+        if self.journal.data['stages']:
+            print(f'\nResuming from {self.journal.path}:')
+            for name, status in self.journal.summary().items():
+                print(f'\t{name}: {status}')
+
+    # run a pipeline step unless the journal has it finished; check() returns what is still missing after the step
+    # (a stage with missing items stays incomplete, and the next run picks them up). rescan=True runs the step even when
+    # it is finished, for steps that look for new items (videos, panoramas) and skip the ones already done themselves
+    def journaled(self, name, step, *args, profile=True, check=None, rescan=False, **kwargs):
+        if not rescan and not self.journal.should_run(name):
+            print(f'\nSkipping {name}: already completed')
+            return None
+        self.journal.start(name)
+        try:
+            result = self.run_stage(name, step, *args, **kwargs) if profile else step(*args, **kwargs)
+        except BaseException as e:
+            self.journal.fail(name, f'{type(e).__name__}: {e}')
+            raise
+        missing = check() if check else []
+        if missing:
+            self.journal.fail(name, f'{len(missing)} item(s) missing: {", ".join(str(item) for item in missing[:10])}')
+            print(f'\t{name} incomplete: {len(missing)} item(s) missing, they will be retried on the next run')
+        else:
+            self.journal.complete(name)
+        return result
+
+    # panoramas (of those SLEAP should see, see sleap_images) without a SLEAP prediction yet; the predicted ones are recorded in the journal
+    def missing_predictions(self):
+        missing = []
+        images = self.sleap_images()
+        for f in sorted(os.listdir(self.raw_data_path)) if images is None else [os.path.basename(path) for path in images]:
+            if not f.endswith('.jpg'):
+                continue
+            name = f[:-len('.jpg')]
+            output = f'{self.predictions_path}/{name}.json'
+            if os.path.exists(output):
+                if self.journal and not self.journal.item_done('sleap_still', name):
+                    self.journal.record_item('sleap_still', name, output)
+            else:
+                missing.append(name)
+        return missing
+
     def make_dir(self, path):
         if not os.path.exists(path):
             os.makedirs(path, exist_ok=True)
@@ -223,57 +385,166 @@ class Experiment:
         video_name = os.path.basename(video_path)
         return os.path.join(base_path, f'{video_name}_sequence')
 
-    def set_start_time(self, track_type):
-        if(track_type=='transfer'): self.transfer_start_time = datetime.now()
-        elif(track_type=='process'): self.process_start_time = datetime.now()
-
-    def set_end_time(self, track_type):
-        if(track_type=='transfer'): self.transfer_end_time = datetime.now()
-        elif(track_type=='process'): self.process_end_time = datetime.now()
+    # manual stage timing, for steps that aren't wrapped in a profiler stage
+    def set_start_time(self, track_type): self.profiler.start(track_type)
+    def set_end_time(self, track_type): self.profiler.stop(track_type)
         
+    # ingest this experiment's results tables (pupae_counts.csv, *.tracks.csv, shelves.csv) into the results index
+    def update_results_index(self):
+        if self.exp_type == 'sleap':
+            folder = self.predictions_path
+            experiment = self.name if self.name else os.path.basename(os.path.normpath(folder))
+        else:
+            folder = f'/camp/lab/windingm/data/instruments/behavioural_rigs/{self.exp_type}/{self.name}'
+            experiment = self.name
+
+        index = ResultsIndex(self.results_index_path)
+        n = index.ingest_folder(folder, experiment, self.exp_type)
+        index.close()
+        print(f'\tResults index: {n} file(s) ingested from {folder}')
+
     def set_username(self, user): self.rpi_username = user
     def set_fiji_path(self, fiji_path): self.fiji_path = fiji_path
     def set_centroid_path(self, centroid_path): self.centroid_path = centroid_path
     def set_centered_instance_path(self, centered_instance_path): self.centered_instance_path = centered_instance_path
     def set_rotator_IP(self, rotator_IP): self.rotator_IP = rotator_IP
-
+    def set_results_index_path(self, results_index_path): self.results_index_path = results_index_path
+
+    def set_resume(self, resume): self.resume = resume
+    def set_triage(self, min_confidence=0.9, sample=0.1): self.triage_confidence, self.triage_sample = min_confidence, sample
+    def set_stitch_calibration(self, path, tolerance=0.03): # path=None registers every stitch
+        self.stitch_calibration_path = path
+        self.stitch_calibration = StitchCalibration(path, tolerance) if path else None
+    def set_array_limits(self, max_array_size=None, max_arrays=4, items_per_task=1):
+        self.max_array_size, self.max_arrays, self.array_items_per_task = max_array_size, max_arrays, items_per_task
+    def set_array_retries(self, retries=2, bump=1.5): self.array_retries, self.retry_bump = retries, bump
+
+    def set_job_history_path(self, job_history_path):
+        self.job_history_path = job_history_path
+        self.resources.history_path = job_history_path
+
+    # transfers and records what failed in self.transfer_failures: the rigs whose array tasks failed, or the rsync job
+    # if it didn't end COMPLETED
     def transfer_data(self, script_type):
-        self.set_start_time('transfer')
         print('\nData Transfer from RPis to NEMO...\n')
+        with self.profiler.stage('transfer') as record:
+            bytes_before = folder_bytes(self.raw_data_path)
 
-        shell_script_content = self.sbatch_scripts(script_type)
-
-        job_id = self.shell_script_run(shell_script_content)
-        self.check_job_completed(job_id)
+            if script_type == 'array_transfer':
+                # array tasks transfer one rig each (or several, for very many rigs), read from a manifest of IPs
+                rigs = [int(rig) for rig in self.rig_num]
+                record['failed'] = self.run_array('transfer', 'array_transfer', list(zip(self.IPs, rigs)), rigs)
+            else:
+                job_id = self.shell_script_run(self.sbatch_scripts(script_type))
+                self.profiler.add_job('transfer', job_id, script=script_type)
+                self.check_job_completed(job_id)
+                state = self.job_state(job_id)
+                record['failed'] = [] if state == 'COMPLETED' else [f'rsync job {job_id} ({state})']
+                if record['failed']:
+                    print(f'\tTransfer failed: rsync job {job_id} ended {state}')
+            self.transfer_failures = record['failed']
 
-        self.set_end_time('transfer')
+            record['bytes'] = folder_bytes(self.raw_data_path) - bytes_before
 
     def sleap_prediction(self, prediction_type):
 
         if prediction_type == 'still':
             print('\nSLEAP predictions of pupae locations...')
-            script_content = self.sbatch_scripts('sleap_still')
-            job_id = self.shell_script_run(script_content)
-            self.check_job_completed(job_id)
-
-            self.set_end_time('process')
+            images = self.sleap_images()
+            if self.resume: # existing predictions are kept: only the panoramas without one go to SLEAP
+                images = [f'{self.raw_data_path}/{name}.jpg' for name in self.missing_predictions()]
+            if images is not None and not images:
+                print('\tNothing for SLEAP: every panorama has a prediction or a confident precount')
+                return
+            with self.profiler.stage('sleap_still') as record:
+                record['frames'] = len(images) if images is not None else len([f for f in os.listdir(self.raw_data_path) if f.endswith('.jpg')])
+                script_content = self.sbatch_scripts('sleap_still', images=images)
+                job_id = self.shell_script_run(script_content)
+                self.profiler.add_job('sleap_still', job_id, script='sleap_still', size=record['frames'])
+                self.check_job_completed(job_id)
 
         if prediction_type == 'video':
             print('\nSLEAP predictions of videos...')
-            script_content = self.sbatch_scripts('sleap_video')
-            job_id = self.shell_script_run(script_content)
-            self.check_job_completed(job_id)
-
-            self.set_end_time('process')
-
-    def shell_script_run(self, shell_script_content):
+            with self.profiler.stage('sleap_video') as record:
+                sizes = [os.path.getsize(path) for path in self.video_file_paths]
+                record['bytes'] = sum(sizes)
+                record['failed'] = self.run_array('sleap_video', 'sleap_video', list(zip(self.video_file_paths, self.names)), self.names, sizes)  # one array task per video
+
+    # run an array stage to the end: submit it, wait, then resubmit only the tasks that failed, timed out or ran out of
+    # memory (with retry_bump more memory/time for the latter two) until they succeed or array_retries is used up.
+    # Returns the tags of the items whose tasks still failed
+    def run_array(self, stage, script_type, rows, tags, sizes=None):
+        script, submitted = self.submit_array(stage, script_type, rows, tags, sizes)
+        res = dict(self.requested.get(script_type, {}))
+        running = [(job_id, chunk, None) for job_id, chunk in submitted]  # None: all of the chunk's tasks
+
+        for attempt in range(self.array_retries + 1):
+            failed = []  # (chunk, task, state)
+            for job_id, chunk, tasks in running:
+                self.check_job_completed(job_id)
+                states = array_task_states(job_id)
+                failed += [(chunk, task, states[task]) for task in (tasks or range(1, chunk.n_tasks + 1)) if states.get(task) in RETRY_STATES]
+            if not failed or attempt == self.array_retries:
+                break
+
+            failed_states = {state for chunk, task, state in failed}
+            if res and self.retry_bump and self.retry_bump != 1:
+                if 'OUT_OF_MEMORY' in failed_states:
+                    res['mem_mb'] = int(res['mem_mb'] * self.retry_bump)
+                if 'TIMEOUT' in failed_states:
+                    res['time_min'] = int(res['time_min'] * self.retry_bump)
+            print(f'\tResubmitting {len(failed)} failed task(s) of {stage} ({", ".join(sorted(failed_states))}), retry {attempt + 1} of {self.array_retries}')
+
+            running = []
+            for chunk in {id(chunk): chunk for chunk, task, state in failed}.values():
+                retry = sorted(task for c, task, state in failed if c is chunk)
+                job_id = self.shell_script_run(script, chunk.sbatch_options(retry) + (sbatch_options(res) if res else []))
+                self.profiler.add_job(stage, job_id, {task: self.task_tag(chunk, task, tags) for task in retry}, script=script_type)
+                running.append((job_id, chunk, retry))
+
+        failed_tags = [self.task_tag(chunk, task, tags) for chunk, task, state in failed]
+        if failed:
+            print(f'\t{stage}: {len(failed)} task(s) still failed after {self.array_retries} retries: {", ".join(str(t) for t in failed_tags)}')
+        return failed_tags
+
+    def task_tag(self, chunk, task, tags):
+        items = chunk.items(task)
+        return tags[items[0]] if len(items) == 1 else ','.join(str(tags[i]) for i in items)
+
+    # submit an array stage with its items in a manifest, one tab-separated row per item (tags name them in the profiler);
+    # split over several arrays beyond MaxArraySize. Returns the script and [(job_id, chunk)], one per array submission
+    def submit_array(self, stage, script_type, rows, tags, sizes=None):
+        out_path = self.save_path if self.save_path else self.predictions_path
+        manifest = write_manifest(f'{out_path}/manifests/{script_type}_{datetime.now():%Y%m%d_%H%M%S}.tsv', rows)
+        if self.max_array_size is None:
+            self.max_array_size = max_array_size()
+        chunks = plan_array(len(rows), self.max_array_size, self.array_items_per_task, self.max_arrays)
+        if not chunks:
+            return None, []
+
+        # the task tag is the item's tag, or its items' tags joined by commas; a task's size is the sum of its items'
+        task_items = [(chunk, task, chunk.items(task)) for chunk in chunks for task in range(1, chunk.n_tasks + 1)]
+        task_sizes = {self.task_tag(chunk, task, tags): sum(sizes[i] for i in items) for chunk, task, items in task_items} if sizes else {}
+
+        script = self.sbatch_scripts(script_type, manifest=manifest, items_per_task=chunks[0].items_per_task,
+                                     size=max(task_sizes.values()) if task_sizes else None)
+        submitted = []
+        for chunk in chunks:
+            job_id = self.shell_script_run(script, chunk.sbatch_options())
+            tasks = {task: self.task_tag(chunk, task, tags) for c, task, items in task_items if c is chunk}
+            self.profiler.add_job(stage, job_id, tasks, script=script_type, sizes={tag: task_sizes[tag] for tag in tasks.values()} if task_sizes else None)
+            submitted.append((job_id, chunk))
+        print(f'\t{len(rows)} item(s) from {manifest}: {len(chunks)} array job(s), {chunks[0].items_per_task} item(s) per task')
+        return script, submitted
+
+    def shell_script_run(self, shell_script_content, sbatch_options=None):
         # Create a temporary file to hold the SBATCH script
         with tempfile.NamedTemporaryFile(mode="w", delete=False) as tmp_script:
             tmp_script.write(shell_script_content)
             tmp_script_path = tmp_script.name
 
         # Submit the SBATCH script
-        process = subprocess.run(["sbatch", tmp_script_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        process = subprocess.run(["sbatch", *(sbatch_options or []), tmp_script_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
 
         # Optionally, delete the temporary file after submission
         os.unlink(tmp_script_path)
@@ -294,27 +565,39 @@ class Experiment:
 
     # Function to check if the array job is completed
     def is_job_completed(self, job_id):
-        cmd = ["sacct", "-j", f"{job_id}", "--format=JobID,State", "--noheader"]
+        cmd = ["sacct", "-j", f"{job_id}", "--format=JobID,State", "--noheader", "--parsable2"] # parsable: states like OUT_OF_MEMORY aren't cut to 10 characters
         result = subprocess.run(cmd, stdout=subprocess.PIPE, text=True)
         lines = result.stdout.strip().split('\n')
 
-        # Initialize flags
+        # Initialize flags; a job sacct doesn't list yet (just submitted) isn't completed
         all_completed = True
+        listed = False
 
         for line in lines:
-            parts = line.split()
-            if len(parts) < 2:
+            parts = line.split('|')
+            if len(parts) < 2 or not parts[1]:
                 continue  # Skip any malformed lines
 
-            job_id_part, job_state = parts[0], parts[1]
+            job_id_part, job_state = parts[0], parts[1].split()[0]
 
             # Check for the main job ID and any array tasks
             if job_id_part == job_id or "_" in job_id_part:  # This line is modified to also consider the main job
-                if job_state not in ["COMPLETED", "FAILED", "CANCELLED"]:
+                listed = True
+                if job_state not in TERMINAL_STATES: # TIMEOUT, OUT_OF_MEMORY, ... are finished too
                     all_completed = False
                     break
 
-        return all_completed
+        return all_completed and listed
+
+    # state of a (non-array) job from sacct, e.g. 'RUNNING', 'COMPLETED', 'FAILED'; None while sacct doesn't list it yet
+    def job_state(self, job_id):
+        cmd = ["sacct", "-j", f"{job_id}", "-X", "--format=JobID,State", "--noheader", "--parsable2"]
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, text=True)
+        for line in result.stdout.strip().split('\n'):
+            job, _, state = line.partition('|')
+            if job == str(job_id) and state:
+                return state.split()[0] # 'CANCELLED by 123' -> 'CANCELLED'
+        return None
 
     def check_job_completed(self, job_id, initial_wait=120, wait=30):
         seconds = initial_wait
@@ -332,9 +615,14 @@ class Experiment:
 
     # generate and crop mp4 videos for each directory
     def run_commands_in_directory(self, directory_path, save_path):
+        # sequences already cropped on the Pi by the capture agent (capture.py) only need encoding
+        if os.path.exists(f'{directory_path}/{MARKER}'):
+            subprocess.run(f"ffmpeg -framerate 7 -pattern_type glob -i '{directory_path}/*.jpg' -c:v libx264 -pix_fmt yuv420p {save_path}.mp4", shell=True)
+            return
+
         # Define the commands
         generate_mp4 = f"ffmpeg -framerate 7 -pattern_type glob -i '{directory_path}/*.jpg' -c:v libx264 -pix_fmt yuv420p {directory_path}_raw.mp4"
-        crop_mp4 = f"ffmpeg -i {directory_path}_raw.mp4 -filter:v 'crop=1750:1750:1430:360' {save_path}.mp4"
+        crop_mp4 = f"ffmpeg -i {directory_path}_raw.mp4 -filter:v '{crop_filter(self.crop)}' {save_path}.mp4"
         remove_uncropped = f"rm {directory_path}_raw.mp4"
 
         # Run the commands using subprocess
@@ -352,7 +640,6 @@ class Experiment:
         return os.listdir(folder_path)
         
     def crop_mp4_convert(self):
-        self.set_start_time('process')
         print('\nConverting .jpgs to .mp4...\n')
 
         base_path = self.raw_data_path
@@ -364,13 +651,20 @@ class Experiment:
         if directory_contents:
             print(f"Processing each directory in {base_path}:")
             for directory in directory_contents:
+                # encoded and cropped on the Pi (capture.py --mode mp4): already what we'd make
+                if directory.endswith('.mp4') and os.path.isfile(f'{base_path}/{directory}'):
+                    print(f"\nAlready encoded on the Pi: {base_path}/{directory}")
+                    shutil.move(f'{base_path}/{directory}', f'{save_path}/{directory}')
+                    continue
                 print(f"\nProcessing: {base_path}/{directory}")
-                self.run_commands_in_directory(f'{base_path}/{directory}', f'{save_path}/{directory}')
+                with self.profiler.stage('mp4_convert', rig=directory) as record:
+                    if os.path.isdir(f'{base_path}/{directory}'):
+                        record['frames'] = len([f for f in os.listdir(f'{base_path}/{directory}') if f.endswith('.jpg')])
+                        record['bytes'] = folder_bytes(f'{base_path}/{directory}')
+                    self.run_commands_in_directory(f'{base_path}/{directory}', f'{save_path}/{directory}')
         else:
             print("No directories found.")
 
-        self.set_end_time('process')
-
         
     # extract frames from video and crop centre 150 pixels
     def extract_frames(self, video_path, interval=1, save_path='', crop=[525, 675], stop_frame = 250): #250
@@ -381,6 +675,8 @@ class Experiment:
         :param interval: Interval of frames to extract (1 = every frame, 2 = every other frame, etc.)
         """
 
+        import cv2
+
         frames = []
         vidcap = cv2.VideoCapture(video_path)
         if not vidcap.isOpened():
@@ -391,8 +687,8 @@ class Experiment:
         success, image = vidcap.read()
         count = 0
 
-        while success:
-            if count <= stop_frame and (count % interval == 0):  # Save frame every 'interval' frames
+        while success and count <= stop_frame:
+            if count % interval == 0:  # Save frame every 'interval' frames
                 frames.append(image)
             success, image = vidcap.read()
             count += 1
@@ -411,8 +707,32 @@ class Experiment:
 
         return(frames)
 
-    def stitch_images(self, frames, save_path, name, tile_config=None, sequence_path=None):
+    # extract the centre strips of one revolution of the vial, at the interval and period estimated from the video itself
+    # returns (strips, Rotation); falls back to the fixed extraction (every 5th frame up to 250) if no revolution is found
+    def extract_revolution(self, video_path, save_path='', crop=[525, 675]):
+        import cv2
+
+        strips, rotation = read_revolution(video_path, crop=crop)
+        if rotation is None:
+            if not strips:
+                print(f'Could not open video for frame extraction: {video_path}')
+                return strips, rotation
+            print(f'No rotation period found in {video_path}: using every 5th frame up to 250')
+            frames = self.extract_frames(video_path, interval=5, save_path=save_path, crop=crop, stop_frame=250)
+            return [frame[:, crop[0]:crop[1]] for frame in frames], Rotation.nominal()
+
+        print(f'Rotation: {rotation.period:.1f} frames at {rotation.px_per_frame:.2f} px/frame, {len(strips)} strips')
+        sequence_path = self.get_sequence_path(video_path, save_path)
+        os.makedirs(sequence_path, exist_ok=True)
+        for i, strip in enumerate(strips):
+            cv2.imwrite(f'{sequence_path}/{str(i).zfill(3)}.jpg', strip)
+
+        return strips, rotation
+
+    def stitch_images(self, frames, save_path, name, tile_config=None, sequence_path=None, rotation=None, fingerprint=None):
         path = sequence_path if sequence_path else self.get_sequence_path(name, save_path)
+        rotation = rotation or Rotation.nominal()
+        calibration = None
 
         print(f'Stitching {len(frames)} frames together...')
 
@@ -422,7 +742,7 @@ class Experiment:
             "order": "[Right & Down]",
             "grid_size_x": f"{(len(frames))}",
             "grid_size_y": "1",
-            "tile_overlap": "86",
+            "tile_overlap": f"{rotation.tile_overlap(frames[0].shape[1])}",
             "first_file_index_i": "0",
             "directory": f'{path}',
             "file_names": "{iii}.jpg",
@@ -440,7 +760,14 @@ class Experiment:
         # if tile_config=True, stitch based on tile configuration file
         if(tile_config!=None):
 
-            self.get_tile_config(path)
+            # place the strips from the rotator's calibration if it still fits this video, otherwise register them (and calibrate from that)
+            if self.stitch_calibration and fingerprint:
+                calibration = self.stitch_calibration.lookup(self.rotator_IP, fingerprint, rotation)
+            positions = None
+            if calibration:
+                print(f"\tPlacing strips from the stitch calibration of {calibration['calibrated']}")
+                rotation, positions = self.stitch_calibration.apply(calibration, rotation)
+            self.get_tile_config(path, rotation, len(frames), positions)
 
             args = {
                 "type": "[Positions from file]",
@@ -451,7 +778,7 @@ class Experiment:
                 "regression_threshold": "0.30",
                 "max/avg_displacement_threshold": "2.50",
                 "absolute_displacement_threshold": "3.50",
-                "compute_overlap": True,
+                "compute_overlap": calibration is None,
                 "computation_parameters": "[Save computation time (but use more RAM)]",
                 "image_output": "[Write to disk]",
                 "output_directory": f'{path}'
@@ -460,10 +787,17 @@ class Experiment:
         # run plugin in headless Fiji
         self.ij.py.run_plugin(plugin, args)
 
+        # a registered stitch becomes the rotator's calibration for the next videos
+        if tile_config != None and calibration is None and self.stitch_calibration and fingerprint:
+            registered = read_tile_positions(f'{path}/TileConfiguration.registered.txt')
+            if self.stitch_calibration.update(self.rotator_IP, fingerprint, registered, rotation, video=name):
+                print(f'\tStitch calibration of {self.rotator_IP} updated from {name}')
+
         # Fiji stitcher saves output as separate 8-bit R, G, and B images
         # merge them together and save here
 
         # Open the 8-bit grayscale TIFF images
+        from PIL import Image
         image_r = Image.open(f'{path}/img_t1_z1_c1')
         image_g = Image.open(f'{path}/img_t1_z1_c2')
         image_b = Image.open(f'{path}/img_t1_z1_c3')
@@ -471,8 +805,8 @@ class Experiment:
         # Merge the images into one RGB image
         image_rgb = Image.merge('RGB', (image_r, image_g, image_b))
 
-        # Define crop box with left, upper, right, and lower coordinates; heuristically defined by looking at uncropped images
-        crop_box = (0, 0, 1045, image_rgb.height)  # Right coordinate is 1050, lower coordinate is the height of the image
+        # Define crop box with left, upper, right, and lower coordinates: one revolution wide (1050 px for the fixed 51 strips)
+        crop_box = (0, 0, min(rotation.width, image_rgb.width), image_rgb.height)
 
         # Crop the image
         cropped_image_rgb = image_rgb.crop(crop_box)
@@ -489,26 +823,20 @@ class Experiment:
         return(f'{self.raw_data_path}/{name}.jpg')
 
     def unwrap_videos(self, tile_config=True):
-        self.set_start_time('process')
-
         video_path = self.raw_data_path
 
         # batch process videos in folder
         paths = []
         names = []
         if(os.path.isdir(video_path)):
-            video_files = [f'{video_path}/{f}' for f in os.listdir(video_path) if os.path.isfile(os.path.join(video_path, f)) and not (f.endswith('.txt') or f=='.DS_Store' or f.endswith('.jpg'))]
+            video_files = [f'{video_path}/{f}' for f in os.listdir(video_path) if os.path.isfile(os.path.join(video_path, f)) and self.is_pupae_video(f)]
 
             for video_file_path in video_files:
-                sequence_path = self.get_sequence_path(video_file_path, video_path)
-                frames = self.extract_frames(video_file_path, interval=5, save_path=video_path)
-                name = os.path.basename(video_file_path)
-                if not frames:
-                    print(f'Skipping {name}: 0 frames extracted.')
+                path = self.unwrap_video(video_file_path, tile_config=tile_config)
+                if path is None:
                     continue
-                path = self.stitch_images(frames=frames, save_path=video_path, tile_config=tile_config, name=name, sequence_path=sequence_path)
 
-                names.append(name) # return file name for subsequent saving
+                names.append(os.path.basename(video_file_path)) # return file name for subsequent saving
                 paths.append(path) # return all paths of unwrapped videos for subsequent processing
 
             if video_files:
@@ -516,29 +844,199 @@ class Experiment:
 
         return paths, names
 
-    # *** NEED TO IMPLEMENT DIRECT WRITING TO CSV ***
+    # anything in raw_data that isn't a panorama or a note is a rotator video
+    def is_pupae_video(self, file_name):
+        return not (file_name.endswith('.txt') or file_name=='.DS_Store' or file_name.endswith('.jpg'))
+
+    # unwrap one rotating vial video into {raw_data_path}/{name}.jpg; returns the panorama path, or None if no frames could be read
+    def unwrap_video(self, video_file_path, tile_config=True):
+        video_path = os.path.dirname(video_file_path)
+        sequence_path = self.get_sequence_path(video_file_path, video_path)
+        name = os.path.basename(video_file_path)
+        if self.journal and self.journal.item_done('unwrap', name):
+            print(f'Skipping {name}: already unwrapped')
+            return self.journal.item_output('unwrap', name)
+        self.start_fiji() # headless Fiji for stitching, on the first video that needs it
+        with self.profiler.stage('extract_frames', video=name) as record:
+            frames, rotation = self.extract_revolution(video_file_path, save_path=video_path, crop=self.strip_crop)
+            record['bytes'], record['frames'] = os.path.getsize(video_file_path), len(frames)
+            if rotation is not None:
+                record['rotation'] = rotation.to_dict()
+        if not frames:
+            print(f'Skipping {name}: 0 frames extracted.')
+            return None
+        with self.profiler.stage('stitch', video=name) as record:
+            record['frames'] = len(frames)
+            fingerprint = video_fingerprint(video_file_path, self.strip_crop) if self.stitch_calibration else None
+            path = self.stitch_images(frames=frames, save_path=video_path, tile_config=tile_config, name=name, sequence_path=sequence_path, rotation=rotation, fingerprint=fingerprint)
+        if self.journal:
+            self.journal.record_item('unwrap', name, path)
+        return path
+
+    # provisional pupae count of one panorama from its dark blobs (precount.py), saved into precounts.csv;
+    # returns the panorama if it should still go to SLEAP, else None
+    def precount_panorama(self, image_path):
+        name = os.path.basename(image_path)[:-len('.jpg')]
+        result = count_image(image_path)
+        with self.precount_lock:
+            path = f'{self.predictions_path}/precounts.csv'
+            df = read_precounts(path)
+            df = pd.concat([df[df['name'] != name], pd.DataFrame([{'name': name, 'image': image_path, **(result or {})}])], ignore_index=True)
+            write_precounts(path, df)
+        if self.journal:
+            self.journal.record_item('precount', name, path)
+        confidence = result['precount_confidence'] if result else None
+        return image_path if self.triage_confidence is None or needs_sleap(name, confidence, self.triage_confidence, self.triage_sample) else None
+
+    # precounts of every panorama in raw_data that doesn't have one yet, counted in parallel (OpenCV releases the GIL)
+    def precount_panoramas(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        path = f'{self.predictions_path}/precounts.csv'
+        done = set(read_precounts(path)['name']) if self.resume else set() # --restart counts every panorama again
+        images = [f'{self.raw_data_path}/{f}' for f in sorted(os.listdir(self.raw_data_path)) if f.endswith('.jpg') and f[:-len('.jpg')] not in done]
+        with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as pool:
+            results = list(pool.map(count_image, images))
+
+        rows = [{'name': os.path.basename(image)[:-len('.jpg')], 'image': image, **(result or {})} for image, result in zip(images, results)]
+        if rows:
+            df = read_precounts(path)
+            df = pd.concat([df[~df['name'].isin([row['name'] for row in rows])], pd.DataFrame(rows)], ignore_index=True)
+            write_precounts(path, df)
+        images = self.sleap_images()
+        to_sleap = f'{len(images)} to SLEAP' if images is not None else 'all to SLEAP (no triage)'
+        print(f'\tPrecounts: {len(rows)} new panorama(s), {to_sleap}')
+
+    # panoramas SLEAP should predict: with triage on, those without a confident precount plus the audit sample; None means all of them
+    def sleap_images(self):
+        path = f'{self.predictions_path}/precounts.csv'
+        if self.triage_confidence is None or not os.path.exists(path):
+            return None
+        confidence = read_precounts(path).set_index('name')['precount_confidence'].to_dict()
+        names = [f[:-len('.jpg')] for f in sorted(os.listdir(self.raw_data_path)) if f.endswith('.jpg')]
+        return [f'{self.raw_data_path}/{name}.jpg' for name in names
+                if needs_sleap(name, confidence.get(name), self.triage_confidence, self.triage_sample)]
+
+    # draws predicted points and skeleton edges onto each panorama, writing {name}.predictions.jpg, plus QC contact sheets
+    def render_previews(self, sheet_size=48):
+        from .render import render_prediction_preview, contact_sheet
+        previews = []
+        for f in sorted(os.listdir(self.predictions_path)):
+            if not f.endswith('.json') or f.startswith('.'):
+                continue
+            name = f[:-len('.json')]
+            json_path = f'{self.predictions_path}/{f}'
+            image_path = f'{self.raw_data_path}/{name}.jpg'
+            preview_path = f'{self.predictions_path}/{name}.predictions.jpg'
+            if not os.path.exists(image_path):
+                continue
+
+            # only re-render if the predictions are newer than the existing preview
+            if not os.path.exists(preview_path) or os.path.getmtime(preview_path) < os.path.getmtime(json_path):
+                render_prediction_preview(json_path, image_path, preview_path, marker_size=2)
+            previews.append(preview_path)
+
+        if previews:
+            sheets_path = self.make_dir(f'{self.predictions_path}/contact_sheets')
+            for i in range(0, len(previews), sheet_size):
+                contact_sheet(previews[i:i + sheet_size], f'{sheets_path}/sheet_{i // sheet_size + 1:03d}.jpg')
+            print(f'\tRendered {len(previews)} prediction previews into {sheets_path}')
+
+    # summarise one SLEAP prediction file: number of instances in the first labelled frame and their confidence scores
+    def summarise_prediction(self, prediction_path):
+        with open(prediction_path, 'r') as file:
+            data = json.load(file)
+
+        labels = data.get('labels', [])
+        instances = labels[0]['_instances'] if labels else []
+
+        # predicted instances carry an instance-level score; fall back to the mean point score if it is missing
+        scores = []
+        for instance in instances:
+            score = instance.get('score')
+            if score is None:
+                point_scores = [point['score'] for point in instance.get('_points', {}).values() if point.get('score') is not None]
+                score = np.mean(point_scores) if point_scores else None
+            if score is not None:
+                scores.append(float(score))
+
+        if scores:
+            return [len(instances), np.mean(scores), np.min(scores), np.max(scores)]
+        return [len(instances), np.nan, np.nan, np.nan]
+
+    # writes pupae counts to csv incrementally: only prediction files that are new or changed (by mtime and size) are parsed.
+    # Counts are SLEAP's; with triage on, the vials it held back from SLEAP get a provisional row with their precount
+    # (count_source 'precount') until SLEAP predicts them. SLEAP rows carry the vial's precount alongside
     def write_predictions(self):
-        counts = []
+        columns = ['pupae_count', 'dataset', 'score_mean', 'score_min', 'score_max', 'count_source', 'precount', 'precount_confidence']
+        counts_path = f'{self.predictions_path}/pupae_counts.csv'
+        precounts = read_precounts(f'{self.predictions_path}/precounts.csv')
+        index_path = f'{self.predictions_path}/.pupae_counts_index.json'
+
+        # rows already in pupae_counts.csv, {path: [mtime, size]} for prediction files and {panorama: ['precount', count,
+        # confidence]} for provisional rows; ignored if the csv itself is gone
+        index = {}
+        if os.path.exists(index_path) and os.path.exists(counts_path):
+            with open(index_path, 'r') as f:
+                index = json.load(f)
+
+        current = {}
         if(os.path.isdir(self.predictions_path)):
-            video_files = [f'{self.predictions_path}/{f}' for f in os.listdir(self.predictions_path) if os.path.isfile(os.path.join(self.predictions_path, f)) and (f.endswith('.json'))]
-            for video_file in video_files:
-                with open(video_file, 'r') as file:
-                    data = json.load(file)
-
-                    pupae_count = len(data['labels'][0]['_instances'])
-                    #print([pupae_count, video_file])
-                    counts.append([pupae_count, video_file])
-
-        df = pd.DataFrame(counts, columns = ['pupae_count', 'dataset'])
-        df.to_csv(f'{self.predictions_path}/pupae_counts.csv', index=False)
-
-        # body_x, body_y = data['labels'][0]['_instances'][0]['_points']['0']['x'], data['labels'][0]['_instances'][0]['_points']['0']['y']
-        # tail_x, tail_y = data['labels'][0]['_instances'][0]['_points']['1']['x'], data['labels'][0]['_instances'][0]['_points']['1']['y']
-        # head_x, head_y = data['labels'][0]['_instances'][0]['_points']['2']['x'], data['labels'][0]['_instances'][0]['_points']['2']['y']
-
-        self.set_end_time('processing')
+            for entry in os.scandir(self.predictions_path):
+                if entry.is_file() and entry.name.endswith('.json') and not entry.name.startswith('.'):
+                    stat = entry.stat()
+                    current[f'{self.predictions_path}/{entry.name}'] = [stat.st_mtime, stat.st_size]
+
+        if self.triage_confidence is not None:
+            predicted = {os.path.basename(path)[:-len('.json')] for path in current}
+            for row in held_back(precounts, self.triage_confidence, self.triage_sample).itertuples():
+                if row.name not in predicted:
+                    current[row.image] = ['precount', int(row.precount), float(row.precount_confidence)]
+
+        new_files = [path for path in current if path not in index]
+        changed_files = [path for path in current if path in index and index[path] != current[path]]
+        removed_files = [path for path in index if path not in current]
+
+        precount_of = precounts.set_index('name')
+        def sleap_row(path):
+            summary = self.summarise_prediction(path)
+            name = os.path.basename(path)[:-len('.json')]
+            precount = precount_of.loc[name, ['precount', 'precount_confidence']].tolist() if name in precount_of.index else [np.nan, np.nan]
+            return [summary[0], path] + summary[1:] + ['sleap'] + precount
+
+        rows = []
+        for path in new_files + changed_files:
+            if current[path][0] == 'precount':
+                rows.append([current[path][1], path, np.nan, np.nan, np.nan] + current[path])
+            else:
+                rows.append(sleap_row(path))
+        new_df = pd.DataFrame(rows, columns=columns)
+
+        # csvs from before the count_source/precount columns are rewritten once
+        migrate = bool(index) and list(pd.read_csv(counts_path, nrows=0).columns) != columns
+        if not index or changed_files or removed_files or migrate:
+            # upsert: replace rows of changed files and drop rows of deleted ones
+            df = new_df
+            if index:
+                old_df = pd.read_csv(counts_path).reindex(columns=columns)
+                old_df = old_df[old_df['dataset'].isin(set(index) - set(changed_files + removed_files))]
+                old_df['count_source'] = old_df['count_source'].fillna('sleap')
+                if migrate: # rows from before precounts are all SLEAP's: add each vial's precount where there is one
+                    names = old_df['dataset'].map(lambda path: os.path.basename(str(path))[:-len('.json')])
+                    old_df['precount'] = names.map(precount_of['precount'])
+                    old_df['precount_confidence'] = names.map(precount_of['precount_confidence'])
+                df = pd.concat([old_df, new_df], ignore_index=True) if rows else old_df
+            df.to_csv(counts_path, index=False)
+        elif rows:
+            # only new files: append their rows
+            new_df.to_csv(counts_path, mode='a', header=False, index=False)
+
+        n_provisional = sum(1 for value in current.values() if value[0] == 'precount')
+        print(f'\tPupae counts: {len(new_files)} new, {len(changed_files)} changed, {len(removed_files)} removed rows ({n_provisional} provisional from precounts)')
+
+        with open(index_path, 'w') as f:
+            json.dump(current, f)
 
-        
     # convert tracking JSONs to CSVs
     def tracks_json_to_csv(self):
 
@@ -549,8 +1047,10 @@ class Experiment:
             data_labels = data['labels']
 
             # Generate column names based on body parts
-            columns = ['label_id', 'frame'] + [f'{coord}_{part}' for part in self.skel_parts for coord in ['x', 'y', 'score']]
+            columns = ['label_id', 'frame', 'track'] + [f'{coord}_{part}' for part in self.skel_parts for coord in ['x', 'y', 'score']]
             
+            store = TrackStoreWriter(self.skel_parts, self.track_store_path(name)) # memory-mapped store, filled alongside the CSV
+
             # Open a CSV file to write to
             with open(f'{self.predictions_path}/{name}.tracks.csv', mode='w', newline='') as file:
                 writer = csv.writer(file)
@@ -574,75 +1074,107 @@ class Experiment:
                             coords[part_name] = {'x': point_details['x'], 'y': point_details['y'], 'score': point_details['score']}
                         
                         # Write row data
-                        row = [video_id, frame_idx]
+                        row = [video_id, frame_idx, self.track_id(instance)]
                         for part in self.skel_parts:
                             row.extend([coords[part]['x'], coords[part]['y'], coords[part]['score']])
                         writer.writerow(row)
+                        store.append(row)
+
+            store.close()
+
+    ##############################
+    # queries on exported tracks
+    ##############################
+    def track_store_path(self, name):
+        return f'{self.predictions_path}/{name}.tracks.store'
+
+    def track_store(self, name):
+        return TrackStore(self.track_store_path(name))
+
+    # all instances with start <= frame < stop in video {name}
+    def query_frames(self, name, start, stop):
+        store = self.track_store(name)
+        return store.to_frame(store.frames(start, stop))
+
+    # one track of video {name}, optionally limited to start <= frame < stop
+    def query_track(self, name, track, start=None, stop=None):
+        store = self.track_store(name)
+        return store.to_frame(store.track(track, start, stop))
+
+    # track index of an instance in a SLEAP JSON export, -1 if untracked; sleap-convert writes it as a string index
+    # into the file's tracks ('3'), like frame['video'] and the _points keys
+    def track_id(self, instance):
+        track = instance.get('track')
+        if isinstance(track, str) and track.strip().isdigit():
+            return int(track)
+        return track if isinstance(track, int) and not isinstance(track, bool) else -1
+
+    # compute per-track kinematics (speed, displacement, heading, body length) for each video, in bounded memory
+    def tracks_to_features(self, chunk_size=500000):
+        store_path = f'{self.predictions_path}/features'
+        for name in self.names:
+            print(f'Computing kinematics for {name}...')
+            write_features(f'{self.predictions_path}/{name}.tracks.csv', store_path, name, self.skel_parts, chunk_size=chunk_size)
 
+    # print stage timings and write them, with Slurm usage from sacct, to a metrics JSON next to the outputs
     def timing(self):
-        # calculate and print how long pipeline took
-
-        rsync_time = self.transfer_end_time - self.transfer_start_time
-        processing_time = self.process_end_time - self.process_start_time
-        total_time = self.process_end_time - self.transfer_start_time
-
-        # Convert duration to total seconds for formatting
-        rsync_seconds = int(rsync_time.total_seconds())
-        processing_seconds = int(processing_time.total_seconds())
-        total_seconds = int(total_time.total_seconds())
-
-        # Format durations as MM:SS
-        rsync_minutes, rsync_secs = divmod(rsync_seconds, 60)
-        processing_minutes, processing_secs = divmod(processing_seconds, 60)
-        total_minutes, total_secs = divmod(total_seconds, 60)
-
-        rsync_time_formatted = f'{rsync_minutes}:{rsync_secs:02d}'
-        processing_time_formatted = f'{processing_minutes}:{processing_secs:02d}'
-        total_time_formatted = f'{total_minutes}:{total_secs:02d}'
-
-
-        print('\n\n\n')
-        print(f'Rsync time: {rsync_time_formatted}')
-        print(f'Processing time: {processing_time_formatted}')
-        print(f'\nTotal time: {total_time_formatted}')
-
-    # collection of sbatch scripts for pipelines
-    def sbatch_scripts(self, script_type):
+        self.profiler.print_summary()
+        out_path = self.save_path if self.save_path else self.predictions_path
+        if out_path:
+            metrics_path = self.profiler.write(f'{out_path}/metrics/pipeline_{self.profiler.started:%Y%m%d_%H%M%S}.json')
+            print(f'\tMetrics written to {metrics_path}')
+        self.resources.record_jobs(self.profiler.jobs, self.name) # usage of this run's jobs sizes the next ones
+
+    # Slurm requests for an sbatch script, sized by its input: jpgs for sleap_still, the largest video for sleap_video
+    # (one request covers every array task); transfers are sized from their history alone
+    def slurm_resources(self, script_type, images=None, size=None):
+        if size is None and script_type == 'sleap_still':
+            size = len(images) if images is not None else len([f for f in os.listdir(self.raw_data_path) if f.endswith('.jpg')])
+        if size is None and script_type == 'sleap_video':
+            size = max((os.path.getsize(path) for path in self.video_file_paths), default=None)
+        res = self.resources.recommend(script_type, size)
+        self.requested[script_type] = res
+        print(f"\t{script_type}: --mem={res['mem_mb']}M --cpus-per-task={res['cpus']} --time={format_time(res['time_min'])} [{res['source']}]")
+        return res
+
+    # collection of sbatch scripts for pipelines; images limits sleap_still to those panoramas (default: all in raw_data).
+    # Array scripts (array_transfer, sleap_video) read their items from a manifest; --array is given at submission (submit_array)
+    def sbatch_scripts(self, script_type, images=None, manifest=None, items_per_task=1, size=None):
+        res = self.slurm_resources(script_type, images, size)
+        mem, cpus, run_time = f"{res['mem_mb']}M", res['cpus'], format_time(res['time_min'])
 
         # for array job transfer of plugcamera data from RPis directly to NEMO
         if(script_type=='array_transfer'):
-            IPs_string = ' '.join(self.IPs)
+            # manifest rows: IP, rig number
+            body = f"""
+echo $ip_var
+
+rsync -avzh --progress {self.remove_files}{self.rpi_username}@$ip_var:{self.video_path} "{self.raw_data_path}"
+rsync_status=$?
+
+# check rsync status and output file if it fails to allow user to easily notice
+if [ $rsync_status -ne 0 ]; then
+    # If rsync fails, create a file indicating failure and append the output of rsync
+    rsync -avzh --progress {self.remove_files}{self.rpi_username}@$ip_var:{self.video_path} "{self.raw_data_path}" 2> "FAILED-rsync_IP-$ip_var.out"
+else
+    # If rsync was successful, then and only then delete the data
+    ssh -n {self.rpi_username}@$ip_var "find data/ -mindepth 1 -type d -empty -delete"
+fi
+item_status=$rsync_status"""
+            loop = manifest_loop(manifest, ['ip_var', 'rig_var'], items_per_task, body, indent=' ' * 24).lstrip()
 
             script = f"""#!/bin/bash
                         #SBATCH --job-name=rsync_pis
                         #SBATCH --ntasks=1
-                        #SBATCH --cpus-per-task=4
-                        #SBATCH --array=1-{len(self.IPs)}
+                        #SBATCH --cpus-per-task={cpus}
                         #SBATCH --partition=ncpu
-                        #SBATCH --mem=10G
-                        #SBATCH --time=08:00:00
+                        #SBATCH --mem={mem}
+                        #SBATCH --time={run_time}
                         #SBATCH --mail-user=$(whoami)@crick.ac.uk
                         #SBATCH --mail-type=FAIL
 
-                        # convert ip_string to shell array
-                        IFS=' ' read -r -a ip_array <<< "{IPs_string}"
-                        ip_var="${{ip_array[$SLURM_ARRAY_TASK_ID-1]}}"
-
-                        # rsync using the IP address obtained above
-
-                        echo $ip_var
-
-                        rsync -avzh --progress {self.remove_files}{self.rpi_username}@$ip_var:{self.video_path} {self.raw_data_path}
-                        rsync_status=$?
-
-                        # check rsync status and output file if it fails to allow user to easily notice
-                        if [ $rsync_status -ne 0 ]; then
-                            # If rsync fails, create a file indicating failure and append the output of rsync
-                            rsync -avzh --progress {self.remove_files}{self.rpi_username}@$ip_var:{self.video_path} {self.raw_data_path} 2> "FAILED-rsync_IP-$ip_var.out"
-                        else
-                            # If rsync was successful, then and only then delete the data
-                            ssh {self.rpi_username}@$ip_var "find data/ -mindepth 1 -type d -empty -delete"
-                        fi
+                        # rsync each IP address of this task's manifest lines
+                        {loop}
                         """
 
         if(script_type=='pupae_transfer'):
@@ -650,27 +1182,34 @@ class Experiment:
             script = f"""#!/bin/bash
                         #SBATCH --job-name=rsync_pis
                         #SBATCH --ntasks=1
-                        #SBATCH --cpus-per-task=4
+                        #SBATCH --cpus-per-task={cpus}
                         #SBATCH --partition=ncpu
-                        #SBATCH --mem=10G
-                        #SBATCH --time=08:00:00
+                        #SBATCH --mem={mem}
+                        #SBATCH --time={run_time}
                         #SBATCH --mail-user=$(whoami)@crick.ac.uk
                         #SBATCH --mail-type=FAIL
 
                         # rsync using the IP address obtained above
                         rsync -avzh --progress {self.remove_files}{self.rpi_username}@{self.IPs}:{self.video_path} {self.raw_data_path}
                         rsync_status=$?
+                        exit $rsync_status
                         """
     
         if(script_type=='sleap_still'):
 
+            # panoramas predicted in the meantime are skipped, unless the pipeline was restarted to redo them
+            skip_predicted = f"""if [ -f "{self.predictions_path}/$name_var.json" ]; then
+                                echo "Skipping $name_var: already predicted"
+                                continue
+                            fi""" if self.resume else '# --restart: existing predictions are redone'
+
             script = f"""#!/bin/bash
                         #SBATCH --job-name=SLEAP_infer
                         #SBATCH --ntasks=1
-                        #SBATCH --time=08:00:00
-                        #SBATCH --mem=32G
+                        #SBATCH --time={run_time}
+                        #SBATCH --mem={mem}
                         #SBATCH --partition=ncpu
-                        #SBATCH --cpus-per-task=8
+                        #SBATCH --cpus-per-task={cpus}
                         #SBATCH --output=slurm-%j.out
                         #SBATCH --mail-user=$(whoami)@crick.ac.uk
                         #SBATCH --mail-type=FAIL
@@ -682,9 +1221,10 @@ class Experiment:
                         
                         conda activate sleap
 
-                        for video in {self.raw_data_path}/*.jpg
+                        for video in {' '.join(f'"{path}"' for path in images) if images else f'{self.raw_data_path}/*.jpg'}
                         do
                             name_var=$(basename "$video" .jpg)
+                            {skip_predicted}
                             echo "Processing jpg: $name_var"
                             echo "Full path: $video"
                             echo "Centroid model path: {self.centroid_path}"
@@ -693,27 +1233,33 @@ class Experiment:
 
                             sleap-track "$video" -m {self.centroid_path} -m {self.centered_instance_path} -o {self.predictions_path}/$name_var.predictions.slp
                             sleap-convert {self.predictions_path}/$name_var.predictions.slp -o {self.predictions_path}/$name_var.json --format json
-                            sleap-render {self.predictions_path}/$name_var.json --marker_size 2 --edge_is_wedge 1
-                            ffmpeg -i {self.predictions_path}/$name_var.json.avi -frames:v 1 {self.predictions_path}/$name_var.predictions.jpg
-                            rm {self.predictions_path}/$name_var.json.avi
                         done"""
 
         if(script_type=='sleap_video'):
 
-            num_videos = len(self.video_file_paths)
-
-            # join all paths together in one string that can be later split by the .sh script
-            video_file_paths_joined = ' '.join(self.video_file_paths)
-            names_joined = ' '.join(self.names)
+            # manifest rows: video path, name
+            body = f"""
+echo "Processing mp4: $name_var"
+echo "Full path to mp4: $path_var"
+echo "Centroid model path: {self.centroid_path}"
+echo "Centered instance model path: {self.centered_instance_path}"
+echo "Output path: {self.predictions_path}/$name_var.predictions.slp"
+echo "Output path: {self.predictions_path}/$name_var.tracks.slp"
+echo "Output path: {self.predictions_path}/$name_var.tracks.json"
+
+sleap-track "$path_var" -m "{self.centroid_path}" -m "{self.centered_instance_path}" -o "{self.predictions_path}/$name_var.predictions.slp" && \\
+sleap-track --tracking.tracker flow -o "{self.predictions_path}/$name_var.tracks.slp" "{self.predictions_path}/$name_var.predictions.slp" && \\
+sleap-convert "{self.predictions_path}/$name_var.tracks.slp" -o "{self.predictions_path}/$name_var.tracks.json" --format json
+item_status=$?"""
+            loop = manifest_loop(manifest, ['path_var', 'name_var'], items_per_task, body, indent=' ' * 24).lstrip()
 
             script = f"""#!/bin/bash
                         #SBATCH --job-name=slp-infer
                         #SBATCH --ntasks=1
-                        #SBATCH --cpus-per-task=16
-                        #SBATCH --array=1-{num_videos}
+                        #SBATCH --cpus-per-task={cpus}
                         #SBATCH --partition=ncpu
-                        #SBATCH --mem=64G
-                        #SBATCH --time=08:00:00
+                        #SBATCH --mem={mem}
+                        #SBATCH --time={run_time}
                         #SBATCH --mail-user=$(whoami)@crick.ac.uk
                         #SBATCH --mail-type=FAIL
 
@@ -723,87 +1269,22 @@ class Experiment:
 
                         conda activate sleap
 
-                        # convert ip_string to shell array
-                        IFS=' ' read -r -a path_array <<< "{video_file_paths_joined}"
-                        path_var="${{path_array[$SLURM_ARRAY_TASK_ID-1]}}"
-
-                        IFS=' ' read -r -a name_array <<< "{names_joined}"
-                        name_var="${{name_array[$SLURM_ARRAY_TASK_ID-1]}}"
-
-                        echo "Processing mp4: $name_var"
-                        echo "Full path to mp4: $path_var"
-                        echo "Centroid model path: {self.centroid_path}"
-                        echo "Centered instance model path: {self.centered_instance_path}"
-                        echo "Output path: {self.predictions_path}/$name_var.predictions.slp"
-                        echo "Output path: {self.predictions_path}/$name_var.tracks.slp"
-                        echo "Output path: {self.predictions_path}/$name_var.tracks.json"
-
-                        sleap-track $path_var -m {self.centroid_path} -m {self.centered_instance_path} -o {self.predictions_path}/$name_var.predictions.slp
-                        sleap-track --tracking.tracker flow -o {self.predictions_path}/$name_var.tracks.slp {self.predictions_path}/$name_var.predictions.slp
-                        sleap-convert {self.predictions_path}/$name_var.tracks.slp -o {self.predictions_path}/$name_var.tracks.json --format json
+                        # track each video of this task's manifest lines
+                        {loop}
                         """
 
         return script
 
-    def get_tile_config(self, sequence_path):
+    # tile positions for Fiji's stitcher: given (x, y) per strip, or one strip every rotation.step px (51 strips 21 px apart without a rotation)
+    def get_tile_config(self, sequence_path, rotation=None, n_tiles=None, positions=None):
+        rotation = rotation or Rotation.nominal()
+        positions = (positions or [(x, 0.0) for x in rotation.positions()])[:n_tiles]
 
         file_name = f"{sequence_path}/TileConfiguration.txt"
 
-        content = """# Define the number of dimensions we are working on
-        dim = 2
-
-        # Define the image coordinates
-        000.jpg; ; (0.0, 0.0)
-        001.jpg; ; (21.0, 0.0)
-        002.jpg; ; (42.0, 0.0)
-        003.jpg; ; (63.0, 0.0)
-        004.jpg; ; (84.0, 0.0)
-        005.jpg; ; (105.0, 0.0)
-        006.jpg; ; (126.0, 0.0)
-        007.jpg; ; (147.0, 0.0)
-        008.jpg; ; (168.0, 0.0)
-        009.jpg; ; (189.0, 0.0)
-        010.jpg; ; (210.0, 0.0)
-        011.jpg; ; (231.0, 0.0)
-        012.jpg; ; (252.0, 0.0)
-        013.jpg; ; (273.0, 0.0)
-        014.jpg; ; (294.0, 0.0)
-        015.jpg; ; (315.0, 0.0)
-        016.jpg; ; (336.0, 0.0)
-        017.jpg; ; (357.0, 0.0)
-        018.jpg; ; (378.0, 0.0)
-        019.jpg; ; (399.0, 0.0)
-        020.jpg; ; (420.0, 0.0)
-        021.jpg; ; (441.0, 0.0)
-        022.jpg; ; (462.0, 0.0)
-        023.jpg; ; (483.0, 0.0)
-        024.jpg; ; (504.0, 0.0)
-        025.jpg; ; (525.0, 0.0)
-        026.jpg; ; (546.0, 0.0)
-        027.jpg; ; (567.0, 0.0)
-        028.jpg; ; (588.0, 0.0)
-        029.jpg; ; (609.0, 0.0)
-        030.jpg; ; (630.0, 0.0)
-        031.jpg; ; (651.0, 0.0)
-        032.jpg; ; (672.0, 0.0)
-        033.jpg; ; (693.0, 0.0)
-        034.jpg; ; (714.0, 0.0)
-        035.jpg; ; (735.0, 0.0)
-        036.jpg; ; (756.0, 0.0)
-        037.jpg; ; (777.0, 0.0)
-        038.jpg; ; (798.0, 0.0)
-        039.jpg; ; (819.0, 0.0)
-        040.jpg; ; (840.0, 0.0)
-        041.jpg; ; (861.0, 0.0)
-        042.jpg; ; (882.0, 0.0)
-        043.jpg; ; (903.0, 0.0)
-        044.jpg; ; (924.0, 0.0)
-        045.jpg; ; (945.0, 0.0)
-        046.jpg; ; (966.0, 0.0)
-        047.jpg; ; (987.0, 0.0)
-        048.jpg; ; (1008.0, 0.0)
-        049.jpg; ; (1029.0, 0.0)
-        050.jpg; ; (1050.0, 0.0)"""
+        lines = ["# Define the number of dimensions we are working on", "dim = 2", "", "# Define the image coordinates"]
+        lines += [f"{str(i).zfill(3)}.jpg; ; ({x:.1f}, {y:.1f})" for i, (x, y) in enumerate(positions)]
+        content = "\n".join(lines)
 
         # Write the content to the file
         with open(file_name, "w") as file:
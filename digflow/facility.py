@@ -0,0 +1,72 @@
+import json
+import numpy as np
+
+# Physical layout the planners schedule into. The screen scripts fill incubators (one shelf per staging
+# date, `slots` vials per shelf); Design fills plugcamera shelves of rows x columns, one rack per staging day.
+DEFAULT_FACILITY = {
+    "incubators": [
+        {"name": 1, "racks": 3, "shelves_per_rack": 2, "slots": 24},
+        {"name": 2, "racks": 3, "shelves_per_rack": 2, "slots": 24},
+    ],
+    "plugcamera_shelf": {"rows": 12, "columns": 6, "rack_columns": 2},
+}
+
+INCUBATOR_FIELDS = ("racks", "shelves_per_rack", "slots")
+SHELF_FIELDS = ("rows", "columns", "rack_columns")
+
+def validate_facility(facility: dict) -> dict:
+    """Check a facility description and fill anything it leaves out from DEFAULT_FACILITY."""
+    incubators = facility.get("incubators", DEFAULT_FACILITY["incubators"])
+    if not incubators:
+        raise ValueError("Facility must describe at least one incubator")
+
+    default_inc = DEFAULT_FACILITY["incubators"][0]
+    checked = []
+    for i, inc in enumerate(incubators):
+        inc = {"name": inc.get("name", i + 1), **{k: int(inc.get(k, default_inc[k])) for k in INCUBATOR_FIELDS}}
+        for k in INCUBATOR_FIELDS:
+            if inc[k] < 1:
+                raise ValueError(f"Incubator {inc['name']}: '{k}' must be at least 1, got {inc[k]}")
+        checked.append(inc)
+    names = [inc["name"] for inc in checked]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Incubator names must be unique: {names}")
+
+    shelf = {k: int(facility.get("plugcamera_shelf", {}).get(k, DEFAULT_FACILITY["plugcamera_shelf"][k])) for k in SHELF_FIELDS}
+    if min(shelf.values()) < 1 or shelf["columns"] % shelf["rack_columns"] != 0:
+        raise ValueError(f"plugcamera_shelf needs positive sizes and whole racks (columns divisible by rack_columns): {shelf}")
+    return {"incubators": checked, "plugcamera_shelf": shelf}
+
+def load_facility(path=None) -> dict:
+    """Facility description from a JSON file, or the default two-incubator facility if path is None."""
+    if path is None:
+        return validate_facility(DEFAULT_FACILITY)
+    with open(path, "r") as f:
+        return validate_facility(json.load(f))
+
+def incubator_names(facility: dict) -> list:
+    return [inc["name"] for inc in facility["incubators"]]
+
+def incubator_capacities(facility: dict, controls_per_collection: int, per_incubator=None) -> list[int]:
+    """Conditions per incubator per week: slots minus controls, or per_incubator for every incubator if given."""
+    if per_incubator is not None:
+        return [int(per_incubator)] * len(facility["incubators"])
+    return [max(0, inc["slots"] - controls_per_collection) for inc in facility["incubators"]]
+
+def shelves_per_rack(facility: dict) -> list[int]:
+    return [inc["shelves_per_rack"] for inc in facility["incubators"]]
+
+def check_dates_fit(facility: dict, dates):
+    """Every incubator needs a shelf per staging date."""
+    for inc in facility["incubators"]:
+        if inc["racks"] * inc["shelves_per_rack"] < len(dates):
+            raise ValueError(f"Incubator {inc['name']} has {inc['racks'] * inc['shelves_per_rack']} shelves for {len(dates)} staging dates")
+
+def plugcamera_shelf_template(rows: int, columns: int) -> np.ndarray:
+    """
+    Plugcamera numbers of one shelf, laid out as on the rig: the first column counts down from 1,
+    the next counts back up, and so on (12 x 6 gives 1-12, 24-13, 25-36, ..., 72-61).
+    """
+    pos = np.arange(rows)[:, None] + 1 + rows * np.arange(columns)[None, :]
+    flipped = rows * (np.arange(columns) + 1) - np.arange(rows)[:, None]
+    return np.where(np.arange(columns)[None, :] % 2 == 1, flipped, pos)
@@ -0,0 +1,77 @@
+import os
+import json
+import threading
+from datetime import datetime
+
+class StageJournal:
+    """
+    Persistent record of a pipeline's finished stages and per-item outputs (one JSON file per experiment).
+
+    A stage is 'running' from start() until complete() or fail(); a driver killed mid-stage leaves it 'running',
+    which counts as incomplete. Items (videos, images) are recorded as they finish with the file they produced,
+    and only count as done while that file still exists. Once a stage has to run again, every later stage runs
+    too (should_run), since its inputs may have changed; items already done are still skipped.
+    The file is rewritten atomically after every change, so a crash never leaves it half written; changes from
+    several threads (the streaming pipeline's workers) are serialised.
+    """
+    def __init__(self, path, pipeline='', resume=True):
+        self.path = path
+        self.pipeline = pipeline
+        self.rerunning = False  # set once a stage had to run in this invocation
+        self.lock = threading.RLock()
+        self.data = {'pipeline': pipeline, 'stages': {}}
+        if resume and os.path.exists(path):
+            with open(path, 'r') as f:
+                self.data = json.load(f)
+        elif os.path.exists(path):
+            self.save()  # starting over: overwrite the old journal
+
+    def save(self):
+        with self.lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.data, f, indent=4)
+            os.replace(tmp_path, self.path)
+
+    def stage(self, name):
+        return self.data['stages'].setdefault(name, {'status': 'pending', 'started': None, 'finished': None, 'error': None, 'items': {}})
+
+    # ---------- stages ----------
+    def is_done(self, name):
+        return self.data['stages'].get(name, {}).get('status') == 'done'
+
+    def should_run(self, name):
+        """False only for a finished stage with no earlier stage rerun in this invocation."""
+        return self.rerunning or not self.is_done(name)
+
+    def start(self, name):
+        self.rerunning = True
+        stage = self.stage(name)
+        stage.update(status='running', started=datetime.now().isoformat(timespec='seconds'), finished=None, error=None)
+        self.save()
+
+    def complete(self, name):
+        self.stage(name).update(status='done', finished=datetime.now().isoformat(timespec='seconds'))
+        self.save()
+
+    def fail(self, name, error):
+        self.stage(name).update(status='failed', finished=datetime.now().isoformat(timespec='seconds'), error=str(error))
+        self.save()
+
+    # ---------- items ----------
+    def item_done(self, name, item):
+        record = self.data['stages'].get(name, {}).get('items', {}).get(item)
+        return record is not None and (record['output'] is None or os.path.exists(record['output']))
+
+    def item_output(self, name, item):
+        return self.data['stages'][name]['items'][item]['output']
+
+    def record_item(self, name, item, output=None):
+        with self.lock:
+            self.stage(name)['items'][item] = {'output': output, 'finished': datetime.now().isoformat(timespec='seconds')}
+            self.save()
+
+    def summary(self):
+        return {name: f"{stage['status']} ({len(stage['items'])} items)" if stage['items'] else stage['status']
+                for name, stage in self.data['stages'].items()}
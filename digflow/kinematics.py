@@ -0,0 +1,138 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+FEATURE_COLUMNS = ['video', 'track', 'frame', 'x', 'y', 'step', 'speed', 'displacement', 'heading', 'body_length']
+
+# body-axis points ordered head -> tail; falls back to skeleton order if head/tail are not named
+def axis_parts(skel_parts):
+    named = [part for part in ('head', 'body', 'tail') if part in skel_parts]
+    return named if len(named) >= 2 else list(skel_parts)
+
+# (x, y) arrays of shape (rows, parts) for the given skeleton parts
+def part_coords(chunk, parts):
+    x = np.column_stack([chunk[f'x_{part}'].to_numpy(dtype=float) for part in parts])
+    y = np.column_stack([chunk[f'y_{part}'].to_numpy(dtype=float) for part in parts])
+    return x, y
+
+# per-instance kinematics for one chunk of a tracks CSV. carry holds the last observation and the start position of
+# every track seen in earlier chunks (columns track, frame, x, y, x0, y0), so steps across chunk boundaries are kept.
+# Returns (features, carry) with carry updated for the next chunk
+def chunk_kinematics(chunk, video, skel_parts, carry):
+    track = chunk['track'].to_numpy(dtype=np.int64)
+    frame = chunk['frame'].to_numpy(dtype=np.int64)
+
+    # centroid of all detected skeleton points
+    x, y = part_coords(chunk, skel_parts)
+    n_points = np.sum(~np.isnan(x), axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cx = np.nansum(x, axis=1) / n_points
+        cy = np.nansum(y, axis=1) / n_points
+
+    # heading (tail -> head, radians) and body-axis length (sum of segment lengths along the axis)
+    ax, ay = part_coords(chunk, axis_parts(skel_parts))
+    heading = np.arctan2(ay[:, 0] - ay[:, -1], ax[:, 0] - ax[:, -1])
+    body_length = np.sum(np.hypot(np.diff(ax, axis=1), np.diff(ay, axis=1)), axis=1)
+
+    # order by track then frame, with the carried observation of each track placed first
+    n_carry = len(carry)
+    all_track = np.concatenate([carry['track'].to_numpy(dtype=np.int64), track])
+    all_frame = np.concatenate([carry['frame'].to_numpy(dtype=np.int64), frame])
+    all_x = np.concatenate([carry['x'].to_numpy(dtype=float), cx])
+    all_y = np.concatenate([carry['y'].to_numpy(dtype=float), cy])
+    is_carry = np.arange(len(all_track)) < n_carry
+    order = np.lexsort((~is_carry, all_frame, all_track))
+
+    s_track, s_frame, s_x, s_y = all_track[order], all_frame[order], all_x[order], all_y[order]
+
+    # a row continues its predecessor if both belong to the same (real) track
+    same = np.zeros(len(order), dtype=bool)
+    same[1:] = (s_track[1:] == s_track[:-1]) & (s_track[1:] >= 0)
+
+    step = np.full(len(order), np.nan)
+    speed = np.full(len(order), np.nan)
+    d = np.hypot(np.diff(s_x), np.diff(s_y))
+    dframe = np.diff(s_frame).astype(float)
+    step[1:] = np.where(same[1:], d, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        speed[1:] = np.where(same[1:] & (dframe > 0), d / dframe, np.nan)
+
+    # start position: from the carry if the track was seen before, else its first row in this chunk
+    starts = np.flatnonzero(~same)
+    run_id = np.cumsum(~same) - 1
+    x0 = s_x[starts][run_id]
+    y0 = s_y[starts][run_id]
+    if n_carry:
+        carry_start = carry.set_index('track')[['x0', 'y0']]
+        known = np.isin(s_track, carry_start.index) & (s_track >= 0)
+        x0[known] = carry_start['x0'].reindex(s_track[known]).to_numpy()
+        y0[known] = carry_start['y0'].reindex(s_track[known]).to_numpy()
+    displacement = np.where(s_track >= 0, np.hypot(s_x - x0, s_y - y0), np.nan)
+
+    # drop the carried rows again and map features back to chunk rows
+    keep = ~is_carry[order]
+    row = order[keep] - n_carry
+    features = pd.DataFrame({
+        'video': video,
+        'track': s_track[keep],
+        'frame': s_frame[keep],
+        'x': s_x[keep],
+        'y': s_y[keep],
+        'step': step[keep],
+        'speed': speed[keep],
+        'displacement': displacement[keep],
+        'heading': heading[row],
+        'body_length': body_length[row],
+    }, columns=FEATURE_COLUMNS)
+
+    # last observation (and start position) of each tracked animal for the next chunk
+    last = np.flatnonzero(np.r_[s_track[1:] != s_track[:-1], True] & (s_track >= 0))
+    carry = pd.DataFrame({'track': s_track[last], 'frame': s_frame[last], 'x': s_x[last], 'y': s_y[last],
+                          'x0': x0[last], 'y0': y0[last]})
+
+    return features, carry
+
+# the feature store is parquet, which pandas writes with pyarrow (or fastparquet); fail before touching the store without one
+def require_parquet():
+    try:
+        pd.io.parquet.get_engine('auto')
+    except ImportError as e:
+        raise ImportError('The feature store is written as parquet and needs pyarrow: pip install pyarrow') from e
+
+# stream a {name}.tracks.csv through chunk_kinematics and write the result to the feature store, a parquet dataset
+# partitioned by video (store_path/video=<name>/part-00000.parquet, ...); memory use is bounded by chunk_size rows
+def write_features(tracks_csv, store_path, video, skel_parts, chunk_size=500000):
+    require_parquet()
+    video_path = os.path.join(store_path, f'video={video}')
+    if os.path.isdir(video_path):
+        shutil.rmtree(video_path)  # recompute the whole video so no stale parts are left behind
+    os.makedirs(video_path, exist_ok=True)
+
+    header = pd.read_csv(tracks_csv, nrows=0).columns
+    usecols = ['frame'] + [f'{coord}_{part}' for part in skel_parts for coord in ['x', 'y']]
+    if 'track' in header:
+        usecols.append('track')
+    else:
+        print(f'No track column in {tracks_csv}, re-export tracks to get per-track speed and displacement')
+
+    carry = pd.DataFrame(columns=['track', 'frame', 'x', 'y', 'x0', 'y0'])
+    for i, chunk in enumerate(pd.read_csv(tracks_csv, usecols=usecols, chunksize=chunk_size)):
+        if 'track' not in chunk.columns:
+            chunk['track'] = -1
+        chunk['track'] = chunk['track'].fillna(-1)
+
+        features, carry = chunk_kinematics(chunk, video, skel_parts, carry)
+        features.drop(columns=['video']).to_parquet(os.path.join(video_path, f'part-{i:05d}.parquet'), index=False)
+
+    return video_path
+
+# features from the store, optionally for one video and/or one track only
+def load_features(store_path, video=None, track=None):
+    require_parquet()
+    filters = []
+    if video is not None:
+        filters.append(('video', '==', video))
+    if track is not None:
+        filters.append(('track', '==', track))
+    return pd.read_parquet(store_path, filters=filters or None)
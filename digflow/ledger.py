@@ -0,0 +1,191 @@
+import random
+import numpy as np
+from collections import Counter, deque
+
+COUNT_FIELDS = ['target', 'done', 'failed', 'queued']
+
+class ConditionLedger:
+    """
+    Screen state as per-condition counters instead of long lists of repeated condition names.
+
+    For every condition the ledger keeps [target, done, failed, queued] experiments, with
+    queued = target + failed - done. done counts experiments handed out by select(); a failure
+    puts one experiment back in the queue.
+
+    Queued conditions are handed out round-robin: the rotation holds each condition with queued
+    experiments once, select() takes from the front and puts a condition back at the end while it
+    still has experiments queued. This reproduces the old `shuffled_conditions * repeats` queue
+    exactly, and a failed condition re-enters at the end of the current round. The only randomness
+    is the initial shuffle, taken from `seed`.
+    """
+    def __init__(self, counts=None, rotation=None, seed=None):
+        self.counts = {cond: list(c) for cond, c in (counts or {}).items()}
+        self.rotation = deque(rotation or [])
+        self.in_rotation = set(self.rotation)
+        self.seed = seed
+
+    # ---------- construction / storage ----------
+    @classmethod
+    def from_conditions(cls, conditions, repeats, seed=None):
+        """New ledger with `repeats` experiments per condition; conditions are shuffled with seed if one is given."""
+        order = list(conditions)
+        if seed is not None:
+            random.Random(seed).shuffle(order)
+        counts = {cond: [repeats, 0, 0, repeats] for cond in order}
+        return cls(counts, [cond for cond in order if repeats > 0], seed=seed)
+
+    @classmethod
+    def from_queue(cls, queue, completed=None, targets=None, failed=None):
+        """Convert the old list-based state (remaining queue, optional completed list) into a ledger."""
+        queued = Counter(queue)
+        done = Counter(completed or [])
+        failed = failed or {}
+        conditions = list(dict.fromkeys(list(queue) + list(completed or []) + list(targets or {})))
+        counts = {}
+        for cond in conditions:
+            n_failed = int(failed.get(cond, 0))
+            if targets is not None:
+                target = int(targets.get(cond, 0))
+                n_done = max(0, target + n_failed - queued[cond])
+            else:
+                n_done = done[cond]
+                target = n_done + queued[cond] - n_failed
+            counts[cond] = [target, n_done, n_failed, queued[cond]]
+        return cls(counts, list(dict.fromkeys(queue)))
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['counts'], data['rotation'], seed=data.get('seed'))
+
+    def to_dict(self):
+        # stale rotation entries (conditions with nothing queued) are dropped on the way out
+        rotation = [cond for cond in self.rotation if self.counts[cond][3] > 0]
+        return {'fields': COUNT_FIELDS, 'counts': self.counts, 'rotation': rotation, 'seed': self.seed}
+
+    # ---------- queries ----------
+    def queued(self, condition):
+        return self.counts.get(condition, [0, 0, 0, 0])[3]
+
+    def successful(self, condition):
+        c = self.counts.get(condition, [0, 0, 0, 0])
+        return c[1] - c[2]
+
+    def total_queued(self):
+        return sum(c[3] for c in self.counts.values())
+
+    def queue(self):
+        """The queue as the old flat list, in the order select() would hand it out."""
+        queued = {cond: c[3] for cond, c in self.counts.items()}
+        rotation = deque(cond for cond in self.rotation if queued[cond] > 0)
+        out = []
+        while rotation:
+            cond = rotation.popleft()
+            out.append(cond)
+            queued[cond] -= 1
+            if queued[cond] > 0:
+                rotation.append(cond)
+        return out
+
+    def completed(self):
+        """Successful experiments as the old flat list (grouped by condition)."""
+        return [cond for cond in self.counts for _ in range(self.successful(cond))]
+
+    # ---------- updates ----------
+    def enqueue(self, condition):
+        if condition not in self.in_rotation:
+            self.rotation.append(condition)
+            self.in_rotation.add(condition)
+
+    def record_failure(self, condition, n=1):
+        """n experiments of condition failed: count them and queue them again. O(1)."""
+        c = self.counts.setdefault(condition, [0, 0, 0, 0])
+        c[2] += n
+        c[3] += n
+        if c[3] > 0:
+            self.enqueue(condition)
+
+    def take(self, condition, n=1):
+        """Hand out n queued experiments of a specific condition. O(1)."""
+        c = self.counts[condition]
+        if n > c[3]:
+            raise ValueError(f"Only {c[3]} experiment(s) of {condition} queued, cannot take {n}")
+        c[1] += n
+        c[3] -= n
+
+    def select(self, k):
+        """Hand out the next k queued experiments in rotation order (fewer if the queue runs out). O(k) amortised."""
+        picked = []
+        while len(picked) < k and self.rotation:
+            cond = self.rotation.popleft()
+            self.in_rotation.discard(cond)
+            c = self.counts[cond]
+            if c[3] <= 0:
+                continue  # stale entry, emptied by take()
+            picked.append(cond)
+            c[1] += 1
+            c[3] -= 1
+            if c[3] > 0:
+                self.enqueue(cond)
+        return picked
+
+def load_ledger(exp: dict) -> ConditionLedger:
+    """
+    Ledger of a screen's experiment.json, converting the legacy 'remaining' list if needed. Legacy targets come from
+    target_replicates_total // replicates_per_experiment when the file has them, so every script starts from the same
+    targets.
+    """
+    if "ledger" in exp:
+        return ConditionLedger.from_dict(exp["ledger"])
+    targets = None
+    if "target_replicates_total" in exp:
+        repeats = int(exp["target_replicates_total"]) // int(exp["replicates_per_experiment"])
+        targets = {c: repeats for c in exp["conditions"]}
+    return ConditionLedger.from_queue(exp["remaining"], targets=targets, failed=exp.get("failure_counts", {}))
+
+# ---------- array form, for simulating many ledgers at once ----------
+def rotation_keys(ledger: ConditionLedger, conditions: list[str]):
+    """Rotation position of each condition (np.inf if not in the rotation), as used by select_round_robin."""
+    keys = np.full(len(conditions), np.inf)
+    position = {cond: i for i, cond in enumerate(c for c in ledger.rotation if ledger.queued(c) > 0)}
+    for j, cond in enumerate(conditions):
+        if cond in position:
+            keys[j] = position[cond]
+    return keys
+
+def select_round_robin(queued: np.ndarray, keys: np.ndarray, next_key: np.ndarray, k: int) -> np.ndarray:
+    """
+    ConditionLedger.select for many independent ledgers at once.
+
+    queued and keys are (ledgers, conditions) arrays; keys hold rotation positions (np.inf = not in the
+    rotation) and next_key the next free position per ledger. Takes up to k experiments per ledger, updating
+    the arrays in place, and returns the number picked per ledger and condition.
+    """
+    picks = np.zeros_like(queued)
+    need = np.full(queued.shape[0], k)
+    while True:
+        eligible = queued > 0
+        active = (need > 0) & eligible.any(axis=1)
+        if not active.any():
+            return picks
+
+        # rank of every queued condition in its rotation; the first `need` are taken
+        ranks = np.argsort(np.argsort(np.where(eligible, keys, np.inf), axis=1, kind='stable'), axis=1)
+        take = eligible & (ranks < need[:, None]) & active[:, None]
+        n_taken = take.sum(axis=1)
+        picks += take
+        queued -= take
+
+        # taken conditions with experiments left go to the back of the rotation, in the order they were taken
+        back = take & (queued > 0)
+        keys[back] = (next_key[:, None] + ranks)[back]
+        keys[take & (queued == 0)] = np.inf
+        next_key += n_taken
+        need -= n_taken
+
+def requeue_round_robin(queued: np.ndarray, keys: np.ndarray, next_key: np.ndarray, failures: np.ndarray):
+    """ConditionLedger.record_failure for many ledgers at once: queue failures, appending new conditions to the rotation."""
+    queued += failures
+    joining = np.isinf(keys) & (queued > 0)
+    order = np.cumsum(joining, axis=1) - 1
+    keys[joining] = (next_key[:, None] + order)[joining]
+    next_key += joining.sum(axis=1)
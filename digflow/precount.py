@@ -0,0 +1,91 @@
+import os
+import zlib
+import numpy as np
+import pandas as pd
+
+# Classical-CV pupae counts on the unwrapped panoramas, in a fraction of a second per vial: pupae are dark, compact blobs on a
+# lighter vial wall. Each count comes with a confidence, so only the vials the blobs can't settle (touching pupae,
+# debris, bad lighting) need the SLEAP model; the rest keep the provisional count.
+
+PRECOUNT_COLUMNS = ['name', 'image', 'precount', 'precount_confidence', 'blobs', 'clusters', 'unit_area']
+
+# ---------- counting ----------
+def dark_mask(grey, background_sigma=25, darkness=0.25):
+    """Pixels at least `darkness` (relative) darker than the smoothed wall around them, opened to drop specks."""
+    import cv2
+
+    grey = grey.astype(np.float32)
+    background = cv2.GaussianBlur(grey, (0, 0), background_sigma)
+    mask = (grey < (1 - darkness) * background).astype(np.uint8)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+    return cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+
+def count_pupae(image, min_area=150, max_single_area=2500, unit_area=800, darkness=0.25, background_sigma=25, min_count=3):
+    """
+    Provisional pupae count of one panorama (BGR or grey array) and how far to trust it.
+
+    Dark blobs of at least min_area px are pupae. The area of one pupa is the median of the blobs up to
+    max_single_area (unit_area if there are none); bigger blobs count as round(area / that) touching pupae.
+    Confidence starts at 1 and loses, relative to the count, whatever the blobs leave unexplained: blobs under half
+    a pupa, clusters the nearer they are to a half-integer number of pupae, 0.3 of a pupa per extra pupa in a
+    cluster (touching pupae are often undercounted), and dark specks below min_area. A panorama that is over- or
+    underexposed, or more than half dark blobs (lighting or stitching failure), gets confidence 0, and so does a count
+    under min_count (no blobs at all included): an empty-looking vial is as likely a failed image or threshold as a
+    vial without pupae, so it always goes to SLEAP.
+    """
+    import cv2
+
+    grey = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    mask = dark_mask(grey, background_sigma, darkness)
+    n_labels, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    areas = stats[1:, cv2.CC_STAT_AREA].astype(float)  # label 0 is the background
+
+    blobs, specks = areas[areas >= min_area], areas[areas < min_area]
+    singles = blobs[blobs <= max_single_area]
+    unit = float(np.median(singles)) if len(singles) else float(unit_area)
+    ratio = blobs / unit
+    pupae = np.maximum(1, np.round(ratio))
+    count = int(pupae.sum())
+
+    # a blob of 0.5-1.5 pupae is one pupa (they vary that much in size); below that it may be a fragment, and a
+    # cluster is ambiguous the nearer it is to a half-integer number of pupae
+    ambiguity = np.where(ratio < 1.5, np.clip(1 - 2 * ratio, 0, 1), 1 - 2 * np.abs(ratio - pupae)) + 0.3 * (pupae - 1)
+    unexplained = ambiguity.sum() + specks.sum() / unit
+    confidence = max(0.0, 1 - unexplained / max(count, 1))
+    if mask.mean() > 0.5 or not 40 <= grey.mean() <= 245 or count < min_count:
+        confidence = 0.0
+    return {'precount': count, 'precount_confidence': round(float(confidence), 3), 'blobs': int(len(blobs)),
+            'clusters': int((pupae > 1).sum()), 'unit_area': round(unit, 1)}
+
+def count_image(image_path, **kwargs):
+    """count_pupae of an image file, or None if it can't be read."""
+    import cv2
+
+    image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    return None if image is None else count_pupae(image, **kwargs)
+
+# ---------- triage ----------
+def in_sample(name, fraction):
+    """Whether a vial is in the SLEAP audit sample: a fixed fraction of names, the same ones on every run."""
+    return zlib.crc32(name.encode()) % 10000 < fraction * 10000
+
+def needs_sleap(name, confidence, min_confidence=0.9, sample=0.1):
+    """A vial goes to SLEAP if it has no precount, an uncertain one, or is in the audit sample."""
+    return confidence is None or pd.isna(confidence) or confidence < min_confidence or in_sample(name, sample)
+
+# ---------- table ----------
+def read_precounts(path):
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=PRECOUNT_COLUMNS)
+    return pd.read_csv(path).reindex(columns=PRECOUNT_COLUMNS)
+
+def write_precounts(path, df):
+    tmp_path = f'{path}.tmp'
+    df.reindex(columns=PRECOUNT_COLUMNS).sort_values('name').to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+def held_back(precounts, min_confidence=0.9, sample=0.1):
+    """The precounts triage keeps from SLEAP: confident enough and not in the audit sample."""
+    keep = [not needs_sleap(name, confidence, min_confidence, sample)
+            for name, confidence in zip(precounts['name'], precounts['precount_confidence'])]
+    return precounts[keep]
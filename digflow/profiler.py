@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import socket
+import subprocess
+from datetime import datetime
+from contextlib import contextmanager
+
+SACCT_FIELDS = ['JobID', 'JobName', 'State', 'ExitCode', 'Elapsed', 'TotalCPU', 'AllocCPUS', 'ReqMem', 'MaxRSS',
+                'MaxDiskRead', 'MaxDiskWrite', 'Start', 'End', 'NodeList']
+
+# ---------- helpers ----------
+def cpu_seconds():
+    """CPU time of this process plus its finished children (ffmpeg, rsync, ... run through subprocess)."""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+def folder_bytes(path):
+    """Total size of the files below path (0 if it does not exist)."""
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for f in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, f)).st_size
+            except OSError:
+                pass
+    return total
+
+def sacct_usage(job_id):
+    """Resource usage of a Slurm job (and its array tasks/steps) from sacct, one dict per row; [] if sacct is unavailable."""
+    cmd = ['sacct', '-j', str(job_id), f'--format={",".join(SACCT_FIELDS)}', '--parsable2', '--noheader', '--units=M']
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=60)
+    except (OSError, subprocess.TimeoutExpired):
+        return []
+    rows = []
+    for line in result.stdout.strip().split('\n'):
+        parts = line.split('|')
+        if len(parts) == len(SACCT_FIELDS):
+            rows.append(dict(zip(SACCT_FIELDS, parts)))
+    return rows
+
+def format_duration(seconds):
+    minutes, secs = divmod(int(seconds), 60)
+    return f'{minutes}:{secs:02d}'
+
+class StageProfiler:
+    """
+    Records wall and CPU time of pipeline stages, tagged by rig and/or video, with bytes and frames processed.
+
+    Stages nest freely and may repeat (e.g. one 'unwrap' record per video). Slurm jobs submitted by a stage
+    are registered with add_job() and their sacct usage is pulled when the metrics are written.
+    """
+    def __init__(self, experiment='', exp_type=''):
+        self.experiment = experiment
+        self.exp_type = exp_type
+        self.records = []
+        self.jobs = []
+        self.open = {}  # stages started with start() and not yet stopped
+        self.started = datetime.now()
+
+    @contextmanager
+    def stage(self, name, rig=None, video=None):
+        """Time the enclosed block; yields the record so bytes/frames/extra fields can be filled in."""
+        record = self.start(name, rig=rig, video=video)
+        try:
+            yield record
+        except BaseException:
+            record['status'] = 'failed'
+            raise
+        finally:
+            self.stop(record)
+
+    def start(self, name, rig=None, video=None):
+        record = {'stage': name, 'rig': rig, 'video': video, 'start': datetime.now().isoformat(timespec='seconds'),
+                  'wall_s': None, 'cpu_s': None, 'bytes': 0, 'frames': 0, 'status': 'running',
+                  '_wall0': time.perf_counter(), '_cpu0': cpu_seconds()}
+        self.records.append(record)
+        self.open[name] = record
+        return record
+
+    def stop(self, record_or_name):
+        """Close a stage record (or the open stage with that name); stopping a stage that never started is a no-op."""
+        record = self.open.get(record_or_name) if isinstance(record_or_name, str) else record_or_name
+        if record is None or '_wall0' not in record:
+            return None
+        record['wall_s'] = round(time.perf_counter() - record.pop('_wall0'), 3)
+        record['cpu_s'] = round(cpu_seconds() - record.pop('_cpu0'), 3)
+        record['end'] = datetime.now().isoformat(timespec='seconds')
+        if record['status'] == 'running':
+            record['status'] = 'ok'
+        if self.open.get(record['stage']) is record:
+            del self.open[record['stage']]
+        return record
+
+    def add_job(self, stage, job_id, tasks=None, script=None, size=None, sizes=None):
+        """
+        Register a submitted Slurm job; tasks optionally maps array task index -> rig or video. script names the
+        sbatch script and size/sizes (per rig or video) the input it was sized for, so its usage can go into the
+        resource history (sizing.ResourceModel).
+        """
+        self.jobs.append({'stage': stage, 'job_id': str(job_id), 'tasks': tasks or {}, 'script': script, 'size': size,
+                          'sizes': sizes or {}, 'usage': None})
+
+    def collect_jobs(self):
+        """Pull sacct usage for registered jobs that don't have it yet, tagging array tasks with their rig/video."""
+        for job in self.jobs:
+            if job['usage']:
+                continue
+            job['usage'] = sacct_usage(job['job_id'])
+            tasks = {str(k): v for k, v in job['tasks'].items()}
+            for row in job['usage']:
+                task = row['JobID'].split('.')[0].partition('_')[2]  # 1234_5.batch -> 5
+                if task in tasks:
+                    row['task'] = tasks[task]
+
+    # ---------- summaries ----------
+    def totals(self):
+        """Wall/CPU seconds, bytes and frames summed per stage over all its records."""
+        totals = {}
+        for record in self.records:
+            if record['wall_s'] is None:
+                continue
+            t = totals.setdefault(record['stage'], {'count': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'bytes': 0, 'frames': 0})
+            t['count'] += 1
+            for key in ('wall_s', 'cpu_s', 'bytes', 'frames'):
+                t[key] += record[key]
+        for t in totals.values():
+            t['wall_s'], t['cpu_s'] = round(t['wall_s'], 3), round(t['cpu_s'], 3)
+        return totals
+
+    def to_dict(self):
+        return {'experiment': self.experiment,
+                'exp_type': self.exp_type,
+                'host': socket.gethostname(),
+                'slurm_job_id': os.environ.get('SLURM_JOB_ID'),
+                'started': self.started.isoformat(timespec='seconds'),
+                'finished': datetime.now().isoformat(timespec='seconds'),
+                'totals': self.totals(),
+                'stages': [{k: v for k, v in record.items() if not k.startswith('_')} for record in self.records],
+                'jobs': self.jobs}
+
+    def write(self, path):
+        """Write the metrics JSON (after pulling sacct usage) and return its path."""
+        self.collect_jobs()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=4)
+        return path
+
+    def print_summary(self):
+        totals = self.totals()
+        if not totals:
+            print('\nNo timed stages.')
+            return
+        print('\n\n\nStage timings (wall MM:SS, CPU MM:SS):')
+        for name, t in totals.items():
+            extra = ''.join([f', {t["bytes"] / 1e9:.2f} GB' if t['bytes'] else '', f', {t["frames"]} frames' if t['frames'] else ''])
+            print(f'\t{name}: {format_duration(t["wall_s"])} wall, {format_duration(t["cpu_s"])} CPU ({t["count"]}x{extra})')
+        print(f'\nTotal time: {format_duration((datetime.now() - self.started).total_seconds())}')
@@ -0,0 +1,118 @@
+import os
+import json
+import numpy as np
+import cv2
+
+# BGR colours cycled over skeleton nodes
+NODE_COLOURS = [(0, 0, 255), (0, 255, 0), (255, 0, 0), (0, 255, 255), (255, 0, 255), (255, 255, 0)]
+EDGE_COLOUR = (255, 255, 255)
+
+# node names in the index order used by instance '_points'
+def node_names(data):
+    return [node['name'] if isinstance(node, dict) else str(node) for node in data.get('nodes', [])]
+
+# skeleton edges as (source, target) node indices. SLEAP stores the skeleton as a jsonpickled networkx graph.
+# jsonpickle numbers every object it spells out, nodes ('py/object' with 'py/state') and edge types ('py/reduce')
+# alike, in the order it writes them: for each link source, target, type, then the skeleton's nodes. Later occurrences
+# are 'py/id' references to that numbering, which is resolved the way sleap-io does. Symmetry links (edge type 2) are
+# not edges. Plain integer node indices are taken as they are. If any link cannot be resolved, nodes are chained in
+# index order
+def skeleton_edges(data):
+    names = node_names(data)
+    skeletons = data.get('skeletons', [])
+    links = skeletons[0].get('links', []) if skeletons else []
+    chain = [(i, i + 1) for i in range(len(names) - 1)]
+
+    decoded = []  # py/id N is decoded[N - 1]
+    def resolve(obj):
+        if isinstance(obj, dict) and 'py/id' in obj:
+            i = obj['py/id']
+            return decoded[i - 1] if isinstance(i, int) and 0 < i <= len(decoded) else None
+        if isinstance(obj, dict) and 'py/state' in obj:  # Node
+            state = obj['py/state']
+            name = state['py/tuple'][0] if isinstance(state, dict) and 'py/tuple' in state else state.get('name') if isinstance(state, dict) else None
+            decoded.append(name)
+            return name
+        if isinstance(obj, dict) and 'py/reduce' in obj:  # EdgeType(1) body, EdgeType(2) symmetry
+            reduce = obj['py/reduce']
+            edge_type = reduce[1]['py/tuple'][0] if len(reduce) > 1 and isinstance(reduce[1], dict) and 'py/tuple' in reduce[1] else None
+            decoded.append(edge_type)
+            return edge_type
+        if isinstance(obj, int) and not isinstance(obj, bool):
+            return names[obj] if 0 <= obj < len(names) else None
+        return None
+
+    edges = []
+    for link in links:
+        source, target = resolve(link.get('source')), resolve(link.get('target'))
+        edge_type = resolve(link['type']) if 'type' in link else 1
+        if source not in names or target not in names or edge_type not in (1, 2):
+            return chain
+        if edge_type == 1:
+            edges.append((names.index(source), names.index(target)))
+    return edges if edges else chain
+
+# points of each instance in a labelled frame, as {node index: (x, y)}
+def prediction_points(data, frame=0):
+    labels = data.get('labels', [])
+    if len(labels) <= frame:
+        return []
+    instances = []
+    for instance in labels[frame]['_instances']:
+        points = {int(node): (point['x'], point['y']) for node, point in instance['_points'].items()
+                  if point.get('x') is not None and point.get('y') is not None and point.get('visible', True)}
+        instances.append(points)
+    return instances
+
+# draw skeleton edges and points of every instance onto a copy of image
+def render_overlay(image, instances, edges, marker_size=2, line_width=1):
+    out = image.copy()
+    for points in instances:
+        for source, target in edges:
+            if source in points and target in points:
+                p1 = tuple(int(round(v)) for v in points[source])
+                p2 = tuple(int(round(v)) for v in points[target])
+                cv2.line(out, p1, p2, EDGE_COLOUR, line_width, cv2.LINE_AA)
+        for node, point in points.items():
+            centre = tuple(int(round(v)) for v in point)
+            cv2.circle(out, centre, marker_size, NODE_COLOURS[node % len(NODE_COLOURS)], -1, cv2.LINE_AA)
+    return out
+
+# render the predictions in a SLEAP JSON onto the image they were inferred from and write out_path; returns out_path
+def render_prediction_preview(json_path, image_path, out_path, marker_size=2, edges=None):
+    with open(json_path, 'r') as f:
+        data = json.load(f)
+    image = cv2.imread(image_path)
+    if image is None:
+        raise FileNotFoundError(f'Could not read image for preview: {image_path}')
+
+    edges = edges if edges is not None else skeleton_edges(data)
+    cv2.imwrite(out_path, render_overlay(image, prediction_points(data), edges, marker_size=marker_size))
+    return out_path
+
+# tile images (scaled to the same height) into one contact sheet, labelled with their file names; returns out_path, or
+# None (and writes nothing) if none of the images could be read
+def contact_sheet(image_paths, out_path, columns=8, thumb_height=300, label=True):
+    thumbs = []
+    for path in image_paths:
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        scale = thumb_height / image.shape[0]
+        thumb = cv2.resize(image, (max(1, int(image.shape[1] * scale)), thumb_height), interpolation=cv2.INTER_AREA)
+        if label:
+            name = os.path.basename(path).replace('.predictions.jpg', '')
+            cv2.putText(thumb, name, (5, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
+        thumbs.append(thumb)
+    if not thumbs:
+        return None
+
+    # pad every thumbnail to the widest one so rows line up
+    width = max(thumb.shape[1] for thumb in thumbs)
+    blank = np.zeros((thumb_height, width, 3), dtype=np.uint8)
+    thumbs = [np.pad(thumb, ((0, 0), (0, width - thumb.shape[1]), (0, 0))) for thumb in thumbs]
+    thumbs += [blank] * (-len(thumbs) % columns)
+
+    rows = [np.concatenate(thumbs[i:i + columns], axis=1) for i in range(0, len(thumbs), columns)]
+    cv2.imwrite(out_path, np.concatenate(rows, axis=0))
+    return out_path
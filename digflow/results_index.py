@@ -0,0 +1,182 @@
+import os
+import re
+import sqlite3
+import numpy as np
+import pandas as pd
+
+DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")  # screen week folders, YYYY-MM-DD
+PC_RE = re.compile(r"(pc\d+)", re.IGNORECASE)  # plugcamera id in dataset names
+SKIP_DIRS = {'raw_data', 'mp4s', 'features'}   # bulk data, never contains results tables
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY, kind TEXT, experiment TEXT, exp_type TEXT, mtime REAL, size INTEGER
+);
+CREATE TABLE IF NOT EXISTS pupae_counts (
+    path TEXT, experiment TEXT, exp_type TEXT, week TEXT, plugcamera TEXT, dataset TEXT,
+    pupae_count INTEGER, score_mean REAL, score_min REAL, score_max REAL,
+    count_source TEXT, precount INTEGER, precount_confidence REAL
+);
+CREATE TABLE IF NOT EXISTS shelves (
+    path TEXT, experiment TEXT, exp_type TEXT, week TEXT, experimenter TEXT, incubator TEXT, shelf TEXT,
+    rack TEXT, plugcamera TEXT, condition TEXT, location TEXT, collection_date TEXT, staging_date TEXT, amendments TEXT
+);
+CREATE TABLE IF NOT EXISTS tracks (
+    path TEXT, experiment TEXT, exp_type TEXT, video TEXT,
+    n_rows INTEGER, n_frames INTEGER, n_tracks INTEGER, first_frame INTEGER, last_frame INTEGER
+);
+CREATE INDEX IF NOT EXISTS shelves_key ON shelves (experiment, week, plugcamera, condition);
+CREATE INDEX IF NOT EXISTS tracks_key ON tracks (experiment, video);
+"""
+
+# run after ADDED_COLUMNS are in place; the view is recreated so older index files pick up the week join.
+# A plugcamera holds a different condition every week of a screen, so counts only join the shelves.csv of their week
+# (week is '' on both sides outside screen week folders)
+VIEWS = """
+CREATE INDEX IF NOT EXISTS pupae_counts_week_key ON pupae_counts (experiment, week, plugcamera);
+DROP VIEW IF EXISTS pupae_by_condition;
+CREATE VIEW pupae_by_condition AS
+    SELECT p.experiment, p.exp_type, s.week, p.plugcamera, s.condition, s.incubator, s.shelf, s.rack,
+           s.amendments, p.pupae_count, p.score_mean, p.dataset
+    FROM pupae_counts p JOIN shelves s
+        ON p.experiment = s.experiment AND p.week = s.week AND p.plugcamera = s.plugcamera;
+"""
+
+# columns added to tables after their first release, added to older index files when they are opened (and that
+# table's files re-read on their next ingest, so the new columns are filled in)
+ADDED_COLUMNS = {'pupae_counts': [('count_source', 'TEXT'), ('precount', 'INTEGER'), ('precount_confidence', 'REAL'),
+                                  ('week', 'TEXT')]}
+
+SHELVES_COLUMNS = ['experimenter', 'incubator', 'shelf', 'rack', 'plugcamera', 'condition', 'location',
+                   'collection_date', 'staging_date', 'amendments']
+
+# type of results table a file holds, or None if it is not one the index ingests
+def results_kind(file_name):
+    if file_name == 'pupae_counts.csv':
+        return 'pupae_counts'
+    if file_name == 'shelves.csv':
+        return 'shelves'
+    if file_name.endswith('.tracks.csv'):
+        return 'tracks'
+    return None
+
+def plugcamera_from_name(name):
+    match = PC_RE.search(os.path.basename(str(name)))
+    return match.group(1).lower() if match else ''
+
+# screen week (YYYY-MM-DD folder) a results file was written under, or '' outside screen week folders
+def week_from_path(path):
+    folder = os.path.dirname(os.path.abspath(path))
+    while os.path.dirname(folder) != folder:
+        if DATE_RE.match(os.path.basename(folder)):
+            return os.path.basename(folder)
+        folder = os.path.dirname(folder)
+    return ''
+
+# embedded SQLite index of results tables (pupae_counts.csv, *.tracks.csv, shelves.csv) across experiments. Files are
+# re-ingested only when their mtime or size changes. Rows are keyed by experiment, week, plugcamera and condition, and
+# the pupae_by_condition view joins counts to the shelf layout of the same week
+class ResultsIndex:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=60)
+        self.conn.executescript(SCHEMA)
+        for table, added in ADDED_COLUMNS.items():
+            existing = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            for column, column_type in added:
+                if column not in existing:
+                    self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                    self.conn.execute("DELETE FROM files WHERE kind = ?", (table,))
+        self.conn.commit()
+        self.conn.executescript(VIEWS)
+
+    def close(self):
+        self.conn.close()
+
+    def is_current(self, path, stat):
+        row = self.conn.execute("SELECT mtime, size FROM files WHERE path = ?", (path,)).fetchone()
+        return row is not None and row[0] == stat.st_mtime and row[1] == stat.st_size
+
+    # ingest one results file; returns True if it was (re)read
+    def ingest_file(self, path, experiment, exp_type, force=False):
+        path = os.path.abspath(path)
+        kind = results_kind(os.path.basename(path))
+        if kind is None:
+            return False
+        stat = os.stat(path)
+        if not force and self.is_current(path, stat):
+            return False
+
+        df = getattr(self, f'read_{kind}')(path)
+        df.insert(0, 'exp_type', exp_type)
+        df.insert(0, 'experiment', experiment)
+        df.insert(0, 'path', path)
+
+        with self.conn:  # one transaction: replace this file's rows and its bookkeeping entry
+            for table in ('pupae_counts', 'shelves', 'tracks'):
+                self.conn.execute(f"DELETE FROM {table} WHERE path = ?", (path,))
+            df.to_sql(kind, self.conn, if_exists='append', index=False)
+            self.conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                              (path, kind, experiment, exp_type, stat.st_mtime, stat.st_size))
+        return True
+
+    # ingest every results file below folder; returns the number of files (re)read
+    def ingest_folder(self, folder, experiment, exp_type):
+        n = 0
+        for dirpath, dirnames, filenames in os.walk(folder):
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS and not d.endswith(('_sequence', '.store'))]
+            for file_name in filenames:
+                if results_kind(file_name) and self.ingest_file(os.path.join(dirpath, file_name), experiment, exp_type):
+                    n += 1
+        return n
+
+    # ingest all experiments laid out as root/<exp_type>/<experiment>/
+    def crawl(self, root):
+        n = 0
+        for exp_type in sorted(os.listdir(root)):
+            type_path = os.path.join(root, exp_type)
+            if not os.path.isdir(type_path):
+                continue
+            for experiment in sorted(os.listdir(type_path)):
+                if os.path.isdir(os.path.join(type_path, experiment)):
+                    n += self.ingest_folder(os.path.join(type_path, experiment), experiment, exp_type)
+        return n
+
+    def query(self, sql, params=()):
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    # pupae counts per condition (mean, n) across all ingested experiments, or one experiment
+    def pupae_counts_by_condition(self, experiment=None):
+        sql = """SELECT condition, COUNT(*) AS n, AVG(pupae_count) AS mean_pupae_count
+                 FROM pupae_by_condition {where} GROUP BY condition ORDER BY condition"""
+        if experiment is None:
+            return self.query(sql.format(where=''))
+        return self.query(sql.format(where='WHERE experiment = ?'), (experiment,))
+
+    def read_pupae_counts(self, path):
+        df = pd.read_csv(path).reindex(columns=['dataset', 'pupae_count', 'score_mean', 'score_min', 'score_max',
+                                                'count_source', 'precount', 'precount_confidence'])
+        df.insert(0, 'plugcamera', df['dataset'].map(plugcamera_from_name))
+        df.insert(0, 'week', week_from_path(path))
+        return df
+
+    def read_shelves(self, path):
+        df = pd.read_csv(path, dtype=str, keep_default_na=False).reindex(columns=SHELVES_COLUMNS, fill_value='')
+        df['condition'] = df['condition'].str.strip()
+        df['plugcamera'] = df['plugcamera'].str.strip().str.lower()
+        df.insert(0, 'week', week_from_path(path))
+        return df
+
+    def read_tracks(self, path):
+        # summary only; per-instance queries go through the track store
+        n_rows, frames, tracks = 0, set(), set()
+        usecols = lambda column: column in ('frame', 'track')
+        for chunk in pd.read_csv(path, usecols=usecols, chunksize=500000):
+            n_rows += len(chunk)
+            frames.update(np.unique(chunk['frame']).tolist())
+            if 'track' in chunk.columns:
+                tracks.update(np.unique(chunk['track'][chunk['track'] >= 0]).tolist())
+        video = os.path.basename(path)[:-len('.tracks.csv')]
+        return pd.DataFrame([{'video': video, 'n_rows': n_rows, 'n_frames': len(frames), 'n_tracks': len(tracks),
+                              'first_frame': min(frames) if frames else None, 'last_frame': max(frames) if frames else None}])
@@ -0,0 +1,175 @@
+import math
+import numpy as np
+
+# The rotator turns each vial at a steady speed, so the centre strip that extract_frames keeps slides sideways by
+# the same number of pixels every frame and shows the same surface again after one revolution. Comparing a few
+# decoded strips gives that speed, and matching later strips against the first one gives the revolution, so an
+# unwrap decodes one revolution's worth of frames and stitches only the strips it needs.
+
+NOMINAL_PERIOD = 250    # frames per revolution the fixed unwrap assumed (every 5th frame up to frame 250)
+NOMINAL_INTERVAL = 5
+NOMINAL_STEP = 21       # px between neighbouring strips in the fixed TileConfiguration.txt (51 strips)
+
+def strip_signal(strip, bin_rows=8):
+    """
+    Grey strip averaged over blocks of bin_rows rows, as float32 for correlation. Row and column means are removed:
+    the column means hold what doesn't change down the strip (the vial's edges, glare, background), which doesn't
+    turn with the vial and would otherwise pull every shift towards zero.
+    """
+    grey = strip.astype(np.float32)
+    if grey.ndim == 3:
+        grey = grey.mean(axis=2)
+    height = grey.shape[0] // bin_rows * bin_rows
+    grey = grey[:height].reshape(-1, bin_rows, grey.shape[1]).mean(axis=1)
+    grey -= grey.mean(axis=1, keepdims=True)
+    return grey - grey.mean(axis=0, keepdims=True)
+
+def strip_shift(a, b, max_shift=None):
+    """
+    Horizontal shift (px, subpixel) of signal b relative to signal a: content at column x of a is at x + shift in b.
+    Cross-correlates every row at once by FFT and normalises by the overlap, so large shifts aren't penalised.
+    """
+    width = a.shape[1]
+    max_shift = width // 2 if max_shift is None else min(max_shift, width - 1)
+    n = 2 * width  # zero padding: no wrap-around between the ends of the strip
+    corr = np.fft.irfft(np.fft.rfft(b, n, axis=1) * np.conj(np.fft.rfft(a, n, axis=1)), n, axis=1).sum(axis=0)
+    shifts = np.arange(-max_shift, max_shift + 1)
+    scores = corr[shifts % n] / (width - np.abs(shifts))
+    i = int(np.argmax(scores))
+    if 0 < i < len(scores) - 1:  # parabola through the peak and its neighbours
+        left, centre, right = scores[i - 1], scores[i], scores[i + 1]
+        denominator = left - 2 * centre + right
+        if denominator != 0:
+            return float(shifts[i] + 0.5 * (left - right) / denominator)
+    return float(shifts[i])
+
+def match_score(a, b):
+    """Normalised correlation of two signals without shifting them (1 = same surface in the same place)."""
+    denominator = math.sqrt(float((a * a).sum()) * float((b * b).sum()))
+    return float((a * b).sum()) / denominator if denominator else 0.0
+
+class Rotation:
+    """
+    One revolution of a vial video: `period` frames (fractional), during which the strip moves px_per_frame each
+    frame. Every interval-th frame is stitched, from frame 0 to the first one at or past the revolution, each
+    placed interval * px_per_frame to the right of the one before.
+    """
+    def __init__(self, period, px_per_frame, interval, score=None, estimated=True):
+        self.period = period
+        self.px_per_frame = px_per_frame
+        self.interval = interval
+        self.score = score
+        self.estimated = estimated
+
+    @classmethod
+    def nominal(cls):
+        """The fixed unwrap: 51 strips from every 5th frame, 21 px apart."""
+        return cls(NOMINAL_PERIOD, NOMINAL_STEP / NOMINAL_INTERVAL, NOMINAL_INTERVAL, estimated=False)
+
+    @property
+    def step(self):
+        return self.interval * self.px_per_frame
+
+    @property
+    def width(self):
+        """Panorama width of one revolution (px)."""
+        return int(round(self.period * self.px_per_frame))
+
+    @property
+    def n_tiles(self):
+        return int(math.ceil(self.period / self.interval - 0.05)) + 1
+
+    def frame_indices(self):
+        return [i * self.interval for i in range(self.n_tiles)]
+
+    def positions(self):
+        return [round(i * self.step, 1) for i in range(self.n_tiles)]
+
+    def tile_overlap(self, strip_width):
+        """Overlap of neighbouring strips in percent, as the Grid stitcher's tile_overlap expects."""
+        return max(0, min(99, int(round(100 * (1 - self.step / strip_width)))))
+
+    def to_dict(self):
+        return {'period_frames': round(self.period, 2), 'px_per_frame': round(self.px_per_frame, 3), 'interval': self.interval,
+                'tiles': self.n_tiles, 'width': self.width, 'score': None if self.score is None else round(self.score, 3),
+                'estimated': self.estimated}
+
+def read_revolution(video_path, crop=(525, 675), probe=10, search=0.25, min_score=0.5, step=NOMINAL_STEP,
+                    nominal_width=NOMINAL_PERIOD * NOMINAL_STEP / NOMINAL_INTERVAL, bin_rows=8):
+    """
+    Decode a rotating vial video only as far as one revolution and return (strips, Rotation): the cropped strips of
+    the frames Rotation.frame_indices() names. Returns ([], None) if the video can't be opened, and (strips read, None)
+    if no revolution could be found (too short, or nothing matched frame 0 by at least min_score).
+
+    The speed is the shift over the first `probe` frames (the median of consecutive shifts first, to know how many
+    frames can be compared in one go while the strips still overlap). It gives the stitching interval (strips about
+    `step` px apart, as before) and where to look for the revolution: within +-search of nominal_width / speed frames.
+    In that window each strip is scored against frame 0; the best frame plus its residual shift gives the period to
+    a fraction of a frame, and the shifts between the kept strips refine the speed. Frames that aren't needed are
+    only grabbed, not decoded into images, and reading stops shortly after the best match.
+    """
+    import cv2
+
+    vidcap = cv2.VideoCapture(video_path)
+    if not vidcap.isOpened():
+        vidcap.release()
+        return [], None
+
+    strips, signals = {}, {}
+    speed = interval = first = last = None
+    best_score, best_frame, best_signal = -1.0, None, None
+    t = -1
+    while vidcap.grab():
+        t += 1
+        probing = t <= probe
+        in_window = first is not None and first <= t <= last
+        keep = interval is not None and t % interval == 0
+        if not (probing or in_window or keep):
+            continue
+        success, image = vidcap.retrieve()
+        if not success:
+            break
+        strip = image[:, crop[0]:crop[1]].copy()  # a slice would keep the whole frame alive
+
+        if probing:
+            strips[t], signals[t] = strip, strip_signal(strip, bin_rows)
+            if t == probe:
+                speed = float(np.median([strip_shift(signals[i], signals[i + 1]) for i in range(probe)]))
+                if abs(speed) < 0.1:
+                    break  # not turning
+                lag = min(probe, int(0.4 * strip.shape[1] / abs(speed)))
+                if lag > 1:  # one longer shift averages out the jitter of the single-frame ones
+                    speed = strip_shift(signals[0], signals[lag]) / lag
+                interval = max(1, int(round(step / abs(speed))))
+                expected = nominal_width / abs(speed)
+                first, last = max(probe + 1, int(expected * (1 - search))), int(math.ceil(expected * (1 + search)))
+                strips = {i: s for i, s in strips.items() if i % interval == 0}
+            continue
+
+        if keep:
+            strips[t] = strip
+        if in_window:
+            signal = strip_signal(strip, bin_rows)
+            score = match_score(signals[0], signal)
+            if score > best_score:
+                best_score, best_frame, best_signal = score, t, signal
+        if best_score >= min_score and t >= best_frame + 2 * interval:
+            break  # past the match and the last strip one revolution needs
+        if t >= last + interval:
+            break  # end of the window
+    vidcap.release()
+
+    if best_frame is None or best_score < min_score:
+        return [strips[i] for i in sorted(strips)], None
+
+    # frame 0 reappears at best_frame, displaced by a residual of a few px: the revolution is the rest of the way
+    residual = strip_shift(signals[0], best_signal)
+    period = abs(best_frame - residual / speed)
+    # the kept strips span the whole revolution, so the shifts between them give the speed more exactly than the probe
+    kept = sorted(strips)
+    kept_signals = [strip_signal(strips[i], bin_rows) for i in kept]
+    shifts = [strip_shift(a, b) for a, b in zip(kept_signals, kept_signals[1:])]
+    if shifts and np.sign(np.median(shifts)) == np.sign(speed):
+        speed = float(np.median(shifts)) / interval
+    rotation = Rotation(period, abs(speed), interval, score=best_score)
+    return [strips[i] for i in rotation.frame_indices() if i in strips], rotation
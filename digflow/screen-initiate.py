@@ -6,6 +6,15 @@ import random
 import json
 from datetime import datetime, timedelta
 
+try:
+    from digflow.screen import make_fixed_layout, build_shelves_df, select_next_week
+    from digflow.ledger import ConditionLedger
+    from digflow.facility import load_facility, incubator_names, incubator_capacities, shelves_per_rack, check_dates_fit
+except ImportError:  # running from a source checkout: digflow/ is on sys.path
+    from screen import make_fixed_layout, build_shelves_df, select_next_week
+    from ledger import ConditionLedger
+    from facility import load_facility, incubator_names, incubator_capacities, shelves_per_rack, check_dates_fit
+
 # ---------- helpers ----------
 def check_monday(wc_date_str: str):
     d = datetime.strptime(wc_date_str, "%d-%m-%Y")
@@ -66,65 +75,6 @@ def link_conditions_with_locations(conditions: list[str], stock_df: pd.DataFrame
     merged = exp_df.merge(stock_df, on='condition', how='left')
     return dict(zip(merged['condition'], merged['location']))
 
-def make_fixed_layout(base_conditions, controls_per_collection):
-    """Create a single, fixed layout (conditions + controls) for an incubator (≤ 24 rows total)."""
-    layout = base_conditions.copy()
-    layout.extend(['control'] * controls_per_collection)
-    random.shuffle(layout)  # different each run
-    return layout
-
-def build_shelves_df(dates, inc_layout, condition_locations):
-    """
-    Build shelves with:
-      - fixed per-incubator condition+control layout reused for every date
-      - per-rack random permutation per incubator to avoid shelf collisions within a rack
-      - if there are fewer than 24 items, we just emit fewer rows (no blank rows)
-    """
-    cols = ['experimenter','collector','incubator','shelf','rack','plugcamera',
-            'condition','location','staging_date','amendments','comments','staging_times']
-    df = pd.DataFrame(columns=cols)
-
-    num_racks = (len(dates) + 1) // 2  # 6 dates -> 3 racks
-
-    # random shelf order per rack per incubator
-    rack_shelf_map = {
-        inc: {r: random.sample([1, 2], 2) for r in range(num_racks)}
-        for inc in (1, 2)
-    }
-
-    for idx, date in enumerate(dates):
-        rack_idx = idx // 2
-        pos_in_pair = idx % 2
-        rack_num  = rack_idx + 1
-
-        for incubator in (1, 2):
-            shelf_num = rack_shelf_map[incubator][rack_idx][pos_in_pair]
-            shelf_conditions = inc_layout.get(incubator, [])
-            if not shelf_conditions:
-                continue
-
-            rows = []
-            for condition in shelf_conditions:
-                location = condition_locations.get(condition, '')
-                rows.append({
-                    'experimenter': '',
-                    'collector': '',
-                    'incubator': f'incubator-{incubator}',
-                    'shelf': f'shelf-{shelf_num}',
-                    'rack': f'rack-{rack_num}',
-                    'plugcamera': '',
-                    'condition': condition,
-                    'location': location,
-                    'staging_date': date,
-                    'amendments': '',
-                    'comments': '',
-                    'staging_times': ''
-                })
-            if rows:
-                df = pd.concat([df, pd.DataFrame(rows)], ignore_index=True)
-
-    return df
-
 # ---------- main ----------
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='set up initial spreadsheet for inactivation screen (week 1)')
@@ -139,7 +89,10 @@ if __name__ == "__main__":
     parser.add_argument('-nc', '--per-incubator-conditions', dest='per_incubator_conditions',
                         type=int, default=None,
                         help='Number of CONDITIONS per incubator (controls are added on top). '
-                             'Default: 24 - controls_per_collection')
+                             'Default: slots - controls_per_collection for each incubator in the facility')
+    parser.add_argument('--facility', dest='facility', type=str, default=None,
+                        help='path to a facility JSON (incubators with racks/shelves_per_rack/slots). '
+                             'Default: two incubators, 3 racks x 2 shelves, 24 slots. Saved in experiment.json for later weeks')
     parser.add_argument('--conditions-df', dest='conditions_df', type=str, required=True,
                         help='path to conditions locations CSV (stock table with ID/Tray/Location)')
     parser.add_argument('--conditions', dest='conditions', type=str, required=True,
@@ -164,34 +117,30 @@ if __name__ == "__main__":
     condition_locations = link_conditions_with_locations(conditions_list, stock_df)
 
     # Build weekly plan
+    facility = load_facility(args.facility)
     dates = calculate_dates(args.wc_date)
-    default_per_inc = 24 - args.controls_per_collection  # target count per incubator (conditions only)
-    per_inc = args.per_incubator_conditions if args.per_incubator_conditions is not None else default_per_inc
+    check_dates_fit(facility, dates)
+    # target count per incubator (conditions only)
+    capacities = incubator_capacities(facility, args.controls_per_collection, args.per_incubator_conditions)
 
-    # Shuffle and expand once
+    # Shuffle once; the ledger hands conditions out round-robin (repeats only after every condition has come up)
     pool = conditions_list.copy()
     random.shuffle(pool)
-    expanded = pool * repeats_factor
+    ledger = ConditionLedger.from_conditions(pool, repeats_factor)
 
     # Soft allocation: give as many as possible (no crash if short)
-    inc1_count = min(per_inc, len(expanded))
-    inc1 = expanded[:inc1_count]
-    rem_after_inc1 = expanded[inc1_count:]
-
-    inc2_count = min(per_inc, len(rem_after_inc1))
-    inc2 = rem_after_inc1[:inc2_count]
-    remaining_exps = rem_after_inc1[inc2_count:]
+    picks = select_next_week(ledger, capacities)
 
     # Fixed layouts (conditions + controls) reused across all dates — shuffled anew each run
-    inc_layout = {
-        1: make_fixed_layout(inc1, args.controls_per_collection),
-        2: make_fixed_layout(inc2, args.controls_per_collection),
-    }
+    incubators = incubator_names(facility)
+    inc_layout = {inc: make_fixed_layout(picked, args.controls_per_collection) for inc, picked in zip(incubators, picks)}
 
     shelves_df = build_shelves_df(
         dates=dates,
         inc_layout=inc_layout,
-        condition_locations=condition_locations
+        condition_locations=condition_locations,
+        incubators=incubators,
+        shelves_per_rack=shelves_per_rack(facility)
     )
     shelves_df.to_csv(os.path.join(save_path, 'shelves.csv'), index=False)
 
@@ -202,13 +151,14 @@ if __name__ == "__main__":
     # Write experiment.json for future weeks
     experiment_dict = {
         'conditions': conditions_list,
-        'remaining': remaining_exps,                     # queue of future *experiments*
+        'ledger': ledger.to_dict(),                      # per-condition target/done/failed/queued *experiments*
         'completed_counts': completed_counts,            # per-condition literal N completed so far
         'replicates_per_experiment': replicates_per_experiment,  # per experiment (usually 6)
         'target_replicates_total': args.sample_size,     # <-- overall N target per condition (e.g., 18)
         'controls_per_collection': args.controls_per_collection,
         'condition_locations': condition_locations,
-        'failure_counts': {}                             # <-- renamed from failure_ledger
+        'failure_counts': {},                            # <-- renamed from failure_ledger
+        'facility': facility                             # incubators/shelves the weeks are planned into
     }
     with open(os.path.join(save_path, 'experiment.json'), 'w') as f:
         json.dump(experiment_dict, f, indent=4)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import json
+import pandas as pd
+
+try:
+    from digflow.ledger import load_ledger
+    from digflow.simulate import estimate_failure_rates, in_flight_experiments, simulate_screens, summarise_weeks
+    from digflow.facility import load_facility, validate_facility, incubator_names, incubator_capacities
+except ImportError:  # running from a source checkout: digflow/ is on sys.path
+    from ledger import load_ledger
+    from simulate import estimate_failure_rates, in_flight_experiments, simulate_screens, summarise_weeks
+    from facility import load_facility, validate_facility, incubator_names, incubator_capacities
+
+# ----------------- loading -----------------
+def load_screen_state(root: str, master_name: str):
+    """Return (experiment, ledger, master_df) from the top-level experiment.json and master CSV of a screen."""
+    exp_path = os.path.join(root, "experiment.json")
+    if not os.path.exists(exp_path):
+        raise FileNotFoundError(f"experiment.json not found in {root}")
+    with open(exp_path, "r") as f:
+        exp = json.load(f)
+
+    ledger = load_ledger(exp)  # the same targets screen-week-update plans with
+
+    master_path = os.path.join(root, master_name)
+    if os.path.exists(master_path):
+        master_df = pd.read_csv(master_path)
+        master_df["condition"] = master_df["condition"].astype(str).str.strip()
+    else:
+        master_df = pd.DataFrame(columns=["condition", "_is_neg1"])
+    return exp, ledger, master_df
+
+# ----------------- main -----------------
+def main():
+    parser = argparse.ArgumentParser(
+        description="Monte Carlo forecast of the weeks left until every condition reaches its target, using the current ledger and historical -1 rates."
+    )
+    parser.add_argument("-f", "--folder", required=True, help="Root folder of the screen (with experiment.json and the master CSV)")
+    parser.add_argument("--master-name", default="master-file.csv", help="Filename for the master CSV at root (default: master-file.csv)")
+    parser.add_argument("-n", "--simulations", type=int, default=10000, help="Number of simulated screens (default: 10000)")
+    parser.add_argument("-nc", "--per-incubator-conditions", dest="per_incubator_conditions", type=int, default=None,
+                        help="Number of CONDITIONS per incubator per week. Default: slots - controls_per_collection for each incubator")
+    parser.add_argument("--facility", default=None, help="Facility JSON to forecast with (e.g. with an extra incubator). Default: the one in experiment.json")
+    parser.add_argument("--max-weeks", type=int, default=104, help="Stop simulating after this many weeks (default: 104)")
+    parser.add_argument("--failure-lag", type=int, default=0, help="Weeks before a -1 is entered and re-queued (default: 0)")
+    parser.add_argument("--prior-strength", type=float, default=12, help="Replicates' worth of screen-wide rate mixed into each condition's rate (default: 12)")
+    parser.add_argument("--default-failure-rate", type=float, default=0.1, help="Failure rate to assume before any week has been scored (default: 0.1)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed, for reproducible forecasts")
+    parser.add_argument("-o", "--output", default=None, help="Write the summary JSON here as well as printing it")
+    args = parser.parse_args()
+
+    root = os.path.abspath(args.folder)
+    exp, ledger, master_df = load_screen_state(root, args.master_name)
+
+    conditions = exp["conditions"]
+    replicates = int(exp["replicates_per_experiment"])
+    target = int(exp.get("target_replicates_total", replicates))
+    facility = load_facility(args.facility) if args.facility else validate_facility(exp.get("facility", {}))
+    capacities = incubator_capacities(facility, int(exp["controls_per_collection"]), args.per_incubator_conditions)
+
+    rates = estimate_failure_rates(master_df, conditions, args.prior_strength, args.default_failure_rate)
+    in_flight = in_flight_experiments(ledger, master_df, conditions, replicates)
+    weeks = simulate_screens(ledger, conditions, exp.get("completed_counts", {}), rates, target, replicates, capacities,
+                             in_flight=in_flight, n_sims=args.simulations, max_weeks=args.max_weeks, failure_lag=args.failure_lag, seed=args.seed)
+
+    summary = summarise_weeks(weeks)
+    summary.update({
+        "target_replicates_total": target,
+        "per_incubator_target": {f"incubator{inc}": cap for inc, cap in zip(incubator_names(facility), capacities)},
+        "failure_lag_weeks": args.failure_lag,
+        "in_flight_experiments": int(in_flight.sum()),
+        "seed": args.seed,
+        "failure_rates": {c: round(float(r), 4) for c, r in zip(conditions, rates)},
+    })
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=4)
+
+    print(f"\nSimulated screens:     {summary['simulations']} (max {args.max_weeks} weeks)")
+    print(f"Completed:             {summary['completed_fraction']:.1%}")
+    if summary["completed"]:
+        pct = summary["percentiles"]
+        print(f"Weeks to completion:   mean {summary['mean_weeks']:.1f}, median {pct['p50']:.0f}, 5-95% {pct['p5']:.0f}-{pct['p95']:.0f}")
+    if args.output:
+        print(f"Summary written to:    {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,25 @@ import argparse
 import os
 import re
 import json
+import hashlib
 from datetime import datetime, timedelta
 import pandas as pd
 import random
 
+try:
+    from digflow.screen import make_fixed_layout, build_shelves_df, cumulative_success_counts, cumulative_failure_counts, select_next_week, select_next_week_optimal
+    from digflow.ledger import load_ledger
+    from digflow.simulate import estimate_failure_rates
+    from digflow.facility import load_facility, validate_facility, incubator_names, incubator_capacities, shelves_per_rack, check_dates_fit
+except ImportError:  # running from a source checkout: digflow/ is on sys.path
+    from screen import make_fixed_layout, build_shelves_df, cumulative_success_counts, cumulative_failure_counts, select_next_week, select_next_week_optimal
+    from ledger import load_ledger
+    from simulate import estimate_failure_rates
+    from facility import load_facility, validate_facility, incubator_names, incubator_capacities, shelves_per_rack, check_dates_fit
+
 # Folders are now YYYY-MM-DD
 DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")  # YYYY-MM-DD
+MASTER_CACHE_DIR = ".master-cache"  # per-week parsed shelves (parquet), keyed by content hash
 
 # ----------------- date helpers -----------------
 def parse_monday(date_str_folder: str) -> datetime:
@@ -58,7 +71,6 @@ def load_experiment(exp_path: str) -> dict:
         data = json.load(f)
     required = [
         "conditions",
-        "remaining",
         "completed_counts",
         "replicates_per_experiment",
         "controls_per_collection",
@@ -67,6 +79,8 @@ def load_experiment(exp_path: str) -> dict:
     for k in required:
         if k not in data:
             raise ValueError(f"Missing '{k}' in {exp_path}")
+    if "ledger" not in data and "remaining" not in data:
+        raise ValueError(f"Missing 'ledger' (or legacy 'remaining') in {exp_path}")
     data["controls_per_collection"] = int(data["controls_per_collection"])
     data["replicates_per_experiment"] = int(data["replicates_per_experiment"])
     if not isinstance(data["completed_counts"], dict):
@@ -91,66 +105,149 @@ def list_date_subfolders(root: str):
     subs.sort(key=lambda s: datetime.strptime(s, "%Y-%m-%d"))
     return subs
 
+# ----------------- incremental master -----------------
+def file_sha1(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def load_cache_manifest(root: str) -> dict:
+    path = os.path.join(root, MASTER_CACHE_DIR, "manifest.json")
+    if not os.path.exists(path):
+        return {"weeks": {}, "master": None}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def save_cache_manifest(root: str, manifest: dict):
+    with open(os.path.join(root, MASTER_CACHE_DIR, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=4)
+
+def parse_week_shelves(shelves_path: str, week: str) -> pd.DataFrame:
+    """Read one week's shelves.csv and normalise it into typed master columns."""
+    df = pd.read_csv(shelves_path)
+    if "condition" not in df.columns or "amendments" not in df.columns:
+        raise ValueError(f"{shelves_path} must contain 'condition' and 'amendments' columns.")
+    df = df.copy()
+    df["condition"] = df["condition"].astype(str).str.strip()
+    am = df["amendments"]
+    # normalise booleans for -1 flags
+    df["_is_neg1"] = (am == -1) | (am.astype(str).str.strip() == "-1")
+    df["_is_success"] = (~df["_is_neg1"]) & (df["condition"].str.lower() != "control")
+    df["_week"] = week  # now YYYY-MM-DD
+    # free-text columns become nullable strings so every week has the same column types
+    df["amendments"] = am.astype("string")
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].astype("string")
+    return df
+
+def load_week(root: str, week: str, manifest: dict):
+    """
+    Return (df, cache_file, reparsed) for one week, reading shelves.csv only if it changed.
+    A week is unchanged if mtime and size match the manifest, or, failing that, its SHA-1 does
+    (e.g. the file was only touched). Cached frames are content-addressed and never overwritten; write_master_files
+    prunes the ones no snapshot refers to.
+    """
+    shelves_path = os.path.join(root, week, "shelves.csv")
+    stat = os.stat(shelves_path)
+    entry = manifest["weeks"].get(week)
+    cache_dir = os.path.join(root, MASTER_CACHE_DIR)
+
+    if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+        cache_file = entry["file"]
+    else:
+        sha1 = file_sha1(shelves_path)
+        cache_file = f"{week}_{sha1[:16]}.parquet"
+        manifest["weeks"][week] = {"mtime": stat.st_mtime, "size": stat.st_size, "sha1": sha1, "file": cache_file}
+
+    cache_path = os.path.join(cache_dir, cache_file)
+    if os.path.exists(cache_path):
+        return pd.read_parquet(cache_path), cache_file, False
+
+    df = parse_week_shelves(shelves_path, week)
+    df.to_parquet(cache_path, index=False)
+    return df, cache_file, True
+
 def rebuild_master_df(root: str, date_folders):
-    frames = []
+    """
+    Concatenate every week's shelves.csv into the master frame.
+    Returns (master_df, sources, reparsed): sources maps week -> cached parquet file, reparsed lists weeks read from CSV.
+    """
+    try:
+        pd.io.parquet.get_engine("auto")
+    except ImportError as e:
+        raise ImportError(f"The master cache ({MASTER_CACHE_DIR}) is parquet and needs pyarrow: pip install pyarrow") from e
+    os.makedirs(os.path.join(root, MASTER_CACHE_DIR), exist_ok=True)
+    manifest = load_cache_manifest(root)
+
+    frames, sources, reparsed = [], {}, []
     for d in date_folders:
-        shelves_path = os.path.join(root, d, "shelves.csv")
-        if not os.path.exists(shelves_path):
+        if not os.path.exists(os.path.join(root, d, "shelves.csv")):
             continue
-        df = pd.read_csv(shelves_path)
-        if "condition" not in df.columns or "amendments" not in df.columns:
-            raise ValueError(f"{shelves_path} must contain 'condition' and 'amendments' columns.")
-        df = df.copy()
-        df["condition"] = df["condition"].astype(str).str.strip()
-        am = df["amendments"]
-        # normalise booleans for -1 flags
-        df["_is_neg1"] = (am == -1) | (am.astype(str).str.strip() == "-1")
-        df["_is_success"] = (~df["_is_neg1"]) & (df["condition"].str.lower() != "control")
-        df["_week"] = d  # now YYYY-MM-DD
+        df, cache_file, was_parsed = load_week(root, d, manifest)
         frames.append(df)
+        sources[d] = cache_file
+        if was_parsed:
+            reparsed.append(d)
+    save_cache_manifest(root, manifest)
+
     if frames:
-        return pd.concat(frames, ignore_index=True)
-    return pd.DataFrame(columns=["condition", "amendments", "_is_neg1", "_is_success", "_week"])
+        return pd.concat(frames, ignore_index=True), sources, reparsed
+    return pd.DataFrame(columns=["condition", "amendments", "_is_neg1", "_is_success", "_week"]), sources, reparsed
 
-def write_master_files(root: str, current_week_dir: str, master_df: pd.DataFrame, root_name: str):
-    """Write master to ROOT and a timestamped snapshot in CURRENT week."""
+def load_master_snapshot(root: str, snapshot_path: str) -> pd.DataFrame:
+    """Rebuild the master frame exactly as it was when a master-file_*.json snapshot was written."""
+    with open(snapshot_path, "r") as f:
+        snapshot = json.load(f)
+    frames = [pd.read_parquet(os.path.join(root, MASTER_CACHE_DIR, cache_file)) for cache_file in snapshot["weeks"].values()]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def write_master_files(root: str, current_week_dir: str, master_df: pd.DataFrame, root_name: str, sources: dict):
+    """
+    Write master to ROOT (only if its inputs changed) and a snapshot in CURRENT week.
+    The snapshot records which cached week files made up the master, so it stays a few hundred bytes.
+    """
     os.makedirs(root, exist_ok=True)
     root_master_path = os.path.join(root, root_name)
-    master_df.to_csv(root_master_path, index=False)
+
+    manifest = load_cache_manifest(root)
+    if manifest.get("master") != sources or not os.path.exists(root_master_path):
+        master_df.to_csv(root_master_path, index=False)
+        manifest["master"] = sources
+        save_cache_manifest(root, manifest)
 
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    snapshot_name = f"master-file_{ts}.csv"
+    snapshot_name = f"master-file_{ts}.json"
     snapshot_path = os.path.join(current_week_dir, snapshot_name)
-    master_df.to_csv(snapshot_path, index=False)
+    with open(snapshot_path, "w") as f:
+        json.dump({"master_csv": root_master_path, "cache_dir": MASTER_CACHE_DIR, "weeks": sources}, f, indent=4)
+    prune_cache(root, manifest)
 
     return root_master_path, snapshot_path
 
-def cumulative_success_counts(master_df: pd.DataFrame) -> dict:
-    """Return total successful replicates per condition across ALL weeks."""
-    if master_df.empty:
-        return {}
-    ok = master_df[master_df["_is_success"]]
-    if ok.empty:
-        return {}
-    return ok.groupby("condition").size().to_dict()
-
-def cumulative_failure_counts(master_df: pd.DataFrame) -> dict:
-    """Return total (-1) counts per condition across ALL weeks (excluding control rows)."""
-    if master_df.empty:
-        return {}
-    fail = master_df[(master_df["_is_neg1"]) & (master_df["condition"].str.lower() != "control")]
-    if fail.empty:
-        return {}
-    return fail.groupby("condition").size().to_dict()
-
-def select_next_week(remaining: list, per_inc: int):
-    """Take next per_inc for incubator 1, then per_inc for incubator 2 (soft-fill if short)."""
-    r = list(remaining)
-    inc1 = r[:min(per_inc, len(r))]
-    r = r[len(inc1):]
-    inc2 = r[:min(per_inc, len(r))]
-    r = r[len(inc2):]
-    return inc1, inc2, r
+def prune_cache(root: str, manifest: dict) -> list[str]:
+    """
+    Delete cached week files that neither the manifest (the current weeks) nor any master-file_*.json snapshot refers
+    to, i.e. versions of a shelves.csv that were replaced before a snapshot used them. Nothing is deleted if a
+    snapshot can't be read. Returns the deleted file names.
+    """
+    cache_dir = os.path.join(root, MASTER_CACHE_DIR)
+    keep = {entry["file"] for entry in manifest["weeks"].values()}
+    for week in list_date_subfolders(root):
+        for name in os.listdir(os.path.join(root, week)):
+            if not (name.startswith("master-file_") and name.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(root, week, name), "r") as f:
+                    keep.update(json.load(f)["weeks"].values())
+            except (OSError, ValueError, KeyError, AttributeError):
+                print(f"Warning: could not read snapshot {os.path.join(week, name)}; keeping every cached week file")
+                return []
+    removed = [name for name in os.listdir(cache_dir) if name.endswith(".parquet") and name not in keep]
+    for name in removed:
+        os.remove(os.path.join(cache_dir, name))
+    return removed
 
 def write_timestamped_experiment(dir_path: str, payload: dict) -> str:
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -159,66 +256,6 @@ def write_timestamped_experiment(dir_path: str, payload: dict) -> str:
         json.dump(payload, f, indent=4)
     return out_path
 
-# ----------------- shelves-building -----------------
-def make_fixed_layout(base_conditions, controls_per_collection):
-    """Create a single, fixed layout (conditions + controls) for an incubator (≤ 24 rows total)."""
-    layout = base_conditions.copy()
-    layout.extend(['control'] * controls_per_collection)
-    random.shuffle(layout)  # different each run
-    return layout
-
-def build_shelves_df(dates, inc_layout, condition_locations):
-    """
-    Build shelves with:
-      - fixed per-incubator condition+control layout reused for every date
-      - per-rack random permutation per incubator to avoid shelf collisions within a rack
-      - if there are fewer than 24 items, we just emit fewer rows (no blank rows)
-    """
-    cols = ['experimenter','collector','incubator','shelf','rack','plugcamera',
-            'condition','location','staging_date','amendments','comments','staging_times']
-    df = pd.DataFrame(columns=cols)
-
-    num_racks = (len(dates) + 1) // 2  # 6 dates -> 3 racks
-
-    # random shelf order per rack per incubator
-    rack_shelf_map = {
-        inc: {r: random.sample([1, 2], 2) for r in range(num_racks)}
-        for inc in (1, 2)
-    }
-
-    for idx, date in enumerate(dates):
-        rack_idx = idx // 2          # 0,0,1,1,2,2
-        pos_in_pair = idx % 2        # 0 first date in the rack, 1 second
-        rack_num  = rack_idx + 1
-
-        for incubator in (1, 2):
-            shelf_num = rack_shelf_map[incubator][rack_idx][pos_in_pair]
-            shelf_conditions = inc_layout.get(incubator, [])
-            if not shelf_conditions:
-                continue
-
-            rows = []
-            for condition in shelf_conditions:
-                location = condition_locations.get(condition, '')
-                rows.append({
-                    'experimenter': '',
-                    'collector': '',
-                    'incubator': f'incubator-{incubator}',
-                    'shelf': f'shelf-{shelf_num}',
-                    'rack': f'rack-{rack_num}',
-                    'plugcamera': '',
-                    'condition': condition,
-                    'location': location,
-                    'staging_date': date,
-                    'amendments': '',
-                    'comments': '',
-                    'staging_times': ''
-                })
-            if rows:
-                df = pd.concat([df, pd.DataFrame(rows)], ignore_index=True)
-
-    return df
-
 # ----------------- completion check -----------------
 def all_conditions_complete(completed_counts: dict, target_reps: int, conditions: list[str]) -> bool:
     """True if every condition has completed_counts >= target_reps."""
@@ -240,7 +277,14 @@ def main():
     parser.add_argument("-nc", "--per-incubator-conditions", dest="per_incubator_conditions",
                         type=int, default=None,
                         help="Number of CONDITIONS per incubator for NEXT week (controls added on top). "
-                             "Default: 24 - controls_per_collection from experiment.json")
+                             "Default: slots - controls_per_collection for each incubator in the facility")
+    parser.add_argument("--facility", default=None,
+                        help="Facility JSON to plan NEXT week into (e.g. after adding an incubator). Default: the facility in experiment.json, "
+                             "or two incubators with 24 slots for older experiments")
+    parser.add_argument("--selection", choices=["round-robin", "optimal"], default="round-robin",
+                        help="How to pick next week: 'round-robin' takes the ledger queue in order; 'optimal' picks the conditions "
+                             "furthest from target_replicates_total (weighted by failure history) and balances the incubators. "
+                             "'optimal' always writes next_conditions.json with its rationale.")
     args = parser.parse_args()
 
     # Paths & dates
@@ -273,13 +317,17 @@ def main():
     exp = load_experiment(exp_path)
 
     controls_per_collection = exp["controls_per_collection"]
-    default_per_inc = 24 - controls_per_collection
-    per_inc = args.per_incubator_conditions if args.per_incubator_conditions is not None else default_per_inc
+    if args.facility:
+        facility = load_facility(args.facility)
+    else:
+        facility = validate_facility(exp.get("facility", {}))
+    incubators = incubator_names(facility)
+    capacities = incubator_capacities(facility, controls_per_collection, args.per_incubator_conditions)
 
     # 2) Rebuild master (root) + snapshot (current week)
     date_folders = list_date_subfolders(root)  # now matches YYYY-MM-DD folders
-    master_df = rebuild_master_df(root, date_folders)
-    root_master_path, snapshot_path = write_master_files(root, current_week_dir, master_df, args.master_name)
+    master_df, master_sources, reparsed_weeks = rebuild_master_df(root, date_folders)
+    root_master_path, snapshot_path = write_master_files(root, current_week_dir, master_df, args.master_name, master_sources)
 
     # 3) Recompute successes (literal N) across ALL weeks
     success_totals = cumulative_success_counts(master_df)
@@ -291,50 +339,59 @@ def main():
     failure_totals = cumulative_failure_counts(master_df)  # cumulative across all time
 
     newly_appended = {}
-    remaining = list(exp["remaining"])
+    ledger = load_ledger(exp)
     for cond, total_fails in failure_totals.items():
         prev = prev_failure_counts.get(cond, 0)
         delta = int(total_fails) - int(prev)
         if delta > 0:
-            remaining.extend([cond] * delta)
+            ledger.record_failure(cond, delta)
             newly_appended[cond] = delta
     new_failure_counts = {**prev_failure_counts, **{k: int(v) for k, v in failure_totals.items()}}
 
+    # Determine the correct target for completion check
+    if "target_replicates_total" in exp:
+        target_total = int(exp["target_replicates_total"])
+        fallback_note = None
+    else:
+        target_total = int(exp["replicates_per_experiment"])  # fallback (usually 6)
+        fallback_note = "(completion target fallback to replicates_per_experiment; add 'target_replicates_total' to experiment.json for strict check)"
+
     # 5) Select next batch (soft-fill if short)
-    inc1, inc2, new_remaining = select_next_week(remaining, per_inc)
-    next_total = len(inc1) + len(inc2)
+    rationale = None
+    if args.selection == "optimal":
+        rates = estimate_failure_rates(master_df, exp["conditions"])
+        picks, rationale = select_next_week_optimal(
+            ledger, capacities, exp["conditions"], new_completed_counts,
+            dict(zip(exp["conditions"], rates)), target_total, exp["replicates_per_experiment"]
+        )
+    else:
+        picks = select_next_week(ledger, capacities)
+    next_total = sum(len(p) for p in picks)
 
     # 6) Build NEXT week's shelves.csv
-    inc_layout = {
-        1: make_fixed_layout(inc1, controls_per_collection),
-        2: make_fixed_layout(inc2, controls_per_collection),
-    }
+    inc_layout = {inc: make_fixed_layout(picked, controls_per_collection) for inc, picked in zip(incubators, picks)}
     next_dates = calculate_dates(next_date_display)  # calculate_dates expects DD-MM-YYYY
+    check_dates_fit(facility, next_dates)
     shelves_df = build_shelves_df(
         dates=next_dates,
         inc_layout=inc_layout,
-        condition_locations=exp["condition_locations"]
+        condition_locations=exp["condition_locations"],
+        incubators=incubators,
+        shelves_per_rack=shelves_per_rack(facility)
     )
     shelves_csv_path = os.path.join(next_week_dir, "shelves.csv")
     shelves_df.to_csv(shelves_csv_path, index=False)
 
-    # Determine the correct target for completion check
-    if "target_replicates_total" in exp:
-        target_total = int(exp["target_replicates_total"])
-        fallback_note = None
-    else:
-        target_total = int(exp["replicates_per_experiment"])  # fallback (usually 6)
-        fallback_note = "(completion target fallback to replicates_per_experiment; add 'target_replicates_total' to experiment.json for strict check)"
-
     # 7) Compose post-update experiment payload (state to carry forward)
     next_payload = {
         "conditions": exp["conditions"],
-        "remaining": new_remaining,
+        "ledger": ledger.to_dict(),                            # per-condition target/done/failed/queued experiments
         "completed_counts": new_completed_counts,              # recomputed literal N
         "replicates_per_experiment": exp["replicates_per_experiment"],
         "controls_per_collection": controls_per_collection,
         "condition_locations": exp["condition_locations"],
         "failure_counts": new_failure_counts,                  # renamed from failure_ledger
+        "facility": facility,                                  # incubators/shelves the weeks are planned into
     }
     if "target_replicates_total" in exp:
         next_payload["target_replicates_total"] = target_total
@@ -352,25 +409,29 @@ def main():
         json.dump(next_payload, f, indent=4)
 
     # 10) Optional next_picks
-    if args.emit_next_picks:
+    if args.emit_next_picks or rationale is not None:
         next_picks = {
             "week_commencing": next_date_display,  # human-friendly DD-MM-YYYY
-            "per_incubator_target": per_inc,
-            "incubator1": inc1,
-            "incubator2": inc2,
+            "per_incubator_target": {f"incubator{inc}": cap for inc, cap in zip(incubators, capacities)},
+            **{f"incubator{inc}": picked for inc, picked in zip(incubators, picks)},
             "picked_total": next_total,
             "new_failures_appended_this_run": newly_appended,
             "master_csv_root": root_master_path,
-            "master_csv_snapshot": snapshot_path
+            "master_csv_snapshot": snapshot_path,
+            "selection": args.selection,
         }
+        if rationale is not None:
+            next_picks["rationale"] = rationale
         with open(os.path.join(next_week_dir, "next_conditions.json"), "w") as f:
             json.dump(next_picks, f, indent=4)
 
     # 11) Prints + completion notice (based on recomputed totals)
     print(f"\nMaster (root):         {root_master_path}")
     print(f"Master snapshot (wk):  {snapshot_path}")
+    print(f"Weeks re-read from shelves.csv: {len(reparsed_weeks)} of {len(master_sources)}.")
     print(f"Newly appended failures (delta): {sum(newly_appended.values())} across {len(newly_appended)} condition(s).")
-    print(f"Next batch picked: incubator1={len(inc1)}, incubator2={len(inc2)} (target {per_inc} each).")
+    picked_str = ", ".join(f"incubator{inc}={len(picked)}/{cap}" for inc, picked, cap in zip(incubators, picks, capacities))
+    print(f"Next batch picked: {picked_str} (picked/target).")
     print(f"NEXT week folder:      {next_week_dir}")
     print(f"  - shelves.csv:       {shelves_csv_path}")
     print(f"  - experiment.json:   {next_exp_canonical}")
@@ -0,0 +1,163 @@
+import random
+import numpy as np
+import pandas as pd
+
+# Shared by screen-initiate.py and screen-week-update.py; incubator sizes come from the facility description (facility.py)
+
+SHELVES_COLUMNS = ['experimenter','collector','incubator','shelf','rack','plugcamera',
+                   'condition','location','staging_date','amendments','comments','staging_times']
+
+# ----------------- master / selection -----------------
+def cumulative_success_counts(master_df: pd.DataFrame) -> dict:
+    """Return total successful replicates per condition across ALL weeks."""
+    if master_df.empty:
+        return {}
+    ok = master_df[master_df["_is_success"]]
+    if ok.empty:
+        return {}
+    return ok.groupby("condition").size().to_dict()
+
+def cumulative_failure_counts(master_df: pd.DataFrame) -> dict:
+    """Return total (-1) counts per condition across ALL weeks (excluding control rows)."""
+    if master_df.empty:
+        return {}
+    fail = master_df[(master_df["_is_neg1"]) & (master_df["condition"].str.lower() != "control")]
+    if fail.empty:
+        return {}
+    return fail.groupby("condition").size().to_dict()
+
+def per_incubator(capacities) -> list[int]:
+    """Conditions per incubator as a list; a single number means that many for each of two incubators (the old default)."""
+    if isinstance(capacities, (int, np.integer)):
+        return [int(capacities)] * 2
+    return [int(c) for c in capacities]
+
+def select_next_week(ledger, capacities):
+    """Take the next capacities[i] for each incubator in turn (soft-fill if short). Updates the ledger; returns one list per incubator."""
+    return [ledger.select(n) for n in per_incubator(capacities)]
+
+def select_next_week_optimal(ledger, capacities, conditions: list[str], completed_counts: dict,
+                             failure_rates, target: int, replicates: int):
+    """
+    Pick next week by how far each condition is from target instead of by queue order. Updates the ledger.
+
+    A condition's need is the number of experiments it is still expected to take: its missing replicates
+    divided by the replicates an experiment yields on average (replicates * (1 - failure rate)). The weeks
+    a screen takes are set by its neediest conditions, so each free slot goes to the condition with the
+    largest need left after the slots it already got (longest-job-first); ties go to the higher failure
+    rate, then to queue order. Only queued experiments can be picked.
+    The picks are dealt out to the incubators in turn in order of failure rate, so every incubator gets
+    a similar expected number of -1s and repeats of a condition land in different incubators.
+    Returns (picks per incubator, rationale).
+    """
+    capacities = per_incubator(capacities)
+    queue_order = {cond: i for i, cond in enumerate(c for c in ledger.rotation if ledger.queued(c) > 0)}
+    conds = np.array([c for c in conditions if ledger.queued(c) > 0], dtype=object)
+    slots = sum(capacities)
+    if len(conds) == 0 or slots == 0:
+        return [[] for _ in capacities], []
+
+    rates = np.array([float(failure_rates.get(c, 0.0)) for c in conds])
+    missing = np.array([max(0, target - int(completed_counts.get(c, 0))) for c in conds], dtype=float)
+    need = missing / (replicates * np.clip(1 - rates, 0.05, None))
+    queued = np.array([ledger.queued(c) for c in conds])
+    order = np.array([queue_order.get(c, len(queue_order)) for c in conds])
+
+    # one candidate per queued experiment (at most `slots` per condition); the j-th pick of a condition scores need - j
+    copies = np.minimum(queued, slots)
+    cand = np.repeat(np.arange(len(conds)), copies)
+    j = np.arange(len(cand)) - np.repeat(np.cumsum(copies) - copies, copies)
+    score = need[cand] - j
+    best = np.lexsort((order[cand], j, -rates[cand], -score))[:slots]
+    cand, j, score = cand[best], j[best], score[best]
+
+    # deal out to the incubators in turn (skipping full ones), highest failure rate first
+    turns = np.array([i for r in range(max(capacities)) for i, cap in enumerate(capacities) if cap > r])
+    deal = np.lexsort((j, order[cand], -rates[cand]))
+    incubator = np.empty(len(cand), dtype=int)
+    incubator[deal] = turns[:len(cand)]
+    picks = [[conds[i] for i in cand[deal][incubator[deal] == k]] for k in range(len(capacities))]
+
+    for cond, n in zip(*np.unique(conds[cand].astype(str), return_counts=True)):
+        ledger.take(cond, int(n))
+
+    rationale = [{
+        "condition": conds[i],
+        "incubator": int(inc) + 1,
+        "pick": int(k) + 1,
+        "completed": int(completed_counts.get(conds[i], 0)),
+        "missing_replicates": int(missing[i]),
+        "failure_rate": round(float(rates[i]), 4),
+        "expected_experiments_needed": round(float(need[i]), 2),
+        "score": round(float(s), 2),
+    } for i, k, s, inc in zip(cand, j, score, incubator)]
+    return picks, rationale
+
+# ----------------- shelves-building -----------------
+def make_fixed_layout(base_conditions, controls_per_collection):
+    """Create a single, fixed layout (conditions + controls) for an incubator (≤ 24 rows total)."""
+    layout = base_conditions.copy()
+    layout.extend(['control'] * controls_per_collection)
+    random.shuffle(layout)  # different each run
+    return layout
+
+def build_shelves_df(dates, inc_layout, condition_locations, incubators=(1, 2), shelves_per_rack=2):
+    """
+    Build shelves with:
+      - fixed per-incubator condition+control layout reused for every date
+      - per-rack random permutation per incubator to avoid shelf collisions within a rack
+      - if there are fewer than 24 items, we just emit fewer rows (no blank rows)
+    Dates fill the racks of each incubator in order, shelves_per_rack dates per rack (an int, or one per incubator).
+    Rows are the cross product dates x incubators x layout, built in one step with index arrays.
+    """
+    spr = np.array(list(shelves_per_rack) if not isinstance(shelves_per_rack, (int, np.integer)) else [shelves_per_rack] * len(incubators))
+    num_racks = -(-len(dates) // spr)  # 6 dates, 2 shelves per rack -> 3 racks
+
+    # random shelf order per rack per incubator, shape (incubators, racks, shelves per rack), padded to the largest incubator
+    shelf_perm = np.zeros((len(incubators), max(num_racks, default=0), max(spr, default=0)), dtype=int)
+    for i in range(len(incubators)):
+        for r in range(num_racks[i]):
+            shelf_perm[i, r, :spr[i]] = random.sample(list(range(1, spr[i] + 1)), spr[i])
+
+    # incubators with a non-empty layout, and their layouts laid end to end
+    used = [i for i, inc in enumerate(incubators) if inc_layout.get(inc, [])]
+    if not dates or not used:
+        return pd.DataFrame(columns=SHELVES_COLUMNS)
+    layouts = [list(inc_layout[incubators[i]]) for i in used]
+    lengths = np.array([len(layout) for layout in layouts])
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    all_conditions = np.array(sum(layouts, []), dtype=object)
+
+    # one block per (date, incubator), date-major; one row per layout slot within a block
+    block_date = np.repeat(np.arange(len(dates)), len(used))
+    block_inc = np.tile(np.arange(len(used)), len(dates))
+    block_len = lengths[block_inc]
+    row_block = np.repeat(np.arange(len(block_date)), block_len)
+    row_in_block = np.arange(block_len.sum()) - np.repeat(np.cumsum(block_len) - block_len, block_len)
+
+    row_date = block_date[row_block]
+    row_inc = block_inc[row_block]
+    row_spr = spr[np.array(used)[row_inc]]
+    rack_idx = row_date // row_spr       # 0,0,1,1,2,2
+    pos_in_rack = row_date % row_spr     # 0 first date in the rack, 1 second, ...
+    shelf_num = shelf_perm[np.array(used)[row_inc], rack_idx, pos_in_rack]
+
+    condition = pd.Series(all_conditions[starts[row_inc] + row_in_block])
+    inc_labels = np.array([f'incubator-{incubators[i]}' for i in used], dtype=object)
+    n = len(row_block)
+    blank = np.full(n, '', dtype=object)
+
+    return pd.DataFrame({
+        'experimenter': blank,
+        'collector': blank,
+        'incubator': inc_labels[row_inc],
+        'shelf': np.char.add('shelf-', shelf_num.astype(str)).astype(object),
+        'rack': np.char.add('rack-', (rack_idx + 1).astype(str)).astype(object),
+        'plugcamera': blank,
+        'condition': condition.to_numpy(),
+        'location': condition.map(condition_locations).fillna('').to_numpy(),
+        'staging_date': np.array(dates, dtype=object)[row_date],
+        'amendments': blank,
+        'comments': blank,
+        'staging_times': blank,
+    }, columns=SHELVES_COLUMNS)
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+try:
+    from digflow.ledger import ConditionLedger, rotation_keys, select_round_robin, requeue_round_robin
+except ImportError:  # running from a source checkout: digflow/ is on sys.path
+    from ledger import ConditionLedger, rotation_keys, select_round_robin, requeue_round_robin
+
+# Monte Carlo forecast of how many more weeks a screen needs, used by screen-simulate.py
+
+# ----------------- failure rates -----------------
+def estimate_failure_rates(master_df: pd.DataFrame, conditions: list[str], prior_strength: float = 12, default_rate: float = 0.1) -> np.ndarray:
+    """
+    Per-condition probability that a replicate is marked -1, from the master file.
+
+    Each condition's observed rate is shrunk towards the screen-wide rate with a Beta prior worth
+    prior_strength replicates, so conditions with only a few rows do not get a rate of 0 or 1.
+    default_rate is used as the screen-wide rate when the master has no (non-control) rows yet.
+    """
+    rows = pd.Series(0, index=conditions, dtype=float)
+    fails = pd.Series(0, index=conditions, dtype=float)
+    overall = default_rate
+    if not master_df.empty:
+        df = master_df[master_df["condition"].astype(str).str.lower() != "control"]
+        if len(df):
+            is_neg1 = df["_is_neg1"].astype(bool)
+            overall = float(is_neg1.mean())
+            rows = df.groupby("condition").size().reindex(conditions, fill_value=0).astype(float)
+            fails = is_neg1.groupby(df["condition"]).sum().reindex(conditions, fill_value=0).astype(float)
+    return ((fails + prior_strength * overall) / (rows + prior_strength)).to_numpy()
+
+# ----------------- simulation -----------------
+def in_flight_experiments(ledger: ConditionLedger, master_df: pd.DataFrame, conditions: list[str], replicates: int) -> np.ndarray:
+    """Experiments handed out by the ledger whose rows are not in the master yet (the week already picked)."""
+    done = np.array([ledger.counts.get(c, [0, 0, 0, 0])[1] for c in conditions], dtype=np.int64)
+    rows = master_df.groupby("condition").size() if not master_df.empty else pd.Series(dtype=int)
+    run = rows.reindex(conditions, fill_value=0).to_numpy() // replicates
+    return np.maximum(done - run, 0)
+
+def simulate_screens(ledger: ConditionLedger, conditions: list[str], completed_counts: dict, failure_rates: np.ndarray,
+                     target: int, replicates: int, capacities, in_flight=None, n_sims: int = 10000, max_weeks: int = 104,
+                     failure_lag: int = 0, seed=None) -> np.ndarray:
+    """
+    Run n_sims copies of the weekly loop in lock-step and return the weeks each needed to complete (np.nan if not within max_weeks).
+
+    A week mirrors the lab: the picked experiments are run, each giving `replicates` rows that are marked -1
+    with the condition's failure rate, every -1 queues the condition again (failure_lag weeks later, for
+    failures entered late), and screen-week-update.py picks capacities[i] experiments for each incubator for
+    the next week with the ledger's round-robin. in_flight holds the experiments of the week that is already picked.
+    The screen is complete when every condition has `target` successful rows.
+    All randomness comes from np.random.default_rng(seed).
+    """
+    rng = np.random.default_rng(seed)
+    n_cond = len(conditions)
+    queued = np.tile(np.array([ledger.queued(c) for c in conditions], dtype=np.int64), (n_sims, 1))
+    keys = np.tile(rotation_keys(ledger, conditions), (n_sims, 1))
+    next_key = np.full(n_sims, float(len(ledger.rotation)))
+    successes = np.tile(np.array([int(completed_counts.get(c, 0)) for c in conditions], dtype=np.int64), (n_sims, 1))
+    picks = np.zeros((n_sims, n_cond), dtype=np.int64)
+    if in_flight is not None:
+        picks += np.asarray(in_flight, dtype=np.int64)
+    pending = [np.zeros((n_sims, n_cond), dtype=np.int64) for _ in range(failure_lag)]
+
+    weeks = np.full(n_sims, np.nan)
+    weeks[(successes >= target).all(axis=1)] = 0
+    for week in range(1, max_weeks + 1):
+        running = np.isnan(weeks)
+        if not running.any():
+            break
+
+        # run this week's picks
+        rows = picks * replicates * running[:, None]
+        failures = rng.binomial(rows, failure_rates)
+        successes += rows - failures
+        weeks[running & (successes >= target).all(axis=1)] = week
+
+        # failures reach the ledger failure_lag weeks later, then next week is picked as in select_next_week
+        pending.append(failures)
+        requeue_round_robin(queued, keys, next_key, pending.pop(0))
+        picks = sum(select_round_robin(queued, keys, next_key, n) for n in capacities)
+    return weeks
+
+def summarise_weeks(weeks: np.ndarray, percentiles=(5, 25, 50, 75, 95)) -> dict:
+    """Distribution of weeks to completion: share completed, mean, percentiles and a histogram."""
+    done = weeks[~np.isnan(weeks)]
+    summary = {"simulations": int(len(weeks)), "completed": int(len(done)),
+               "completed_fraction": float(len(done) / len(weeks)) if len(weeks) else 0.0}
+    if len(done):
+        summary["mean_weeks"] = float(done.mean())
+        summary["percentiles"] = {f"p{p}": float(np.percentile(done, p)) for p in percentiles}
+        values, counts = np.unique(done.astype(int), return_counts=True)
+        summary["histogram"] = {str(v): int(c) for v, c in zip(values, counts)}
+    return summary
@@ -0,0 +1,178 @@
+import os
+import re
+import json
+import math
+import numpy as np
+from datetime import datetime
+
+# Slurm requests per sbatch script as they were hardcoded; used until a stage has enough history
+DEFAULT_RESOURCES = {
+    'array_transfer': {'mem_mb': 10 * 1024, 'cpus': 4, 'time_min': 8 * 60},
+    'pupae_transfer': {'mem_mb': 10 * 1024, 'cpus': 4, 'time_min': 8 * 60},
+    'sleap_still':    {'mem_mb': 32 * 1024, 'cpus': 8, 'time_min': 8 * 60},
+    'sleap_video':    {'mem_mb': 64 * 1024, 'cpus': 16, 'time_min': 8 * 60},
+    'pipeline':       {'mem_mb': 30 * 1024, 'cpus': 8, 'time_min': 24 * 60},
+    'sleap_pipeline': {'mem_mb': 16 * 1024, 'cpus': 8, 'time_min': 12 * 60},
+}
+FALLBACK_RESOURCES = {'mem_mb': 16 * 1024, 'cpus': 8, 'time_min': 8 * 60}
+
+# ---------- sacct fields ----------
+def slurm_seconds(value):
+    """Seconds from a sacct duration: [D-]HH:MM:SS, MM:SS.mmm or MM:SS; None if empty."""
+    if not value or value in ('INVALID', 'UNLIMITED', 'Partition_Limit'):
+        return None
+    days, _, clock = value.rpartition('-')
+    parts = [float(p) for p in clock.split(':')]
+    while len(parts) < 3:
+        parts.insert(0, 0.0)
+    return (int(days) if days else 0) * 86400 + parts[0] * 3600 + parts[1] * 60 + parts[2]
+
+def slurm_mb(value):
+    """Megabytes from a sacct size (MaxRSS, ReqMem: '1234M', '2.5G', '512K', with an optional n/c suffix); None if empty."""
+    match = re.match(r'^([\d.]+)([KMGT]?)', value or '')
+    if not match:
+        return None
+    scale = {'': 1 / 1024 ** 2, 'K': 1 / 1024, 'M': 1, 'G': 1024, 'T': 1024 ** 2}[match.group(2)]  # no unit: bytes
+    return float(match.group(1)) * scale
+
+def task_usage(rows):
+    """
+    Collapse sacct rows (allocation, .batch, .extern, ... per array task) to one record per task:
+    peak MaxRSS over the steps, elapsed and CPU time and state of the allocation.
+    """
+    tasks = {}
+    for row in rows:
+        task_id = row['JobID'].split('.')[0]
+        task = tasks.setdefault(task_id, {'job_id': task_id, 'task': row.get('task'), 'state': None, 'elapsed_s': None,
+                                          'cpu_s': None, 'cpus': None, 'req_mem_mb': None, 'max_rss_mb': None})
+        rss = slurm_mb(row.get('MaxRSS'))
+        if rss is not None:
+            task['max_rss_mb'] = max(task['max_rss_mb'] or 0, rss)
+        if '.' not in row['JobID']:
+            task['state'] = row['State'].split()[0]  # 'CANCELLED by 123' -> 'CANCELLED'
+            task['elapsed_s'] = slurm_seconds(row.get('Elapsed'))
+            task['cpu_s'] = slurm_seconds(row.get('TotalCPU'))
+            task['cpus'] = int(row['AllocCPUS']) if row.get('AllocCPUS', '').isdigit() else None
+            task['req_mem_mb'] = slurm_mb(row.get('ReqMem'))
+            if row.get('task') is not None:
+                task['task'] = row['task']
+    return [t for t in tasks.values() if t['state'] is not None]
+
+# ---------- sizing ----------
+class ResourceModel:
+    """
+    Slurm requests sized from the sacct usage of earlier jobs of the same experiment type and stage.
+
+    History is one JSON-lines file per experiment type ({history_path}/{exp_type}.jsonl), a line per finished
+    array task with its input size (bytes, frames, ... whatever the stage is sized by). For a new job, memory and
+    time are fitted as a + b * size over the completed tasks, raised to cover every observed task (upper envelope),
+    then multiplied by a safety margin. CPUs are the most cores a task actually kept busy (CPU time / elapsed),
+    plus the margin. Tasks killed for running out of memory or time count as needing 1.5x what they were given.
+    Until a stage has min_samples tasks, the old hardcoded requests (DEFAULT_RESOURCES) are used.
+    """
+    def __init__(self, history_path, exp_type, mem_margin=1.25, time_margin=1.5, cpu_margin=1.25, min_samples=5,
+                 max_resources=None):
+        self.history_path = history_path
+        self.exp_type = exp_type
+        self.mem_margin = mem_margin
+        self.time_margin = time_margin
+        self.cpu_margin = cpu_margin
+        self.min_samples = min_samples
+        self.max_resources = max_resources or {'mem_mb': 256 * 1024, 'cpus': 64, 'time_min': 72 * 60}
+
+    @property
+    def path(self):
+        return os.path.join(self.history_path, f'{self.exp_type}.jsonl')
+
+    def history(self, stage=None):
+        if not self.history_path or not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    if stage is None or record['stage'] == stage:
+                        records.append(record)
+        return records
+
+    def record(self, stage, rows, sizes=None, size=None, experiment=''):
+        """
+        Append a finished job's sacct rows (profiler.sacct_usage) to the history. sizes maps each task's tag
+        (rig, video name) to its input size; size is used for tasks without one. Returns the records written.
+        """
+        if not self.history_path:
+            return []
+        known = {r['job_id'] for r in self.history(stage)}
+        records = []
+        for task in task_usage(rows):
+            if task['job_id'] in known or task['state'] in ('PENDING', 'RUNNING', 'REQUEUED'):
+                continue
+            task_size = (sizes or {}).get(task['task'], size)
+            records.append({'stage': stage, 'experiment': experiment, 'size': task_size,
+                            'recorded': datetime.now().isoformat(timespec='seconds'), **task})
+        if records:
+            os.makedirs(self.history_path, exist_ok=True)
+            with open(self.path, 'a') as f:
+                for record in records:
+                    f.write(json.dumps(record) + '\n')
+        return records
+
+    def record_jobs(self, jobs, experiment=''):
+        """Record every job a StageProfiler collected usage for, under its sbatch script name (or stage if it has none)."""
+        for job in jobs:
+            if job.get('usage'):
+                self.record(job.get('script') or job['stage'], job['usage'], sizes=job.get('sizes'), size=job.get('size'), experiment=experiment)
+
+    def fit(self, records, field, size):
+        """Upper-envelope linear fit of field against input size, evaluated at size (the observed max if size is unknown)."""
+        values = np.array([r[field] for r in records], dtype=float)
+        sizes = np.array([r['size'] if r['size'] is not None else np.nan for r in records], dtype=float)
+        sized = ~np.isnan(sizes)
+        if size is None or sized.sum() < self.min_samples or np.ptp(sizes[sized]) == 0:
+            return float(values.max())
+        slope, intercept = np.polyfit(sizes[sized], values[sized], 1)
+        slope = max(slope, 0.0)
+        intercept += max(0.0, float(np.max(values[sized] - (intercept + slope * sizes[sized]))))
+        return float(intercept + slope * size)
+
+    def observations(self, stage):
+        """Completed tasks, plus tasks killed for memory/time counted at 1.5x what they were given."""
+        records = []
+        for r in self.history(stage):
+            if r['state'] == 'COMPLETED' and r['max_rss_mb'] is not None and r['elapsed_s']:
+                records.append(r)
+            elif r['state'] == 'OUT_OF_MEMORY' and r['req_mem_mb'] and r['elapsed_s']:
+                records.append({**r, 'max_rss_mb': 1.5 * r['req_mem_mb']})
+            elif r['state'] == 'TIMEOUT' and r['elapsed_s'] and r['max_rss_mb'] is not None:
+                records.append({**r, 'elapsed_s': 1.5 * r['elapsed_s']})
+        return records
+
+    def recommend(self, stage, size=None):
+        """Requests for a new job of stage with the given input size: {'mem_mb', 'cpus', 'time_min', 'source'}."""
+        default = DEFAULT_RESOURCES.get(stage, FALLBACK_RESOURCES)
+        records = self.observations(stage)
+        if len(records) < self.min_samples:
+            return {**default, 'source': f'default ({len(records)} of {self.min_samples} jobs in history)'}
+
+        mem_mb = self.fit(records, 'max_rss_mb', size) * self.mem_margin
+        time_min = self.fit(records, 'elapsed_s', size) * self.time_margin / 60
+        busy = [r['cpu_s'] / r['elapsed_s'] for r in records if r['cpu_s'] is not None]
+        cpus = max(busy, default=default['cpus']) * self.cpu_margin
+
+        return {'mem_mb': int(min(self.max_resources['mem_mb'], max(1024, 1024 * math.ceil(mem_mb / 1024)))),
+                'cpus': int(min(self.max_resources['cpus'], max(1, math.ceil(cpus)))),
+                'time_min': int(min(self.max_resources['time_min'], max(30, 15 * math.ceil(time_min / 15)))),
+                'source': f'history ({len(records)} jobs)'}
+
+# ---------- sbatch ----------
+def format_time(minutes):
+    """Slurm --time value, D-HH:MM:SS if a day or longer."""
+    days, rest = divmod(int(minutes), 24 * 60)
+    clock = f'{rest // 60:02d}:{rest % 60:02d}:00'
+    return f'{days}-{clock}' if days else clock
+
+def sbatch_options(resources):
+    """Command-line options for sbatch; these override the #SBATCH lines of a script."""
+    return [f'--mem={resources["mem_mb"]}M', f'--cpus-per-task={resources["cpus"]}', f'--time={format_time(resources["time_min"])}']
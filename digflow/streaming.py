@@ -0,0 +1,148 @@
+import os
+import time
+import queue
+import threading
+
+# Item-level pipelining for the pupae pipeline: a watcher thread feeds files to worker threads through bounded
+# queues, so a slow stage holds back the ones before it instead of letting work pile up in memory.
+
+DONE = object()  # end-of-stream marker passed down the queues
+
+class ArrivalWatcher:
+    """
+    Finds files in a folder once they are completely written. rsync writes into a dot-prefixed temporary file
+    (.name.XXXXXX) and renames it when done, so dot files are ignored; a file must also keep the same size and
+    mtime for `settle` seconds, for copies that write in place. Each file is returned by scan() only once.
+    """
+    def __init__(self, folder, accept=lambda name: True, settle=30):
+        self.folder = folder
+        self.accept = accept
+        self.settle = settle
+        self.seen = {}        # path -> (size, mtime, first time seen with that size and mtime)
+        self.emitted = set()
+
+    @property
+    def pending(self):
+        return [path for path in self.seen if path not in self.emitted]
+
+    def scan(self, final=False):
+        """Newly completed files, oldest first; with final=True (the transfer has finished) everything left counts as complete."""
+        now = time.monotonic()
+        ready = []
+        if not os.path.isdir(self.folder):
+            return ready
+        for entry in os.scandir(self.folder):
+            if entry.name.startswith('.') or not entry.is_file() or not self.accept(entry.name):
+                continue
+            path = entry.path
+            if path in self.emitted:
+                continue
+            stat = entry.stat()
+            previous = self.seen.get(path)
+            if previous is None or previous[:2] != (stat.st_size, stat.st_mtime):
+                self.seen[path] = (stat.st_size, stat.st_mtime, now)
+                previous = self.seen[path]
+            if final or now - previous[2] >= self.settle:
+                ready.append((stat.st_mtime, path))
+        ready = [path for _, path in sorted(ready)]
+        self.emitted.update(ready)
+        return ready
+
+class StreamPipeline:
+    """
+    Threads connected by bounded queues: a source that puts items, then stages that each take one item (or a batch)
+    and pass on what they return. The first exception in any thread stops them all and is re-raised by run().
+    """
+    def __init__(self):
+        self.stop = threading.Event()
+        self.errors = []
+        self.threads = []
+
+    def put(self, q, item):
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, q, timeout=None):
+        """Next item, DONE at the end of the stream, or None if nothing arrived within timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.stop.is_set():
+            wait = 1 if deadline is None else min(1, deadline - time.monotonic())
+            if wait <= 0:
+                return None
+            try:
+                return q.get(timeout=wait)
+            except queue.Empty:
+                continue
+        return DONE
+
+    def thread(self, name, target, *args):
+        def guarded():
+            try:
+                target(*args)
+            except BaseException as e:  # includes the SystemExit of a failed sbatch submission
+                self.errors.append((name, e))
+                self.stop.set()
+        t = threading.Thread(target=guarded, name=name, daemon=True)
+        self.threads.append(t)
+        return t
+
+    def watch(self, watcher, outbox, finished, poll=10):
+        """Source: put each file the watcher completes until finished() is true and nothing is left pending."""
+        def loop():
+            while not self.stop.is_set():
+                final = finished()  # checked before scanning, so files landing just before the end are still picked up
+                for path in watcher.scan(final=final):
+                    self.put(outbox, path)
+                if final:
+                    break
+                self.stop.wait(poll)
+            self.put(outbox, DONE)
+        return self.thread('watch', loop)
+
+    def stage(self, name, inbox, work, outbox=None):
+        """One item at a time; results that aren't None go to outbox."""
+        def loop():
+            while True:
+                item = self.get(inbox)
+                if item is DONE:
+                    break
+                result = work(item)
+                if outbox is not None and result is not None:
+                    self.put(outbox, result)
+            if outbox is not None:
+                self.put(outbox, DONE)
+        return self.thread(name, loop)
+
+    def batch_stage(self, name, inbox, work, batch_size=8, wait=120):
+        """Collects up to batch_size items, waiting at most `wait` seconds after the first, then runs work(batch)."""
+        def loop():
+            finished = False
+            while not finished:
+                item = self.get(inbox)
+                if item is DONE:
+                    break
+                batch, deadline = [item], time.monotonic() + wait
+                while len(batch) < batch_size:
+                    item = self.get(inbox, timeout=deadline - time.monotonic())
+                    if item is None:
+                        break
+                    if item is DONE:
+                        finished = True
+                        break
+                    batch.append(item)
+                work(batch)
+        return self.thread(name, loop)
+
+    def run(self):
+        for t in self.threads:
+            t.start()
+        for t in self.threads:
+            t.join()
+        if self.errors:
+            name, error = self.errors[0]
+            raise RuntimeError(f'{name} failed: {type(error).__name__}: {error}') from error
@@ -0,0 +1,137 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+# A track store is a folder {name}.tracks.store/ holding .npy files that can be memory mapped:
+#   records.npy        fixed-width records (label_id, frame, track, x/y/score per skeleton part), sorted by frame
+#   frame_offsets.npy  records of frame f are records[frame_offsets[f]:frame_offsets[f+1]]
+#   track_ids.npy      sorted unique track ids
+#   track_offsets.npy  records of track_ids[i] are records[track_order[track_offsets[i]:track_offsets[i+1]]]
+#   track_order.npy    record indices grouped by track (frame order within a track)
+#   meta.json          skeleton parts and record count
+# TrackStoreWriter fills it while {name}.tracks.csv is written, so the export never holds the rows as Python objects.
+
+def record_dtype(skel_parts):
+    fields = [('label_id', '<i4'), ('frame', '<i8'), ('track', '<i4')]
+    fields += [(f'{coord}_{part}', '<f4') for part in skel_parts for coord in ['x', 'y', 'score']]
+    return np.dtype(fields)
+
+# builds a track store from rows (same layout as the columns of {name}.tracks.csv) as they are exported, in bounded
+# memory: rows are packed into fixed-width records chunk_size at a time and spilled to a file, which close() sorts by
+# frame into records.npy through memory maps. Only the sort orders are held in memory in full (8 bytes per record).
+# The store is built next to store_path and moved into place by close(), so a failed export leaves no half store
+class TrackStoreWriter:
+    def __init__(self, skel_parts, store_path, chunk_size=100000):
+        self.skel_parts = list(skel_parts)
+        self.store_path = store_path
+        self.dtype = record_dtype(skel_parts)
+        self.build_path = f'{store_path}.tmp'
+        if os.path.isdir(self.build_path):
+            shutil.rmtree(self.build_path)
+        os.makedirs(self.build_path)
+        self.spill_path = os.path.join(self.build_path, 'records.unsorted')
+        self.spill = open(self.spill_path, 'wb')
+        self.chunk = np.empty(chunk_size, dtype=self.dtype)
+        self.n_chunk = 0
+        self.n_records = 0
+
+    def append(self, row):
+        self.chunk[self.n_chunk] = tuple(np.nan if value is None else value for value in row)  # None: missing point
+        self.n_chunk += 1
+        if self.n_chunk == len(self.chunk):
+            self.flush()
+
+    def flush(self):
+        self.chunk[:self.n_chunk].tofile(self.spill)
+        self.n_records += self.n_chunk
+        self.n_chunk = 0
+
+    # sort the spilled records, write the indexes and move the store into place; returns store_path
+    def close(self):
+        self.flush()
+        self.spill.close()
+        n, step = self.n_records, len(self.chunk)
+        path = lambda file: os.path.join(self.build_path, file)
+
+        unsorted = np.memmap(self.spill_path, dtype=self.dtype, mode='r', shape=(n,)) if n else np.empty(0, dtype=self.dtype)
+        frame_order = np.argsort(unsorted['frame'], kind='stable')
+        records = np.lib.format.open_memmap(path('records.npy'), mode='w+', dtype=self.dtype, shape=(n,))
+        for start in range(0, n, step):
+            records[start:start + step] = unsorted[frame_order[start:start + step]]
+        del frame_order, unsorted
+        os.remove(self.spill_path)
+
+        frames = np.asarray(records['frame'])
+        n_frames = int(frames[-1]) + 1 if n else 0
+        frame_offsets = np.searchsorted(frames, np.arange(n_frames + 1), side='left').astype(np.int64)
+        del frames
+
+        tracks = np.asarray(records['track'])
+        track_order = np.argsort(tracks, kind='stable').astype(np.int64)
+        track_ids, track_starts = np.unique(tracks[track_order], return_index=True)
+        track_offsets = np.append(track_starts, n).astype(np.int64)
+        del tracks
+        records.flush()
+        del records
+
+        np.save(path('frame_offsets.npy'), frame_offsets)
+        np.save(path('track_ids.npy'), track_ids)
+        np.save(path('track_offsets.npy'), track_offsets)
+        np.save(path('track_order.npy'), track_order)
+        with open(path('meta.json'), 'w') as f:
+            json.dump({'skel_parts': self.skel_parts, 'n_records': int(n)}, f, indent=4)
+
+        if os.path.isdir(self.store_path):
+            shutil.rmtree(self.store_path)
+        os.replace(self.build_path, self.store_path)
+        return self.store_path
+
+# write tracks rows (same layout as the columns of {name}.tracks.csv) to a track store folder
+def write_track_store(rows, skel_parts, store_path):
+    writer = TrackStoreWriter(skel_parts, store_path)
+    for row in rows:
+        writer.append(row)
+    return writer.close()
+
+class TrackStore:
+    def __init__(self, store_path):
+        self.path = store_path
+        with open(os.path.join(store_path, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+        self.skel_parts = self.meta['skel_parts']
+
+        # memory map records and indexes; track_ids is small and read eagerly for searchsorted
+        self.records = np.load(os.path.join(store_path, 'records.npy'), mmap_mode='r')
+        self.frame_offsets = np.load(os.path.join(store_path, 'frame_offsets.npy'), mmap_mode='r')
+        self.track_ids = np.load(os.path.join(store_path, 'track_ids.npy'))
+        self.track_offsets = np.load(os.path.join(store_path, 'track_offsets.npy'), mmap_mode='r')
+        self.track_order = np.load(os.path.join(store_path, 'track_order.npy'), mmap_mode='r')
+
+    @property
+    def n_frames(self):
+        return len(self.frame_offsets) - 1
+
+    # records of all instances with start <= frame < stop (a view into the memory map)
+    def frames(self, start, stop):
+        start = min(max(int(start), 0), self.n_frames)
+        stop = min(max(int(stop), start), self.n_frames)
+        return self.records[self.frame_offsets[start]:self.frame_offsets[stop]]
+
+    # records of one track in frame order, optionally restricted to start <= frame < stop
+    def track(self, track_id, start=None, stop=None):
+        i = np.searchsorted(self.track_ids, track_id)
+        if i == len(self.track_ids) or self.track_ids[i] != track_id:
+            return self.records[:0]
+        records = self.records[self.track_order[self.track_offsets[i]:self.track_offsets[i + 1]]]
+        if start is not None or stop is not None:
+            frames = records['frame']
+            lo = np.searchsorted(frames, start, side='left') if start is not None else 0
+            hi = np.searchsorted(frames, stop, side='left') if stop is not None else len(records)
+            records = records[lo:hi]
+        return records
+
+    # convert records to a DataFrame with the same columns as {name}.tracks.csv
+    def to_frame(self, records):
+        return pd.DataFrame(np.asarray(records))
@@ -2,6 +2,11 @@
 
 # usage: when transferring from plugcameras 50, 51, and 52 for example, use the following:
 # sbatch --export=EXP_NAME=test_exp,RIG_NUMBERS="50 51 52",IP_FILE=ip_addresses.csv,PIPELINE=2 pipeline.sh
+#
+# the requests below are upper bounds; to size them from earlier runs instead, pass the recommendation to sbatch
+# (command-line options override #SBATCH lines) and record each finished run into the history:
+# sbatch $(digflow resources -t plugcamera -s pipeline) --export=... pipeline.sh
+# digflow resources -t plugcamera -s pipeline --record <job id>
 
 #SBATCH --ntasks=1
 #SBATCH --time=24:00:00
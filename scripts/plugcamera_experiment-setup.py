@@ -13,6 +13,8 @@ parser.add_argument('-n', '--sample-size', dest='sample_size', action='store', t
 parser.add_argument('-c', '--conditions', dest='conditions', action='store', type=str, default=None, help='conditions to be tested, recommend to be in the tray-position format from the fly stock database')
 parser.add_argument('-e', '--experimenters', dest='experimenters', action='store', type=str, nargs='+', default=['Lucy', 'Lena', 'Alice', 'Anna', 'Michael'], help='names of experimenters')
 parser.add_argument('-cn', '--control_sample_size', dest='control_sample_size', action='store', type=int, help='number of controls per collection')
+parser.add_argument('-v', '--vials', dest='vials', action='store', type=str, default=None, help='CSV (person,day,vials) or JSON file of vial counts; skips the vials GUI so the script runs without a display')
+parser.add_argument('--facility', dest='facility', action='store', type=str, default=None, help='path to a facility JSON describing the plugcamera shelf (default: 12 x 6, racks of 2 columns)')
 
 # ingesting user-input arguments
 args = parser.parse_args()
@@ -24,13 +26,21 @@ sample_size = args.sample_size
 conditions = args.conditions
 experimenters = args.experimenters
 control_sample_size = args.control_sample_size
+facility = args.facility
+vials = args.vials
 
 if first_run=='True':
-    design = dig.Design(wc_date=wc_date, save_path=save_path,sample_size=sample_size, conditions=conditions, experimenters=experimenters, controls_per_collection=control_sample_size)
-    design.vials_gui()
-    design.output()
+    design = dig.Design(wc_date=wc_date, save_path=save_path,sample_size=sample_size, conditions=conditions, experimenters=experimenters, controls_per_collection=control_sample_size, facility=facility)
+    if vials is not None:
+        design.plan_from_vials(vials)
+    else:
+        design.vials_gui()
+        design.output()
 
 if first_run=='False':
-    design = dig.Design(wc_date=wc_date, save_path=save_path, file=file_path)
-    design.vials_gui()
-    design.output()
\ No newline at end of file
+    design = dig.Design(wc_date=wc_date, save_path=save_path, file=file_path, facility=facility)
+    if vials is not None:
+        design.plan_from_vials(vials)
+    else:
+        design.vials_gui()
+        design.output()
\ No newline at end of file
@@ -1,6 +1,5 @@
 import digflow as dig
 import argparse
-import scyjava
 
 # pulling user-input variables from command line
 parser = argparse.ArgumentParser(description='plugcamera pipeline: transferring data from RPis to NEMO, initial processing')
@@ -8,6 +7,10 @@ parser.add_argument('-e', '--experiment-name', dest='experiment_name', action='s
 parser.add_argument('-l', '--rig-list', nargs='+', type=int, default=None, help='list of rig names if only a specific subset will be used')
 parser.add_argument('-ip', '--ip-path', dest='ip_path', action='store', type=str, default=None, help='path to ip_address list')
 parser.add_argument('-p', '--pipeline', dest='pipeline', action='store', type=int, required=True)
+parser.add_argument('--restart', dest='restart', action='store_true', help='ignore the pipeline journal and redo every stage (pipelines 2, 3 and 5)')
+parser.add_argument('--triage', dest='triage', nargs='?', type=float, const=0.9, default=None, metavar='MIN_CONFIDENCE',
+                    help='send only vials whose blob precount is less confident than this (default 0.9) to SLEAP; the rest keep the precount (pipelines 2, 3 and 5)')
+parser.add_argument('--triage-sample', dest='triage_sample', type=float, default=0.1, help='fraction of confident vials still sent to SLEAP as a check (with --triage)')
 
 # ingesting user-input arguments
 args = parser.parse_args()
@@ -17,8 +20,12 @@ ip_path = args.ip_path
 pipeline = args.pipeline
 
 exp = dig.Experiment(experiment_name=experiment_name, exp_type='plugcamera', rig_list=rig_list, ip_path=ip_path, remove_files=False)
+exp.set_resume(not args.restart)
+if args.triage is not None:
+    exp.set_triage(args.triage, args.triage_sample)
 
 if(pipeline==1): exp.pc_pipeline1()
 if(pipeline==2): exp.pc_pipeline2()
 if(pipeline==3): exp.pc_pipeline2_no_transfer()
-if(pipeline==4): exp.pc_pipeline_test()
\ No newline at end of file
+if(pipeline==4): exp.pc_pipeline_test()
+if(pipeline==5): exp.pc_pipeline2_streaming()
\ No newline at end of file
@@ -2,6 +2,9 @@
 
 # usage: when transferring from plugcameras 50, 51, and 52 for example, use the following:
 # sbatch --export=EXP_NAME=test_exp,RIG_NUMBERS="50 51 52",IP_FILE=ip_addresses.csv,PIPELINE=2 pipeline.sh
+#
+# to size the requests below from earlier runs: sbatch $(digflow resources -t sleap -s sleap_pipeline) --export=... sleap_pipeline.sh
+# and afterwards: digflow resources -t sleap -s sleap_pipeline --record <job id>
 
 #SBATCH --job-name=slp-pipe
 #SBATCH --ntasks=1
@@ -8,6 +8,7 @@ setup(name='digflow',
       author_email='m.j.winding@gmail.com',
       license='MIT',
       packages=find_packages(include=['digflow', 'digflow.*']),
-      install_requires=[]
+      install_requires=['pyarrow'],  # parquet: kinematics feature store, screen master cache
+      entry_points={'console_scripts': ['digflow=digflow.cli:main']}
       )
 